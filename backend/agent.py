@@ -1,41 +1,109 @@
-import httpx
 import asyncio
+import hashlib
 import json
-from backend.session_manager import session_manager
+import os
+import httpx
+from backend.event_bus import event_bus
+from backend.file_cache import DELTA_MIN_BYTES, FileCache, line_edits
+from backend.http_client import sandbox_http
+from backend.plan_executor import PlanExecutor
+from backend.sandbox_api.blobs import BlobStore, OutputPolicy
+from backend.sandbox_manager import sandbox_manager
+
+# Tool results over TOOL_OUTPUT_LIMIT are logged and streamed as head and tail; the full text is kept here
+output_store = BlobStore(os.getenv("BLOB_DIR", "blobs"))
+output_policy = OutputPolicy(output_store)
+
+async def compact(result, size):
+    # Only results that can be over the limit pay for the walk and the thread hop
+    if size <= output_policy.limit:
+        return result
+    return await asyncio.to_thread(output_policy.apply, result)
 
 class PlanActAgent:
-    def __init__(self, session_id, sandbox_url="http://localhost:8080"):
+    def __init__(self, session_id, sandbox_url="http://localhost:8080", connect=None):
         self.session_id = session_id
         self.sandbox_url = sandbox_url
-        self.queue = asyncio.Queue()
+        # Awaited by the worker to resolve sandbox_url when the agent is created before its sandbox is ready
+        self.connect = connect
+        self.executor = PlanExecutor(self.call_tool, self.emit)
+        self.inbox = asyncio.Queue()
+        self.worker = None
+        self.files = FileCache()
+        # Persistent sandbox shell for session_exec, opened on first use
+        self.shell_session = None
+        self.shell_lock = asyncio.Lock()
+
+    def emit(self, event):
+        return event_bus.emit(self.session_id, event)
+
+    def enqueue(self, message):
+        """Queue a message; messages of one session are processed one at a time, in order."""
+        self.inbox.put_nowait(message)
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._work())
+
+    async def _work(self):
+        # Looked up off the event loop, so emitting never blocks on the session store
+        await event_bus.prepare(self.session_id)
+        while not self.inbox.empty():
+            message = self.inbox.get_nowait()
+            if self.sandbox_url is None:
+                try:
+                    self.sandbox_url = await self.connect()
+                except Exception as e:
+                    await self.log_agent_event(f"Sandbox unavailable: {e}")
+                    continue
+            try:
+                await self.process_message(message)
+            except Exception as e:
+                await self.log_agent_event(f"Failed to process message: {e}")
+
+    async def cancel(self):
+        """Drop queued messages and cancel the plan in flight, if any."""
+        while not self.inbox.empty():
+            self.inbox.get_nowait()
+        if self.worker is not None and not self.worker.done():
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+
+    def plan(self, message):
+        # In a real system an LLM would produce the plan.
+        # Here the steps are picked from the message; independent steps run in parallel.
+        text = message.lower()
+        steps = []
+        if "search" in text:
+            steps.append({"id": "search", "tool": "search", "params": {"query": message}})
+        if "list files" in text:
+            steps.append({"id": "list_files", "tool": "list_files", "params": {"path": "."}})
+        if "browser" in text:
+            steps.append({"id": "browser", "tool": "browser_goto", "params": {"url": "https://www.google.com"}})
+        return steps
 
     async def process_message(self, message):
         # 1. Record user message event
         event = {"type": "user_message", "content": message}
-        session_manager.save_event(self.session_id, event)
-        await self.queue.put(event)
-
-        # 2. Planning and Acting (Simplified for this task)
-        # In a real system, this would call an LLM to decide which tools to use.
-        # Here we will simulate tool calling based on the message.
+        self.emit(event)
 
+        # 2. Plan, then act
         await self.log_agent_event("Thinking about the task...")
 
-        if "search" in message.lower():
-            await self.call_tool("search", {"query": message})
-        elif "list files" in message.lower():
-            await self.call_tool("list_files", {"path": "."})
-        elif "browser" in message.lower():
-            await self.call_tool("browser_goto", {"url": "https://www.google.com"})
-        else:
-            await self.log_agent_event(f"Received: {message}. I am a PlanAct Agent.")
+        steps = self.plan(message)
+        if steps:
+            return await self.executor.run(steps)
+        await self.log_agent_event(f"Received: {message}. I am a PlanAct Agent.")
 
     async def log_agent_event(self, content):
+        # Each step logs first, so a backed-up session store slows the agent instead of growing the buffer
+        await event_bus.drain()
         event = {"type": "agent_log", "content": content}
-        session_manager.save_event(self.session_id, event)
-        await self.queue.put(event)
+        self.emit(event)
 
     async def call_tool(self, tool_name, params):
+        sandbox_manager.touch(self.session_id)
         await self.log_agent_event(f"Calling tool: {tool_name} with {params}")
 
         endpoint_map = {
@@ -48,32 +116,121 @@ class PlanActAgent:
             "browser_screenshot": "browser/screenshot"
         }
 
-        endpoint = f"{self.sandbox_url}/{endpoint_map.get(tool_name, tool_name)}"
+        endpoint = f"/{endpoint_map.get(tool_name, tool_name)}"
 
         try:
-            async with httpx.AsyncClient() as client:
-                if tool_name in ["list_files", "read_file", "browser_screenshot"]:
-                    response = await client.get(endpoint, params=params)
-                else:
-                    response = await client.post(endpoint, json=params)
-                result = response.json()
+            if tool_name == "read_file":
+                response = await self.read_file(params)
+            elif tool_name == "write_file":
+                response = await self.write_file(params)
+            elif tool_name == "session_exec":
+                response = await self.session_exec(params)
+            elif tool_name in ["list_files", "browser_screenshot"]:
+                response = await sandbox_http.request(self.sandbox_url, "GET", endpoint, tool_name, params=params)
+            else:
+                response = await sandbox_http.request(self.sandbox_url, "POST", endpoint, tool_name, json=params)
+            result = response.json()
+            if response.status_code >= 400:
+                result = {"status": "error", "status_code": response.status_code,
+                          "detail": result.get("detail") if isinstance(result, dict) else result}
+            result = await compact(result, len(response.content))
         except Exception as e:
             result = {"status": "error", "message": str(e)}
 
         event = {"type": "tool_result", "tool": tool_name, "result": result}
-        session_manager.save_event(self.session_id, event)
-        await self.queue.put(event)
+        self.emit(event)
         return result
 
-    async def event_generator(self):
-        while True:
-            event = await self.queue.get()
-            yield f"data: {json.dumps(event)}\n\n"
+    async def read_file(self, params):
+        # Only whole-file text reads are cached; the sandbox answers 304 while the hash still matches
+        whole = set(params) == {"path"} or (set(params) == {"path", "encoding"} and params["encoding"] == "text")
+        cached = self.files.get(params["path"]) if whole else None
+        headers = {"If-None-Match": f'"{cached[0]}"'} if cached else None
+        response = await sandbox_http.request(self.sandbox_url, "GET", "/files/read", "read_file",
+                                              params=params, headers=headers)
+        if response.status_code == 304:
+            sha256, content = cached
+            return httpx.Response(200, json={"content": content, "encoding": "text", "offset": 0,
+                                             "size": len(content.encode()), "truncated": False,
+                                             "sha256": sha256, "cached": True})
+        if whole and response.status_code == 200:
+            result = response.json()
+            sha256 = result.get("sha256")
+            # Text that does not round-trip (invalid UTF-8) cannot be a base for deltas
+            if sha256 and not result.get("truncated") and hashlib.sha256(result["content"].encode()).hexdigest() == sha256:
+                self.files.put(params["path"], sha256, result["content"])
+        return response
+
+    async def write_file(self, params):
+        path, content = params.get("path"), params.get("content")
+        plain = isinstance(content, str) and not params.get("append") and params.get("encoding", "text") == "text"
+        cached = self.files.get(path) if plain else None
+        if cached is not None and len(content) >= DELTA_MIN_BYTES:
+            edits = await asyncio.to_thread(line_edits, cached[1], content)
+            sha256 = hashlib.sha256(content.encode()).hexdigest()
+            if len(json.dumps(edits)) < len(content) // 2:
+                response = await sandbox_http.request(self.sandbox_url, "POST", "/files/patch", "patch_file", json={
+                    "path": path, "base_sha256": cached[0], "edits": edits, "sha256": sha256})
+                if response.status_code == 200:
+                    self.files.put(path, sha256, content)
+                    return response
+                # 412: the file changed in the sandbox since it was cached; fall back to a full write
+        self.files.discard(path)
+        response = await sandbox_http.request(self.sandbox_url, "POST", "/files/write", "write_file", json=params)
+        if plain and response.status_code == 200 and "sha256" in response.json():
+            self.files.put(path, response.json()["sha256"], content)
+        return response
+
+    async def session_exec(self, params):
+        # Commands share one shell, so cd, exports and activated virtualenvs carry over between steps
+        for attempt in range(2):
+            # Parallel steps must not each open a session
+            async with self.shell_lock:
+                if self.shell_session is None:
+                    response = await sandbox_http.request(self.sandbox_url, "POST", "/shell/sessions",
+                                                          "session_exec", json={})
+                    if response.status_code != 200:
+                        return response
+                    self.shell_session = response.json()["session_id"]
+                session_id = self.shell_session
+            response = await sandbox_http.request(self.sandbox_url, "POST", f"/shell/sessions/{session_id}/exec",
+                                                  "session_exec", json=params)
+            if response.status_code not in (404, 409):
+                return response
+            # Closed after idling, or the shell exited: start a fresh one once
+            if self.shell_session == session_id:
+                self.shell_session = None
+        return response
+
+    async def submit_plan(self, steps, sequential=False, stop_on_error=False):
+        """Run a list of tool steps in one round trip through the sandbox /batch endpoint.
+
+        Each step is {"id", "tool", "params", "depends_on"}; independent
+        steps run concurrently in the sandbox.
+        """
+        sandbox_manager.touch(self.session_id)
+        await self.log_agent_event(f"Submitting plan with {len(steps)} steps")
+
+        payload = {"steps": steps, "sequential": sequential, "stop_on_error": stop_on_error}
+        try:
+            response = await sandbox_http.request(self.sandbox_url, "POST", "/batch", "batch", json=payload)
+            response.raise_for_status()
+            results = (await compact(response.json(), len(response.content)))["results"]
+        except Exception as e:
+            results = [{"id": step["id"], "tool": step["tool"], "status": "error", "detail": str(e)} for step in steps]
+
+        for step_result in results:
+            result = step_result.get("result", step_result)
+            event = {"type": "tool_result", "tool": step_result["tool"], "step": step_result["id"], "result": result}
+            self.emit(event)
+        return results
+
+    def event_generator(self, last_event_id=None):
+        return event_bus.sse(self.session_id, last_event_id)
 
 agents = {}
 
-def get_or_create_agent(session_id, sandbox_port=8080):
+def get_or_create_agent(session_id, sandbox_url="http://localhost:8080", connect=None):
     if session_id not in agents:
-        sandbox_url = f"http://localhost:{sandbox_port}"
-        agents[session_id] = PlanActAgent(session_id, sandbox_url=sandbox_url)
+        agents[session_id] = PlanActAgent(session_id, sandbox_url=sandbox_url, connect=connect)
     return agents[session_id]
@@ -0,0 +1,175 @@
+"""Load test for the agent -> sandbox path.
+
+Hundreds of concurrent sessions drive PlanActAgent and direct tool calls
+against the real sandbox API, served in-process with a fake browser and a
+fake search provider (Docker and the sandbox manager are mocked). Latency
+percentiles and throughput are reported per endpoint, written to
+`results/` (or `--results-dir`), and compared with `results/baseline.json`
+so hot-path regressions show up between releases.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.bench_load --sessions 200 --rounds 3
+    python -m backend.benchmarks.bench_load --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from unittest.mock import MagicMock, patch
+from backend.benchmarks.standin import BackgroundServer, load_sandbox_api
+from backend.event_bus import EventBus
+from backend.http_client import SandboxHTTPClient
+from backend.session_manager import SessionManager
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BASELINE = os.path.join(RESULTS_DIR, "baseline.json")
+
+
+class TimedClient(SandboxHTTPClient):
+    """Records the latency of every call, keyed by "METHOD /path"."""
+
+    def __init__(self):
+        super().__init__()
+        self.latencies = {}
+
+    async def request(self, base_url, method, path, tool_name=None, **kwargs):
+        start = time.perf_counter()
+        response = await super().request(base_url, method, path, tool_name, **kwargs)
+        self.latencies.setdefault(f"{method} {path}", []).append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}: {response.text}")
+        return response
+
+
+def percentile(ordered, q):
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+def summarize(latencies, elapsed):
+    ordered = sorted(latencies)
+    return {
+        "count": len(ordered),
+        "p50_ms": percentile(ordered, 0.50) * 1000,
+        "p95_ms": percentile(ordered, 0.95) * 1000,
+        "p99_ms": percentile(ordered, 0.99) * 1000,
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "per_s": len(ordered) / elapsed,
+    }
+
+
+async def session(agent_cls, client, url, workdir, index, rounds, agent_latencies):
+    agent = agent_cls(f"bench-{index}", sandbox_url=url)
+    path = os.path.join(workdir, f"session-{index}.txt")
+    for round_ in range(rounds):
+        # Agent turns exercise event logging plus one tool call each
+        for message in (f"search benchmark topic {index % 20}", "list files", "open the browser"):
+            start = time.perf_counter()
+            await agent.process_message(message)
+            agent_latencies.append(time.perf_counter() - start)
+        await client.request(url, "POST", "/files/write", "write_file",
+                             json={"path": path, "content": f"round {round_}\n" * 64, "append": True})
+        await client.request(url, "GET", "/files/read", "read_file", params={"path": path, "tail": 10})
+        await client.request(url, "POST", "/shell/execute", "execute_command", json={"command": "echo ok"})
+        await client.request(url, "GET", "/browser/screenshot", "browser_screenshot", params={"page_id": f"p{index}"})
+        await client.request(url, "POST", "/batch", "batch", json={"steps": [
+            {"id": "read", "tool": "read_file", "params": {"path": path, "length": 256}},
+            {"id": "goto", "tool": "browser_goto", "params": {"url": "https://example.com", "page_id": f"p{index}"}},
+            {"id": "echo", "tool": "execute_command", "params": {"command": "echo batch"}, "depends_on": ["read"]},
+        ]})
+
+
+async def run(sessions, rounds):
+    sandbox = load_sandbox_api()
+    with tempfile.TemporaryDirectory() as tmp, BackgroundServer(sandbox.app) as server, \
+            patch("docker.from_env", return_value=MagicMock()):
+        import backend.agent as agent_module
+        client = TimedClient()
+        bus = EventBus(log=SessionManager(storage_dir=os.path.join(tmp, "sessions")))
+        agent_latencies = []
+        # The real manager would write its port leases and registry to the working directory
+        with patch.object(agent_module, "sandbox_http", client), patch.object(agent_module, "event_bus", bus), \
+                patch.object(agent_module, "sandbox_manager"):
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                session(agent_module.PlanActAgent, client, server.url, tmp, i, rounds, agent_latencies)
+                for i in range(sessions)
+            ))
+            elapsed = time.perf_counter() - start
+        await client.aclose()
+        bus.log.close()
+    endpoints = {name: summarize(values, elapsed) for name, values in sorted(client.latencies.items())}
+    endpoints["agent.process_message"] = summarize(agent_latencies, elapsed)
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "sessions": sessions,
+        "rounds": rounds,
+        "elapsed_s": elapsed,
+        "endpoints": endpoints,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(result, baseline=None, threshold=0.2):
+    """Print the results table; returns the endpoints whose p95 regressed past `threshold`."""
+    regressions = []
+    print(f"{result['sessions']} sessions x {result['rounds']} rounds in {result['elapsed_s']:.2f}s")
+    print(f"{'endpoint':<26} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8}  vs baseline p95")
+    for name, stats in result["endpoints"].items():
+        line = (f"{name:<26} {stats['count']:>6} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} "
+                f"{stats['p99_ms']:>8.2f} {stats['per_s']:>8.0f}")
+        before = (baseline or {}).get("endpoints", {}).get(name)
+        if before:
+            change = stats["p95_ms"] / before["p95_ms"] - 1
+            line += f"  {change:+.0%}"
+            if change > threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE, help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p95 slowdown that counts as a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="also store this run as the new baseline")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--results-dir", default=RESULTS_DIR, help="where to write this run's results")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args.sessions, args.rounds))
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = report(result, baseline, args.threshold)
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    path = os.path.join(args.results_dir, f"load-{result['timestamp'].replace(':', '')}.json")
+    for target in [path] + ([BASELINE] if args.save_baseline else []):
+        with open(target, "w") as f:
+            json.dump(result, f, indent=2)
+    print(f"results written to {os.path.relpath(path)}")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Create and stop hundreds of mock sandboxes to time host port allocation.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.bench_port_allocation
+"""
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+
+def main(count=500, workers=16):
+    client = MagicMock()
+    client.containers.run.side_effect = lambda image, name, **kwargs: MagicMock(id=f"id-{name}")
+    with tempfile.TemporaryDirectory() as tmp, patch("docker.from_env", return_value=client):
+        from backend.sandbox_manager import SandboxManager
+        from backend.port_allocator import PortAllocator
+        manager = SandboxManager(state_dir=tmp)
+        manager.ports.close()
+        manager.ports = PortAllocator(max_blocks=count, state_path=f"{tmp}/ports.json")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(workers) as executor:
+            created = list(executor.map(lambda i: manager.create_sandbox(f"bench-{i}"), range(count)))
+        create_elapsed = time.perf_counter() - start
+
+        api_ports = [info["ports"]["api"] for _, info in created]
+        assert len(set(api_ports)) == count, "duplicate port handed out"
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(manager.stop_sandbox, [session_id for session_id, _ in created]))
+        stop_elapsed = time.perf_counter() - start
+        assert not manager.ports.leases
+        manager.close()
+
+        print(f"created {count} mock sandboxes with {workers} threads in {create_elapsed * 1000:.1f}ms "
+              f"({create_elapsed / count * 1e6:.0f}us each, no duplicate ports)")
+        print(f"stopped {count} mock sandboxes in {stop_elapsed * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,117 @@
+"""Cold start of the sandbox API: import time and time until /health answers.
+
+Each run starts a fresh interpreter. `python -X importtime` gives the time to
+import `main` and the heaviest modules it pulls in; a uvicorn process gives
+the time from launch to the first successful health check. The median
+import time is checked against an import-time budget.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.bench_startup --runs 5
+    python -m backend.benchmarks.bench_startup --budget-ms 400 --fail-over-budget
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+from backend.benchmarks.bench_load import RESULTS_DIR, git_commit
+from backend.benchmarks.standin import SANDBOX_API_DIR, free_port
+
+IMPORT_BUDGET_MS = 600
+HEALTH_TIMEOUT = 30
+
+
+def import_times():
+    """Cumulative import times in ms for `main` and each module it imports directly."""
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=SANDBOX_API_DIR,
+                            capture_output=True, text=True, check=True).stderr
+    times, children = {}, {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Children are listed before their parent, indented two more spaces
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children[name.strip()] = int(cumulative) / 1000
+        elif depth == 0:
+            if name.strip() == "main":
+                times = dict(children, main=int(cumulative) / 1000)
+            children = {}
+    return times
+
+
+def time_to_healthy():
+    port = free_port()
+    launched_at = time.time()
+    env = dict(os.environ, SANDBOX_LAUNCH_TIME=str(launched_at))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=SANDBOX_API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.time() - launched_at < HEALTH_TIMEOUT:
+            try:
+                response = httpx.get(f"http://127.0.0.1:{port}/health", timeout=1)
+                if response.status_code == 200:
+                    return (time.time() - launched_at) * 1000, response.json().get("startup_seconds")
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError("sandbox API did not become healthy")
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def run(runs):
+    imports, healthy = [], []
+    for _ in range(runs):
+        imports.append(import_times())
+        healthy.append(time_to_healthy())
+    heaviest = sorted((item for item in imports[-1].items() if item[0] != "main"), key=lambda item: -item[1])
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "runs": runs,
+        "import_main_ms": statistics.median(times["main"] for times in imports),
+        "time_to_healthy_ms": statistics.median(ms for ms, _ in healthy),
+        "reported_startup_ms": statistics.median(seconds * 1000 for _, seconds in healthy),
+        "heaviest_imports_ms": dict(heaviest[:10]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS, help="import time budget for main")
+    parser.add_argument("--fail-over-budget", action="store_true")
+    args = parser.parse_args(argv)
+
+    result = run(args.runs)
+    result["budget_ms"] = args.budget_ms
+    print(f"import main         {result['import_main_ms']:8.1f} ms  (budget {args.budget_ms:.0f} ms)")
+    print(f"time to /health     {result['time_to_healthy_ms']:8.1f} ms")
+    print(f"reported startup    {result['reported_startup_ms']:8.1f} ms")
+    print("heaviest imports:")
+    for name, ms in result["heaviest_imports_ms"].items():
+        print(f"  {name:<30} {ms:8.1f} ms")
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"startup-{result['timestamp'].replace(':', '')}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"results written to {os.path.relpath(path)}")
+    if result["import_main_ms"] > args.budget_ms:
+        print("OVER BUDGET")
+        if args.fail_over_budget:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Tool-call round-trip latency: a fresh httpx client per call vs the shared pool.
+
+Run from the repository root:
+
+    python -m backend.benchmarks.bench_tool_calls
+"""
+import asyncio
+import statistics
+import sys
+import time
+import httpx
+from backend.benchmarks.standin import BackgroundServer, create_sandbox_standin
+from backend.http_client import SandboxHTTPClient
+
+
+async def fresh_client_call(url):
+    async with httpx.AsyncClient() as client:
+        return await client.get(f"{url}/files/list", params={"path": "."})
+
+
+async def measure(call, calls, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await call()
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95)] * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "calls_per_s": calls / elapsed,
+    }
+
+
+async def main(calls=500):
+    with BackgroundServer(create_sandbox_standin()) as server:
+        pooled = SandboxHTTPClient()
+        for concurrency in (1, 16):
+            before = await measure(lambda: fresh_client_call(server.url), calls, concurrency)
+            after = await measure(lambda: pooled.request(server.url, "GET", "/files/list", "list_files", params={"path": "."}), calls, concurrency)
+            for label, result in (("fresh client", before), ("shared pool", after)):
+                print(f"concurrency={concurrency:<3} {label:<13} "
+                      f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms "
+                      f"mean={result['mean_ms']:.2f}ms {result['calls_per_s']:.0f} calls/s")
+        await pooled.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
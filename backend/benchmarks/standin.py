@@ -0,0 +1,123 @@
+import asyncio
+import contextlib
+import os
+import socket
+import sys
+import threading
+import time
+import uvicorn
+from fastapi import FastAPI
+
+SANDBOX_API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sandbox_api")
+
+
+def create_sandbox_standin():
+    """A minimal stand-in for the sandbox API that answers instantly."""
+    app = FastAPI(title="Sandbox API stand-in")
+
+    @app.get("/health")
+    async def health_check():
+        return {"status": "ok"}
+
+    @app.get("/files/list")
+    async def list_files(path: str = "."):
+        return [{"name": "README.md", "is_dir": False, "size": 1024}]
+
+    @app.post("/shell/execute")
+    async def execute_command(request: dict):
+        return {"stdout": "", "stderr": "", "return_code": 0}
+
+    @app.post("/search")
+    async def search_web(request: dict):
+        return {"status": "success", "results": []}
+
+    return app
+
+
+class FakePage:
+    def __init__(self, delay):
+        self.delay = delay
+        self.url = "about:blank"
+
+    async def goto(self, url):
+        await asyncio.sleep(self.delay)
+        self.url = url
+
+    async def click(self, selector):
+        await asyncio.sleep(self.delay)
+
+    async def fill(self, selector, text):
+        await asyncio.sleep(self.delay)
+
+
+class FakeBrowserPool:
+    """Stands in for BrowserPool: one fake page per page_id, no Chromium."""
+
+    def __init__(self, delay=0.005):
+        self.delay = delay
+        self.pages = {}
+        self.max_pages = 8
+
+    @contextlib.asynccontextmanager
+    async def page(self, page_id, context_id):
+        yield self.pages.setdefault(page_id, FakePage(self.delay))
+
+    def list_pages(self):
+        return [{"page_id": page_id, "url": page.url} for page_id, page in self.pages.items()]
+
+    async def close_page(self, page_id):
+        return self.pages.pop(page_id, None) is not None
+
+    async def close(self):
+        self.pages.clear()
+
+
+class FakeSearchProvider:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+
+    def search(self, query, max_results):
+        time.sleep(self.delay)
+        return [{"title": f"{query} {i}", "href": f"https://example.com/{i}"} for i in range(max_results)]
+
+
+def load_sandbox_api(browser_delay=0.005, search_delay=0.05):
+    """Import the real sandbox API app with a fake browser, search provider and screenshots."""
+    if SANDBOX_API_DIR not in sys.path:
+        sys.path.insert(0, SANDBOX_API_DIR)
+    import main
+
+    async def capture(page, page_id, *args):
+        await asyncio.sleep(browser_delay)
+        return b"\x89PNG fake screenshot", False
+
+    main.browser_pool = FakeBrowserPool(browser_delay)
+    main.search_cache.provider = FakeSearchProvider(search_delay)
+    main.screenshot.capture = capture
+    return main
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class BackgroundServer:
+    """Runs an ASGI app with uvicorn on a background thread."""
+
+    def __init__(self, app, port=None):
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+from backend.session_manager import session_manager
+
+BUFFER_SIZE = int(os.getenv("EVENT_BUFFER_SIZE", "256"))
+PING_INTERVAL = float(os.getenv("EVENT_PING_INTERVAL", "15"))
+REPLAY_BATCH = 500
+
+
+LAGGED = object()
+
+
+class Subscriber:
+    def __init__(self, buffer_size):
+        # One extra slot so the LAGGED marker always fits
+        self.queue = asyncio.Queue(maxsize=buffer_size + 1)
+        self.buffer_size = buffer_size
+        # Set when the buffer overflowed; the subscriber then catches up from the session log
+        self.lagged = False
+
+
+class EventBus:
+    """Fans session events out to every connected SSE client.
+
+    Each subscriber has a bounded buffer. A subscriber that falls behind does
+    not hold events in memory: its buffer is dropped and it re-reads the
+    missed events from the session log, which is also what backs
+    `Last-Event-ID` resume. Event ids are session log offsets.
+    """
+
+    def __init__(self, buffer_size=BUFFER_SIZE, ping_interval=PING_INTERVAL, log=session_manager):
+        self.buffer_size = buffer_size
+        self.ping_interval = ping_interval
+        self.log = log
+        self.topics = {}
+
+    def publish(self, session_id, event, event_id):
+        for subscriber in self.topics.get(session_id, ()):
+            if subscriber.lagged:
+                continue
+            if subscriber.queue.qsize() < subscriber.buffer_size:
+                subscriber.queue.put_nowait((event_id, event))
+            else:
+                subscriber.lagged = True
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait((LAGGED, None))
+
+    def emit(self, session_id, event):
+        """Record an event in the session log and publish it under its log offset."""
+        # Saving and publishing happen without yielding, so event ids stay in log order
+        event_id = self.log.save_event(session_id, event)
+        self.publish(session_id, event, event_id)
+        return event_id
+
+    async def prepare(self, session_id):
+        """Load the session's log state off the event loop, so `emit` does no blocking lookup."""
+        if not self.log.loaded(session_id):
+            await asyncio.to_thread(self.log.load, session_id)
+
+    async def drain(self):
+        """Backpressure: wait until the session log can take more events without growing its buffer."""
+        await self.log.drain()
+
+    def subscriber_count(self, session_id=None):
+        if session_id is not None:
+            return len(self.topics.get(session_id, ()))
+        return sum(len(subscribers) for subscribers in self.topics.values())
+
+    def queue_depth(self):
+        """Events buffered for all subscribers and not yet sent."""
+        return sum(subscriber.queue.qsize() for subscribers in self.topics.values() for subscriber in subscribers)
+
+    async def _replay(self, session_id, start):
+        while True:
+            # Reads can go to a remote store
+            events = await asyncio.to_thread(self.log.get_events, session_id, start, start + REPLAY_BATCH)
+            for event in events:
+                yield start, event
+                start += 1
+            if len(events) < REPLAY_BATCH:
+                return
+
+    async def subscribe(self, session_id, last_event_id=None):
+        """Yield (event_id, event) pairs: missed history first, then live events.
+
+        Without `last_event_id` the whole session history is replayed.
+        Yields (None, None) when a keep-alive ping is due.
+        """
+        subscriber = Subscriber(self.buffer_size)
+        self.topics.setdefault(session_id, set()).add(subscriber)
+        next_id = 0 if last_event_id is None else last_event_id + 1
+        try:
+            # Subscribe before replaying so nothing published meanwhile is missed;
+            # live events already covered by the replay are skipped by id.
+            async for event_id, event in self._replay(session_id, next_id):
+                yield event_id, event
+                next_id = event_id + 1
+            while True:
+                try:
+                    event_id, event = await asyncio.wait_for(subscriber.queue.get(), self.ping_interval)
+                except asyncio.TimeoutError:
+                    yield None, None
+                    continue
+                if event_id is LAGGED:
+                    subscriber.lagged = False
+                    async for event_id, event in self._replay(session_id, next_id):
+                        yield event_id, event
+                        next_id = event_id + 1
+                    continue
+                if event_id is not None and event_id < next_id:
+                    continue
+                yield event_id, event
+                if event_id is not None:
+                    next_id = event_id + 1
+        finally:
+            subscribers = self.topics.get(session_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.topics[session_id]
+
+    async def sse(self, session_id, last_event_id=None):
+        async for event_id, event in self.subscribe(session_id, last_event_id):
+            if event is None:
+                yield ": ping\n\n"
+            elif event_id is None:
+                yield f"data: {json.dumps(event)}\n\n"
+            else:
+                yield f"id: {event_id}\ndata: {json.dumps(event)}\n\n"
+
+
+event_bus = EventBus()
@@ -0,0 +1,223 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+
+class Segment:
+    def __init__(self, path, base):
+        self.path = path
+        self.base = base
+        self.count = 0
+        self.size = 0
+        # Sparse offset index: every `interval`-th event -> byte position in the file
+        self.index = []
+
+    @property
+    def end(self):
+        return self.base + self.count
+
+
+class EventLog:
+    """Append-only JSON-lines event log for one session.
+
+    Events live in segment files named after the offset of their first event.
+    Writes only ever append to the newest segment; older segments are never
+    rewritten except by compaction, which replaces them atomically.
+    """
+
+    def __init__(self, directory, segment_max_bytes=1 << 20, compact_max_bytes=16 << 20,
+                 compact_threshold=8, fsync_batch=64, fsync_interval=1.0, index_interval=64):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.compact_max_bytes = compact_max_bytes
+        self.compact_threshold = compact_threshold
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.index_interval = index_interval
+        self.lock = threading.Lock()
+        self.segments = []
+        self._file = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _segment_path(self, base):
+        return os.path.join(self.directory, f"{base:020d}.jsonl")
+
+    def _load(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(".jsonl"))
+        for name in names:
+            segment = Segment(os.path.join(self.directory, name), int(name[:-len(".jsonl")]))
+            self._scan(segment, repair=name == names[-1])
+            # A crash between writing a compacted segment and removing the
+            # segments it replaced leaves events covered twice; keep the merged one.
+            while self.segments and segment.base < self.segments[-1].end:
+                if segment.end <= self.segments[-1].end:
+                    os.remove(segment.path)
+                    segment = None
+                    break
+                os.remove(self.segments.pop().path)
+            if segment is not None:
+                self.segments.append(segment)
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.directory, name))
+
+    def _scan(self, segment, repair=False):
+        segment.count = 0
+        segment.index = []
+        pos = 0
+        with open(segment.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                if repair:
+                    try:
+                        json.loads(line)
+                    except ValueError:
+                        break
+                if segment.count % self.index_interval == 0:
+                    segment.index.append(pos)
+                segment.count += 1
+                pos += len(line)
+        segment.size = pos
+        if repair and pos != os.path.getsize(segment.path):
+            # Drop a torn trailing write so later appends start on a clean line
+            with open(segment.path, "r+b") as f:
+                f.truncate(pos)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def __len__(self):
+        return self.segments[-1].end if self.segments else 0
+
+    def append(self, event):
+        line = (json.dumps(event) + "\n").encode()
+        with self.lock:
+            if not self.segments or self.segments[-1].size >= self.segment_max_bytes:
+                self._roll()
+            segment = self.segments[-1]
+            if self._file is None:
+                self._file = open(segment.path, "ab")
+            if segment.count % self.index_interval == 0:
+                segment.index.append(segment.size)
+            self._file.write(line)
+            self._file.flush()
+            offset = segment.end
+            segment.count += 1
+            segment.size += len(line)
+            self._unsynced += 1
+            if (self._unsynced >= self.fsync_batch
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+            return offset
+
+    def _roll(self):
+        self._close_file()
+        segment = Segment(self._segment_path(len(self)), len(self))
+        open(segment.path, "ab").close()
+        self.segments.append(segment)
+        if len(self.segments) > self.compact_threshold:
+            self._compact()
+
+    def _sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def close(self):
+        with self.lock:
+            self._close_file()
+
+    def read(self, start=0, end=None):
+        with self.lock:
+            end = len(self) if end is None else min(end, len(self))
+            start = max(start, 0)
+            events = []
+            if start >= end:
+                # Caught up (or past the end): there may be no index slot for `start`
+                return events
+            i = bisect.bisect_right([s.base for s in self.segments], start) - 1
+            for segment in self.segments[max(i, 0):]:
+                if segment.base >= end:
+                    break
+                first = max(start, segment.base) - segment.base
+                slot = first // self.index_interval
+                skip = first - slot * self.index_interval
+                n = segment.base + slot * self.index_interval
+                with open(segment.path, "rb") as f:
+                    f.seek(segment.index[slot])
+                    for line in f:
+                        if n >= end:
+                            break
+                        if skip:
+                            skip -= 1
+                        else:
+                            events.append(json.loads(line))
+                        n += 1
+            return events
+
+    def tail(self, n):
+        return self.read(max(len(self) - n, 0))
+
+    def compact(self):
+        with self.lock:
+            self._compact()
+
+    def _compact(self):
+        # Merge runs of adjacent sealed segments into segments of up to
+        # compact_max_bytes. The active (last) segment is never touched.
+        sealed = self.segments[:-1]
+        merged = []
+        run = []
+        for segment in sealed:
+            if run and sum(s.size for s in run) + segment.size > self.compact_max_bytes:
+                merged.append(self._merge(run))
+                run = []
+            run.append(segment)
+        if run:
+            merged.append(self._merge(run))
+        self.segments = merged + self.segments[-1:]
+
+    def _merge(self, run):
+        if len(run) == 1:
+            return run[0]
+        target = run[0]
+        tmp = target.path + ".tmp"
+        with open(tmp, "wb") as out:
+            for segment in run:
+                with open(segment.path, "rb") as f:
+                    out.write(f.read(segment.size))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, target.path)
+        for segment in run[1:]:
+            os.remove(segment.path)
+        self._fsync_dir()
+        merged = Segment(target.path, target.base)
+        self._scan(merged)
+        return merged
+
+    def _fsync_dir(self):
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
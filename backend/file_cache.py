@@ -0,0 +1,62 @@
+import difflib
+import os
+from collections import OrderedDict
+
+CACHE_BYTES = int(os.getenv("AGENT_FILE_CACHE_BYTES", str(16 << 20)))
+# Smaller files are always written in full
+DELTA_MIN_BYTES = int(os.getenv("AGENT_DELTA_MIN_BYTES", "4096"))
+
+
+class FileCache:
+    """Text of sandbox files an agent has read or written, with their SHA-256.
+
+    Keyed by path; the hash is what the sandbox revalidates (If-None-Match)
+    and what delta writes are based on, so a stale entry costs a full
+    transfer, never a wrong answer. Least recently used entries are dropped
+    past `max_bytes` of text.
+    """
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, path):
+        """(sha256, content) or None."""
+        entry = self.entries.get(path)
+        if entry is not None:
+            self.entries.move_to_end(path)
+        return entry
+
+    def put(self, path, sha256, content):
+        self.discard(path)
+        if len(content) > self.max_bytes:
+            return
+        self.entries[path] = (sha256, content)
+        self.size += len(content)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def discard(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+def split_lines(text):
+    """Lines split on "\\n" only, each keeping its newline; the sandbox's apply_patch splits the same way."""
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    return lines if lines[-1] else lines[:-1]
+
+
+def line_edits(old, new):
+    """Edits for the sandbox's /files/patch turning `old` into `new`, line by line."""
+    a = split_lines(old)
+    b = split_lines(new)
+    return [
+        {"start": i1, "end": i2, "lines": b[j1:j2]}
+        for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b).get_opcodes()
+        if tag != "equal"
+    ]
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+import httpx
+from backend.sandbox_api.metrics import Counter, Histogram
+
+# Per-tool read timeouts in seconds; shell commands get their own timeout added on top
+TOOL_TIMEOUTS = {
+    "search": 30.0,
+    "list_files": 10.0,
+    "read_file": 30.0,
+    "write_file": 30.0,
+    "execute_command": 5.0,
+    "session_exec": 5.0,
+    "browser_goto": 60.0,
+    "browser_screenshot": 30.0,
+    "batch": 300.0,
+}
+DEFAULT_TIMEOUT = 30.0
+CONNECT_TIMEOUT = 5.0
+
+# Errors raised before the request reached the sandbox, so retrying cannot run a tool twice
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+TOOL_SECONDS = Histogram("sandbox_tool_call_duration_seconds", "Tool call round trips to sandboxes, retries included.",
+                         ("tool", "outcome"))
+RETRIES = Counter("sandbox_tool_call_retries_total", "Tool calls retried after a connection error.", ("tool",))
+
+
+class SandboxHTTPClient:
+    """Process-wide keep-alive HTTP clients for talking to sandbox APIs.
+
+    Each sandbox origin gets its own `httpx.AsyncClient`, so connection
+    limits apply per sandbox and one busy sandbox cannot starve the others.
+    """
+
+    def __init__(self, max_connections=None, max_keepalive=None, http2=None, retries=None, backoff=0.1):
+        self.max_connections = max_connections or int(os.getenv("SANDBOX_HTTP_MAX_CONNECTIONS", "20"))
+        self.max_keepalive = max_keepalive or int(os.getenv("SANDBOX_HTTP_MAX_KEEPALIVE", "10"))
+        if http2 is None:
+            http2 = os.getenv("SANDBOX_HTTP2", "0") == "1"
+        self.http2 = http2
+        self.retries = int(os.getenv("SANDBOX_HTTP_RETRIES", "3")) if retries is None else retries
+        self.backoff = backoff
+        self.clients = {}
+
+    def get_client(self, base_url):
+        client = self.clients.get(base_url)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                ),
+                timeout=httpx.Timeout(DEFAULT_TIMEOUT, connect=CONNECT_TIMEOUT),
+            )
+            self.clients[base_url] = client
+        return client
+
+    def timeout_for(self, tool_name, params=None):
+        timeout = TOOL_TIMEOUTS.get(tool_name, DEFAULT_TIMEOUT)
+        if tool_name in ("execute_command", "session_exec") and params:
+            timeout += params.get("timeout", 30)
+        return httpx.Timeout(timeout, connect=CONNECT_TIMEOUT)
+
+    async def request(self, base_url, method, path, tool_name=None, stream=False, **kwargs):
+        """Send a request, retrying connection errors.
+
+        With `stream`, the body is not read; the caller iterates it and must
+        `aclose()` the response.
+        """
+        client = self.get_client(base_url)
+        kwargs.setdefault("timeout", self.timeout_for(tool_name, kwargs.get("json")))
+        tool = tool_name or path
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            try:
+                response = await client.send(client.build_request(method, path, **kwargs), stream=stream)
+            except RETRYABLE_ERRORS:
+                if attempt >= self.retries:
+                    TOOL_SECONDS.observe(time.perf_counter() - start, tool=tool, outcome="error")
+                    raise
+                RETRIES.inc(tool=tool)
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+            except Exception:
+                TOOL_SECONDS.observe(time.perf_counter() - start, tool=tool, outcome="error")
+                raise
+            else:
+                TOOL_SECONDS.observe(time.perf_counter() - start, tool=tool, outcome=str(response.status_code))
+                return response
+
+    async def close(self, base_url):
+        client = self.clients.pop(base_url, None)
+        if client is not None:
+            await client.aclose()
+
+    async def aclose(self):
+        clients, self.clients = self.clients, {}
+        await asyncio.gather(*(client.aclose() for client in clients.values()))
+
+
+sandbox_http = SandboxHTTPClient()
@@ -0,0 +1,114 @@
+import asyncio
+import os
+import time
+import uuid
+
+MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "4"))
+
+
+class PlanError(ValueError):
+    pass
+
+
+def validate(steps):
+    """Check a plan is a DAG: unique step ids, known dependencies and no cycles."""
+    ids = set()
+    for step in steps:
+        if step["id"] in ids:
+            raise PlanError(f"Duplicate step id: {step['id']}")
+        ids.add(step["id"])
+    for step in steps:
+        for dep in step.get("depends_on", ()):
+            if dep not in ids:
+                raise PlanError(f"Step {step['id']} depends on unknown step: {dep}")
+    # Kahn's algorithm; whatever cannot be ordered is part of a cycle
+    remaining = {step["id"]: set(step.get("depends_on", ())) for step in steps}
+    ready = [step_id for step_id, deps in remaining.items() if not deps]
+    while ready:
+        done = ready.pop()
+        del remaining[done]
+        for step_id, deps in remaining.items():
+            if done in deps:
+                deps.discard(done)
+                if not deps:
+                    ready.append(step_id)
+    if remaining:
+        raise PlanError(f"Plan has a dependency cycle through: {', '.join(sorted(remaining))}")
+
+
+def failed(result):
+    return isinstance(result, dict) and result.get("status") == "error"
+
+
+class PlanExecutor:
+    """Runs a plan of tool steps as a DAG for one session.
+
+    Steps are {"id", "tool", "params", "depends_on"}. A step starts once all
+    of its dependencies succeeded and a concurrency slot is free; dependents
+    of a failed step are skipped. Progress is emitted as plan_started,
+    step_started, step_finished and plan_finished events. Cancelling `run`
+    cancels the steps in flight.
+    """
+
+    def __init__(self, call_tool, emit, max_concurrency=MAX_CONCURRENCY):
+        self.call_tool = call_tool
+        self.emit = emit
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(self, steps, plan_id=None):
+        validate(steps)
+        plan_id = plan_id or uuid.uuid4().hex[:8]
+        results = {}
+        done = {step["id"]: asyncio.Event() for step in steps}
+        self.emit({"type": "plan_started", "plan_id": plan_id, "steps": [
+            {"id": step["id"], "tool": step["tool"], "depends_on": step.get("depends_on", [])} for step in steps
+        ]})
+        plan_start = time.perf_counter()
+
+        async def run_step(step):
+            try:
+                for dep in step.get("depends_on", ()):
+                    await done[dep].wait()
+                blocked = [dep for dep in step.get("depends_on", ()) if results[dep]["status"] != "success"]
+                if blocked:
+                    results[step["id"]] = {"id": step["id"], "tool": step["tool"], "status": "skipped",
+                                           "blocked_by": blocked}
+                    self.emit({"type": "step_finished", "plan_id": plan_id, "step": step["id"],
+                               "tool": step["tool"], "status": "skipped", "blocked_by": blocked})
+                    return
+                async with self.semaphore:
+                    self.emit({"type": "step_started", "plan_id": plan_id, "step": step["id"], "tool": step["tool"]})
+                    start = time.perf_counter()
+                    try:
+                        result = await self.call_tool(step["tool"], step.get("params", {}))
+                        status = "error" if failed(result) else "success"
+                    except asyncio.CancelledError:
+                        result, status = None, "cancelled"
+                        raise
+                    except Exception as e:
+                        result, status = {"status": "error", "message": str(e)}, "error"
+                    finally:
+                        duration_ms = (time.perf_counter() - start) * 1000
+                        results[step["id"]] = {"id": step["id"], "tool": step["tool"], "status": status,
+                                               "result": result, "duration_ms": duration_ms}
+                        self.emit({"type": "step_finished", "plan_id": plan_id, "step": step["id"],
+                                   "tool": step["tool"], "status": status, "duration_ms": duration_ms})
+            finally:
+                done[step["id"]].set()
+
+        tasks = [asyncio.create_task(run_step(step)) for step in steps]
+        try:
+            await asyncio.gather(*tasks)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for step in steps:
+                results.setdefault(step["id"], {"id": step["id"], "tool": step["tool"], "status": "cancelled"})
+            self.emit({"type": "plan_finished", "plan_id": plan_id, "status": "cancelled",
+                       "duration_ms": (time.perf_counter() - plan_start) * 1000})
+            raise
+        status = "completed" if all(r["status"] == "success" for r in results.values()) else "failed"
+        self.emit({"type": "plan_finished", "plan_id": plan_id, "status": status,
+                   "duration_ms": (time.perf_counter() - plan_start) * 1000})
+        return [results[step["id"]] for step in steps]
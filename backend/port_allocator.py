@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+from collections import deque
+
+PORT_NAMES = ("api", "vnc", "novnc", "cdp")
+
+
+class PortsExhausted(Exception):
+    pass
+
+
+class PortAllocator:
+    """Leases contiguous blocks of host ports to sandboxes in constant time.
+
+    Block `i` covers `base_port + i * len(PORT_NAMES)` onwards, one port per
+    entry in PORT_NAMES. Leases are kept in memory and written to
+    `state_path` so a restarted server does not hand out ports that running
+    containers still hold.
+    """
+
+    def __init__(self, base_port=20000, max_blocks=1000, state_path=None):
+        self.base_port = base_port
+        self.max_blocks = max_blocks
+        self.state_path = state_path
+        self.lock = threading.Lock()
+        self.leases = {}
+        self._load()
+        leased = set(self.leases.values())
+        self.free = deque(i for i in range(max_blocks) if i not in leased)
+
+    def _load(self):
+        # The state file is a journal of lease/release records; replay it,
+        # then rewrite it compacted so it only grows with the live leases.
+        self._journal = None
+        if not self.state_path:
+            return
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if record.get("block") is None:
+                        self.leases.pop(record["key"], None)
+                    elif record["block"] < self.max_blocks:
+                        self.leases[record["key"]] = record["block"]
+        dir_name = os.path.dirname(self.state_path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            for key, block in self.leases.items():
+                f.write(json.dumps({"key": key, "block": block}) + "\n")
+        os.replace(tmp, self.state_path)
+        self._journal = open(self.state_path, "a")
+
+    def _record(self, key, block):
+        if self._journal is not None:
+            self._journal.write(json.dumps({"key": key, "block": block}) + "\n")
+            self._journal.flush()
+
+    def close(self):
+        with self.lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def ports(self, block):
+        start = self.base_port + block * len(PORT_NAMES)
+        return {name: start + i for i, name in enumerate(PORT_NAMES)}
+
+    def allocate(self, key):
+        with self.lock:
+            if key in self.leases:
+                return self.ports(self.leases[key])
+            if not self.free:
+                raise PortsExhausted(f"All {self.max_blocks} sandbox port blocks are leased")
+            block = self.free.popleft()
+            self.leases[key] = block
+            self._record(key, block)
+            return self.ports(block)
+
+    def release(self, key):
+        with self.lock:
+            block = self.leases.pop(key, None)
+            if block is None:
+                return False
+            self.free.append(block)
+            self._record(key, None)
+            return True
+
+    def rename(self, old_key, new_key):
+        with self.lock:
+            block = self.leases[new_key] = self.leases.pop(old_key)
+            self._record(new_key, block)
+            self._record(old_key, None)
+
+    def get(self, key):
+        block = self.leases.get(key)
+        return None if block is None else self.ports(block)
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pydantic import ValidationError
+
+MAX_CONCURRENCY = 8
+
+
+class BatchError(ValueError):
+    pass
+
+
+def validate(steps):
+    """Check step ids are unique and only depend on earlier steps (so the plan is a DAG)."""
+    seen = set()
+    for step in steps:
+        if step.id in seen:
+            raise BatchError(f"Duplicate step id: {step.id}")
+        for dep in step.depends_on:
+            if dep not in seen:
+                raise BatchError(f"Step {step.id} depends on unknown or later step: {dep}")
+        seen.add(step.id)
+
+
+async def run_batch(steps, handlers, sequential=False, stop_on_error=False, max_concurrency=MAX_CONCURRENCY):
+    """Run tool steps, concurrently where their dependencies allow.
+
+    `handlers` maps a tool name to an async callable taking the step params.
+    Returns one result dict per step, in the order the steps were given.
+    """
+    validate(steps)
+    for step in steps:
+        if step.tool not in handlers:
+            raise BatchError(f"Unknown tool: {step.tool}")
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    results = {}
+    done = {step.id: asyncio.Event() for step in steps}
+    failed = asyncio.Event()
+
+    async def run(step, previous):
+        deps = list(step.depends_on)
+        # In sequential mode the previous step only orders this one; its failure does not block it
+        if sequential and previous is not None:
+            await done[previous].wait()
+        for dep in deps:
+            await done[dep].wait()
+        try:
+            blocked = [dep for dep in deps if results.get(dep, {}).get("status") != "success"]
+            if blocked or (stop_on_error and failed.is_set()):
+                results[step.id] = {"id": step.id, "tool": step.tool, "status": "skipped", "blocked_by": blocked}
+                return
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    result = await handlers[step.tool](step.params)
+                    results[step.id] = {"id": step.id, "tool": step.tool, "status": "success", "result": result}
+                except HTTPException as e:
+                    results[step.id] = {"id": step.id, "tool": step.tool, "status": "error",
+                                        "status_code": e.status_code, "detail": e.detail}
+                except ValidationError as e:
+                    # Bad step params, reported like FastAPI reports a bad request body
+                    results[step.id] = {"id": step.id, "tool": step.tool, "status": "error",
+                                        "status_code": 422, "detail": jsonable_encoder(e.errors(include_url=False))}
+                except Exception as e:
+                    results[step.id] = {"id": step.id, "tool": step.tool, "status": "error",
+                                        "status_code": 500, "detail": str(e)}
+                results[step.id]["duration_ms"] = (time.perf_counter() - start) * 1000
+            if results[step.id]["status"] == "error":
+                failed.set()
+        finally:
+            done[step.id].set()
+
+    previous = None
+    tasks = []
+    for step in steps:
+        tasks.append(run(step, previous))
+        previous = step.id
+    await asyncio.gather(*tasks)
+    return [results[step.id] for step in steps]
@@ -0,0 +1,252 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+OUTPUT_LIMIT = int(os.getenv("TOOL_OUTPUT_LIMIT", "65536"))
+OUTPUT_HEAD = int(os.getenv("TOOL_OUTPUT_HEAD", "16384"))
+OUTPUT_TAIL = int(os.getenv("TOOL_OUTPUT_TAIL", "16384"))
+COMPRESSION = os.getenv("BLOB_COMPRESSION") or ("zstd" if zstandard is not None else "gzip")
+EXTENSIONS = {"zstd": ".zst", "gzip": ".gz"}
+# Retention; 0 turns a limit off
+BLOB_MAX_BYTES = int(os.getenv("BLOB_MAX_BYTES", str(1 << 30)))
+BLOB_MAX_AGE = float(os.getenv("BLOB_MAX_AGE", "86400"))
+PRUNE_INTERVAL = 60.0
+
+
+class BlobStore:
+    """Content-addressed, compressed blobs on disk.
+
+    A blob is named by the SHA-256 of its content, so storing the same output
+    twice keeps one copy. Blobs are compressed with zstd when the `zstandard`
+    package is installed, else gzip; either kind is readable whichever is
+    configured.
+
+    Blobs not stored again for `max_age` seconds are deleted, and the oldest
+    go first once the store is over `max_bytes` on disk. Pruning runs from
+    `put` at most once a minute unless the size limit is crossed sooner.
+    """
+
+    def __init__(self, path, compression=COMPRESSION, max_bytes=BLOB_MAX_BYTES, max_age=BLOB_MAX_AGE):
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown blob compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+        self.path = path
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        # Bytes on disk as of the last prune plus those stored since; None until the first prune
+        self.used = None
+        self.pruned_at = 0.0
+
+    def _path(self, digest, compression):
+        return os.path.join(self.path, digest[:2], digest + EXTENSIONS[compression])
+
+    def _find(self, digest):
+        if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+            raise KeyError(digest)
+        for compression in EXTENSIONS:
+            path = self._path(digest, compression)
+            if os.path.exists(path):
+                return path, compression
+        raise KeyError(digest)
+
+    def put(self, data):
+        """Store bytes; returns their hex digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        if self._touch(digest):
+            return digest
+        path = self._path(digest, self.compression)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.compression == "zstd":
+            compressed = zstandard.ZstdCompressor(level=3).compress(data)
+        else:
+            compressed = gzip.compress(data, compresslevel=6)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(compressed)
+        os.replace(tmp, path)
+        self._added(len(compressed))
+        return digest
+
+    def put_chunks(self, chunks):
+        """Store bytes arriving in chunks, without holding them all; returns their hex digest."""
+        os.makedirs(self.path, exist_ok=True)
+        sha = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if self.compression == "zstd":
+                    out = zstandard.ZstdCompressor(level=3).stream_writer(f, closefd=False)
+                else:
+                    out = gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6)
+                with out:
+                    for chunk in chunks:
+                        sha.update(chunk)
+                        out.write(chunk)
+            digest = sha.hexdigest()
+            if not self._touch(digest):
+                path = self._path(digest, self.compression)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                size = os.path.getsize(tmp)
+                os.replace(tmp, path)
+                self._added(size)
+                return digest
+        except BaseException:
+            os.remove(tmp)
+            raise
+        os.remove(tmp)
+        return digest
+
+    def _touch(self, digest):
+        """Whether the blob is stored; if so its age restarts, as it was just stored again."""
+        try:
+            path, _ = self._find(digest)
+            os.utime(path)
+        except (KeyError, FileNotFoundError):
+            return False
+        return True
+
+    def _added(self, size):
+        with self.lock:
+            if self.used is not None:
+                self.used += size
+            due = (self.used is None or time.monotonic() - self.pruned_at > PRUNE_INTERVAL
+                   or (self.max_bytes and self.used > self.max_bytes))
+        if due:
+            self.prune()
+
+    def prune(self):
+        """Delete expired blobs, then the oldest ones while over `max_bytes`; returns how many were deleted."""
+        with self.lock:
+            blobs = []
+            for root, _, names in os.walk(self.path):
+                for name in names:
+                    if name.endswith(tuple(EXTENSIONS.values())):
+                        path = os.path.join(root, name)
+                        try:
+                            stat = os.stat(path)
+                        except FileNotFoundError:
+                            continue
+                        blobs.append((stat.st_mtime, stat.st_size, path))
+            blobs.sort()
+            used = sum(size for _, size, _ in blobs)
+            cutoff = time.time() - self.max_age if self.max_age else None
+            removed = 0
+            for mtime, size, path in blobs:
+                if not ((cutoff is not None and mtime < cutoff) or (self.max_bytes and used > self.max_bytes)):
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                used -= size
+                removed += 1
+            self.used = used
+            self.pruned_at = time.monotonic()
+        return removed
+
+    def open(self, digest):
+        """A file object reading the decompressed blob; raises KeyError if it is missing."""
+        path, compression = self._find(digest)
+        if compression == "zstd":
+            if zstandard is None:
+                raise KeyError(digest)
+            return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return gzip.open(path, "rb")
+
+    def get(self, digest):
+        with self.open(digest) as f:
+            return f.read()
+
+    def iter(self, digest, chunk_size=65536):
+        """Decompressed chunks; a missing blob raises KeyError here, not on first iteration."""
+        f = self.open(digest)
+
+        def chunks():
+            with f:
+                while chunk := f.read(chunk_size):
+                    yield chunk
+        return chunks()
+
+
+def truncate(data, head=OUTPUT_HEAD, tail=OUTPUT_TAIL):
+    """Keep the first `head` and last `tail` bytes of `data`, with a marker between."""
+    return _join(data[:head], data[len(data) - tail:], len(data) - head - tail)
+
+
+def _join(head, tail, omitted):
+    marker = f"\n... [{omitted} bytes omitted] ...\n"
+    # Cuts can fall inside a UTF-8 sequence; the partial character is dropped
+    return head.decode(errors="ignore") + marker + tail.decode(errors="ignore")
+
+
+class OutputPolicy:
+    """Size limit for tool output.
+
+    Strings longer than `limit` bytes are cut down to their head and tail,
+    and the full text is spilled to the blob store. Where that happened is
+    recorded under the result's "spilled" key: the field path, its full size
+    in bytes and the blob's ref.
+    """
+
+    def __init__(self, store, limit=OUTPUT_LIMIT, head=OUTPUT_HEAD, tail=OUTPUT_TAIL):
+        self.store = store
+        self.limit = limit
+        self.head = min(head, limit)
+        self.tail = min(tail, limit - self.head)
+
+    def compact(self, text):
+        """Returns (text, spill info or None)."""
+        if len(text) <= self.limit // 4:
+            # Too short to be over the limit even as 4-byte UTF-8
+            return text, None
+        data = text.encode()
+        if len(data) <= self.limit:
+            return text, None
+        ref = "sha256:" + self.store.put(data)
+        return truncate(data, self.head, self.tail), {"ref": ref, "size": len(data)}
+
+    def compact_file(self, read, size, chunk_size=65536):
+        """Like `compact`, for `size` bytes read by `read(offset, n)`, without holding them all."""
+        if size <= self.limit:
+            return read(0, size).decode(errors="replace"), None
+        chunks = (read(offset, min(chunk_size, size - offset)) for offset in range(0, size, chunk_size))
+        ref = "sha256:" + self.store.put_chunks(chunks)
+        text = _join(read(0, self.head), read(size - self.tail, self.tail), size - self.head - self.tail)
+        return text, {"ref": ref, "size": size}
+
+    def apply(self, result):
+        """A copy of a JSON-like result with oversized strings compacted."""
+        spilled = {}
+
+        def walk(value, path):
+            if isinstance(value, str):
+                value, info = self.compact(value)
+                if info is not None:
+                    spilled[path] = info
+                return value
+            if isinstance(value, dict):
+                return {k: walk(v, f"{path}.{k}" if path else str(k)) for k, v in value.items()}
+            if isinstance(value, list):
+                return [walk(v, f"{path}.{i}" if path else str(i)) for i, v in enumerate(value)]
+            return value
+
+        compacted = walk(result, "")
+        if spilled and isinstance(compacted, dict):
+            compacted["spilled"] = {**compacted.get("spilled", {}), **spilled}
+        return compacted
+
+
+def parse_ref(ref):
+    """The digest of a "sha256:<hex>" ref (a bare digest is accepted too)."""
+    return ref.split(":", 1)[1] if ref.startswith("sha256:") else ref
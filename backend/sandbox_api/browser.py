@@ -0,0 +1,128 @@
+import asyncio
+import contextlib
+import os
+import time
+from collections import OrderedDict
+from screenshot import MUTATION_TRACKER
+
+MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "8"))
+DEFAULT_PAGE = "default"
+DEFAULT_CONTEXT = "default"
+
+
+class BrowserPoolFull(Exception):
+    pass
+
+
+class PageEntry:
+    def __init__(self, page_id, context_id, page):
+        self.page_id = page_id
+        self.context_id = context_id
+        self.page = page
+        self.lock = asyncio.Lock()
+        self.last_used = time.time()
+
+    def info(self):
+        return {
+            "page_id": self.page_id,
+            "context_id": self.context_id,
+            "url": self.page.url,
+            "busy": self.lock.locked(),
+            "last_used": self.last_used,
+        }
+
+
+class BrowserPool:
+    """Named pages on a single shared Chromium.
+
+    Pages are created on first use and live in a browser context of their
+    choosing, so callers can share cookies or isolate from each other. Each
+    page has its own lock; different pages are driven concurrently. When
+    `max_pages` are open, the least recently used idle page is closed.
+    """
+
+    def __init__(self, max_pages=MAX_PAGES):
+        self.max_pages = max_pages
+        self.playwright = None
+        self.browser = None
+        self.contexts = {}
+        self.pages = OrderedDict()
+        self.lock = asyncio.Lock()
+
+    async def _get_browser(self):
+        if self.browser is None:
+            # Imported on first use so the API starts without loading Playwright
+            from playwright.async_api import async_playwright
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch(headless=False)
+        return self.browser
+
+    async def _get_entry(self, page_id, context_id):
+        async with self.lock:
+            entry = self.pages.get(page_id)
+            if entry is not None:
+                self.pages.move_to_end(page_id)
+                return entry
+            if len(self.pages) >= self.max_pages:
+                await self._evict()
+            browser = await self._get_browser()
+            context = self.contexts.get(context_id)
+            if context is None:
+                context = self.contexts[context_id] = await browser.new_context()
+                await context.add_init_script(MUTATION_TRACKER)
+            entry = PageEntry(page_id, context_id, await context.new_page())
+            self.pages[page_id] = entry
+            return entry
+
+    async def _evict(self):
+        for page_id, entry in self.pages.items():
+            if not entry.lock.locked():
+                await self._close_entry(entry)
+                return
+        raise BrowserPoolFull(f"All {self.max_pages} browser pages are busy")
+
+    async def _close_entry(self, entry):
+        del self.pages[entry.page_id]
+        await entry.page.close()
+        if not any(e.context_id == entry.context_id for e in self.pages.values()):
+            context = self.contexts.pop(entry.context_id, None)
+            if context is not None:
+                await context.close()
+
+    @contextlib.asynccontextmanager
+    async def page(self, page_id=DEFAULT_PAGE, context_id=DEFAULT_CONTEXT):
+        while True:
+            entry = await self._get_entry(page_id, context_id)
+            async with entry.lock:
+                # The page may have been closed while we waited for its lock
+                if self.pages.get(page_id) is not entry:
+                    continue
+                entry.last_used = time.time()
+                yield entry.page
+                entry.last_used = time.time()
+                return
+
+    def list_pages(self):
+        return [entry.info() for entry in self.pages.values()]
+
+    async def close_page(self, page_id):
+        entry = self.pages.get(page_id)
+        if entry is None:
+            return False
+        # Let an in-flight action on the page finish before closing it
+        async with entry.lock:
+            async with self.lock:
+                if self.pages.get(page_id) is entry:
+                    await self._close_entry(entry)
+        return True
+
+    async def close(self):
+        async with self.lock:
+            for entry in list(self.pages.values()):
+                await self._close_entry(entry)
+            if self.browser is not None:
+                await self.browser.close()
+                self.browser = None
+            if self.playwright is not None:
+                await self.playwright.stop()
+                self.playwright = None
@@ -0,0 +1,292 @@
+import base64
+import fnmatch
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+READ_MAX_BYTES = int(os.getenv("FILES_READ_MAX_BYTES", str(10 << 20)))
+TAIL_BLOCK_SIZE = 65536
+HASH_BLOCK_SIZE = 1 << 20
+HASH_CACHE_SIZE = 1024
+
+# realpath -> (stat signature, sha256); a file is rehashed only after it changes
+_hashes = OrderedDict()
+
+
+class PatchConflict(Exception):
+    pass
+
+
+def encode(data, encoding):
+    if encoding == "base64":
+        return base64.b64encode(data).decode()
+    return data.decode("utf-8", errors="replace")
+
+
+def decode(content, encoding):
+    if encoding == "base64":
+        return base64.b64decode(content)
+    return content.encode("utf-8")
+
+
+def read_range(path, offset=0, length=None):
+    """Read `length` bytes from `offset` (negative counts from the end).
+
+    Returns (data, offset, size, truncated); reads are capped at
+    READ_MAX_BYTES and `truncated` says when the cap cut the range short.
+    """
+    size = os.path.getsize(path)
+    if offset < 0:
+        offset = max(size + offset, 0)
+    wanted = max(size - offset, 0)
+    if length is not None:
+        wanted = min(wanted, max(length, 0))
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(min(wanted, READ_MAX_BYTES))
+    return data, offset, size, len(data) < wanted
+
+
+def tail_lines(path, n):
+    """Return (data, truncated) for the last `n` lines, reading backwards in blocks.
+
+    At most READ_MAX_BYTES are returned; `truncated` says when the cap cut
+    the lines short.
+    """
+    if n <= 0:
+        return b"", False
+    chunks = []
+    with open(path, "rb") as f:
+        pos = end = f.seek(0, os.SEEK_END)
+        # A trailing newline ends the last line rather than starting a new one
+        newlines = 0
+        if end:
+            f.seek(end - 1)
+            newlines = -1 if f.read(1) == b"\n" else 0
+        while pos > 0 and newlines < n and end - pos < READ_MAX_BYTES:
+            step = min(TAIL_BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            chunks.append(chunk)
+            newlines += chunk.count(b"\n")
+    data = b"".join(reversed(chunks))
+    cut = len(data) - 1 if data.endswith(b"\n") else len(data)
+    for _ in range(n):
+        cut = data.rfind(b"\n", 0, cut)
+        if cut == -1:
+            break
+    lines = data[cut + 1:]
+    # Reading stopped at the cap before the first wanted line began, or the lines are over it
+    truncated = (cut == -1 and pos > 0) or len(lines) > READ_MAX_BYTES
+    return lines[-READ_MAX_BYTES:], truncated
+
+
+def _signature(st):
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def content_hash(path):
+    """SHA-256 of a file's content, cached by inode, size and mtime."""
+    key = os.path.realpath(path)
+    signature = _signature(os.stat(key))
+    cached = _hashes.get(key)
+    if cached is not None and cached[0] == signature:
+        _hashes.move_to_end(key)
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(key, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+    remember_hash(key, signature, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def remember_hash(key, signature, digest):
+    _hashes[key] = (signature, digest)
+    _hashes.move_to_end(key)
+    while len(_hashes) > HASH_CACHE_SIZE:
+        _hashes.popitem(last=False)
+
+
+def forget_hash(path):
+    """Drop the cached hash of `path`, for writes the cache cannot follow."""
+    _hashes.pop(os.path.realpath(path), None)
+
+
+def write_bytes(path, data, append=False):
+    """Write or append `data`; returns (bytes written, sha256 of the file or None after an append)."""
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    with open(path, "ab" if append else "wb") as f:
+        f.write(data)
+    # An append within one mtime tick can keep the signature, so its old hash is dropped
+    if append:
+        forget_hash(path)
+        return len(data), None
+    digest = hashlib.sha256(data).hexdigest()
+    remember_hash(os.path.realpath(path), _signature(os.stat(path)), digest)
+    return len(data), digest
+
+
+def split_lines(data):
+    """Lines of `data` split on "\\n" only, each keeping its newline.
+
+    Unlike splitlines(), "\\r", form feeds and Unicode separators stay inside
+    a line, so line numbers match the agent's (backend/file_cache.py).
+    """
+    lines = [line + b"\n" for line in data.split(b"\n")]
+    lines[-1] = lines[-1][:-1]
+    return lines if lines[-1] else lines[:-1]
+
+
+def apply_patch(path, base_sha256, edits, expected_sha256=None):
+    """Apply line edits to a file whose content hashes to `base_sha256`.
+
+    Each edit is {"start", "end", "lines"}: lines[start:end] of the base
+    content are replaced by "lines" (each keeping its line ending). Edits
+    refer to base line numbers, must be sorted and must not overlap. The
+    result is written atomically; PatchConflict is raised, and nothing
+    written, when the file is not the base or the result is not
+    `expected_sha256`. Returns (size, sha256) of the new content.
+    """
+    if content_hash(path) != base_sha256:
+        raise PatchConflict("File does not match base_sha256")
+    with open(path, "rb") as f:
+        lines = split_lines(f.read())
+    out = []
+    position = 0
+    for edit in edits:
+        start, end = edit["start"], edit["end"]
+        if not position <= start <= end <= len(lines):
+            raise ValueError("Edits must be sorted, non-overlapping and within the file")
+        out.extend(lines[position:start])
+        out.extend(line.encode() for line in edit["lines"])
+        position = end
+    out.extend(lines[position:])
+    data = b"".join(out)
+    digest = hashlib.sha256(data).hexdigest()
+    if expected_sha256 is not None and digest != expected_sha256:
+        raise PatchConflict("Patched content does not match sha256")
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".patch-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+    os.replace(tmp, path)
+    remember_hash(os.path.realpath(path), _signature(os.stat(path)), digest)
+    return len(data), digest
+
+
+class UploadWriter:
+    """Writes a streamed upload to disk without buffering it in memory.
+
+    A full upload goes to a temporary file that replaces `path` atomically on
+    success; an upload at `offset` patches the existing file in place, so
+    large files can be sent as resumable chunks.
+    """
+
+    def __init__(self, path, offset=None):
+        self.path = path
+        self.offset = offset
+        dir_name = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dir_name, exist_ok=True)
+        if offset is None:
+            fd, self.tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".upload-")
+            self.file = os.fdopen(fd, "wb")
+        else:
+            self.tmp_path = None
+            self.file = open(path, "r+b" if os.path.exists(path) else "wb")
+            self.file.seek(offset)
+        self.written = 0
+
+    def write(self, chunk):
+        self.file.write(chunk)
+        self.written += len(chunk)
+
+    def commit(self):
+        self.file.close()
+        if self.tmp_path is not None:
+            os.replace(self.tmp_path, self.path)
+        forget_hash(self.path)
+
+    def abort(self):
+        self.file.close()
+        if self.tmp_path is not None and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def encode_cursor(parts):
+    return base64.urlsafe_b64encode(json.dumps(parts).encode()).decode()
+
+
+def decode_cursor(cursor):
+    parts = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(parts, list) or not all(isinstance(p, str) for p in parts):
+        raise ValueError("Invalid cursor")
+    return parts
+
+
+def walk(root, depth=1, pattern=None, after=None):
+    """Yield (parts, DirEntry) in sorted pre-order, up to `depth` levels deep.
+
+    `parts` is the entry's path relative to `root` as a list of names. The
+    order is the lexicographic order of `parts`, so passing the last `parts`
+    seen as `after` resumes the walk right behind it without rescanning the
+    subtrees that were already returned.
+    """
+    match_path = pattern is not None and "/" in pattern
+
+    def visit(directory, prefix, level, after):
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except (PermissionError, NotADirectoryError, FileNotFoundError):
+            return
+        for entry in entries:
+            resume = None
+            if after:
+                if entry.name < after[0]:
+                    continue
+                if entry.name == after[0]:
+                    resume = after[1:]
+            parts = prefix + [entry.name]
+            if resume is None:
+                name = "/".join(parts) if match_path else entry.name
+                if pattern is None or fnmatch.fnmatch(name, pattern):
+                    yield parts, entry
+            if level + 1 < depth and entry.is_dir(follow_symlinks=False):
+                yield from visit(entry.path, parts, level + 1, resume)
+
+    yield from visit(root, [], 0, after)
+
+
+def entry_info(parts, entry):
+    try:
+        st = entry.stat()
+    except OSError:
+        st = entry.stat(follow_symlinks=False)
+    is_dir = entry.is_dir()
+    return {
+        "name": entry.name,
+        "path": "/".join(parts),
+        "is_dir": is_dir,
+        "size": None if is_dir else st.st_size,
+        "mtime": st.st_mtime,
+        "mode": st.st_mode,
+    }
+
+
+def list_page(root, depth=1, pattern=None, cursor=None, limit=None):
+    """Return (entries, next_cursor) for one page of a listing."""
+    after = decode_cursor(cursor) if cursor else None
+    result = []
+    last = None
+    for parts, entry in walk(root, depth, pattern, after):
+        if limit is not None and len(result) >= limit:
+            return result, encode_cursor(last)
+        result.append(entry_info(parts, entry))
+        last = parts
+    return result, None
@@ -1,50 +1,221 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import PlainTextResponse
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Dict, List, Literal, Optional
+import asyncio
+import base64
+import importlib
+import json
 import os
-import subprocess
-from playwright.async_api import async_playwright
+import time
+from browser import BrowserPool, BrowserPoolFull, DEFAULT_PAGE, DEFAULT_CONTEXT
+from shell import ShellEngine
+from pty_sessions import PtySessionManager, SessionLimit
+from batch import BatchError, run_batch
+import files
+import screenshot
+from search import SearchCache
+from blobs import BlobStore, OutputPolicy, parse_ref
+from manifests import StaticDocument, tool_schema
+from metrics import CONTENT_TYPE, REGISTRY, Gauge, Histogram, MetricsMiddleware, merge, relabel
 
 # Set DISPLAY for Xvfb
 os.environ["DISPLAY"] = ":99"
 
 app = FastAPI(title="Sandbox API")
+shell_engine = ShellEngine()
+shell_sessions = PtySessionManager()
+browser_pool = BrowserPool()
+search_cache = SearchCache()
+# Command output over TOOL_OUTPUT_LIMIT is returned as head and tail; the full text is kept here
+blob_store = BlobStore(os.getenv("SANDBOX_BLOB_DIR", "/tmp/sandbox-blobs"))
+output_policy = OutputPolicy(blob_store)
+
+# Set by serve.py when several workers share one state process for browser pages and shell jobs
+STATE_URL = os.getenv("SANDBOX_STATE_URL")
+if STATE_URL:
+    from proxy import StateProxy, fetch_text, forward_json
+    app.add_middleware(StateProxy, state_url=STATE_URL)
+app.add_middleware(MetricsMiddleware)
+
+# Launch time from serve.py, else this process's import time
+LAUNCHED_AT = float(os.getenv("SANDBOX_LAUNCH_TIME", time.time()))
+startup_seconds = None
+
+# Heavy optional dependencies, imported in the background once the API is serving
+PREWARM = os.getenv("SANDBOX_PREWARM", "1") == "1"
+PREWARM_MODULES = ("playwright.async_api", "duckduckgo_search")
+prewarm_task = None
+
+# With several workers each one pushes its metrics to the state process, which serves them all
+METRICS_PUSH_INTERVAL = float(os.getenv("SANDBOX_METRICS_PUSH_INTERVAL", "5"))
+# worker -> (time of the last push, its rendered metrics); kept by the state process
+worker_metrics = {}
+metrics_task = None
+
+TOOL_SECONDS = Histogram("sandbox_tool_duration_seconds", "Duration of tool calls run through /batch.", ("tool", "status"))
+BROWSER_SECONDS = Histogram("browser_action_duration_seconds", "Duration of browser actions.", ("action",))
+# Owned by the state process when workers forward to it
+STATE_GAUGES = ("shell_jobs_running", "shell_sessions_open", "browser_pages_open")
+Gauge("shell_jobs_running", "Shell commands currently running.",
+      function=lambda: sum(1 for job in shell_engine.jobs.values() if job.status == "running"))
+Gauge("shell_sessions_open", "Open interactive shell sessions.", function=lambda: len(shell_sessions.sessions))
+Gauge("browser_pages_open", "Open browser pages.", function=lambda: len(browser_pool.pages))
+Gauge("search_cache_entries", "Cached search results.", function=lambda: len(search_cache.entries))
+Gauge("sandbox_api_startup_seconds", "Seconds from launch until this process served requests.",
+      function=lambda: startup_seconds if startup_seconds is not None else float("nan"))
 
 class FileInfo(BaseModel):
     name: str
     is_dir: bool
     size: Optional[int] = None
+    path: Optional[str] = None
+    mtime: Optional[float] = None
+    mode: Optional[int] = None
 
 class WriteFileRequest(BaseModel):
+    path: str = Field(description="The file path to write to")
+    content: str = Field(description="The content to write")
+    # Checked by the endpoint (400), so only advertised in the schema
+    encoding: str = Field("text", json_schema_extra={"enum": ["text", "base64"]})
+    append: bool = Field(False, description="Append instead of replacing the file")
+    base_sha256: Optional[str] = Field(None, description="Only write if the file's current content has this hash")
+
+class LineEdit(BaseModel):
+    start: int
+    end: int
+    lines: List[str] = []
+
+class PatchFileRequest(BaseModel):
     path: str
-    content: str
+    base_sha256: str
+    edits: List[LineEdit]
+    sha256: Optional[str] = None
 
 class CommandRequest(BaseModel):
-    command: str
-    timeout: int = 30
+    command: str = Field(description="The bash command to execute")
+    timeout: int = Field(30, description="Timeout in seconds")
+
+class ShellSessionRequest(BaseModel):
+    cwd: Optional[str] = None
+    env: Dict[str, str] = {}
+
+class SessionExecRequest(BaseModel):
+    command: str = Field(description="The bash command to run in the session")
+    timeout: int = Field(30, description="Seconds before the command is interrupted with Ctrl-C")
+    interactive: bool = Field(False, description="Let the command read the terminal (send input via /input); "
+                                                 "otherwise its stdin is /dev/null")
+    session_id: Optional[str] = Field(None, description="Shell session to use; a new one is opened if not given")
+
+class SessionInputRequest(BaseModel):
+    data: str
 
 class BrowserRequest(BaseModel):
-    url: str
+    url: str = Field(description="The URL to navigate to")
+    page_id: str = Field(DEFAULT_PAGE, description="Browser page (tab) to use")
+    context_id: str = Field(DEFAULT_CONTEXT, description="Browser context; pages in one context share cookies")
 
 class ClickRequest(BaseModel):
     selector: str
+    page_id: str = DEFAULT_PAGE
+    context_id: str = DEFAULT_CONTEXT
 
 class TypeRequest(BaseModel):
     selector: str
     text: str
+    page_id: str = DEFAULT_PAGE
+    context_id: str = DEFAULT_CONTEXT
 
 class SearchRequest(BaseModel):
-    query: str
-    max_results: int = 5
+    query: str = Field(description="The search query")
+    max_results: int = Field(5, description="Maximum number of results to return")
+
+# Parameters of the tools served as query strings, for /tools and to validate /batch steps.
+# Unknown keys are rejected, as a misspelled name would otherwise be silently ignored.
+class ListFilesParams(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    path: str = Field(".", description="The directory path to list")
+    depth: int = Field(1, description="How many directory levels to descend")
+    pattern: Optional[str] = Field(None, description="Glob filter on entry names")
+    limit: int = Field(1000, description="Maximum entries to return")
+    cursor: Optional[str] = Field(None, description="Cursor from a previous page")
+
+class ReadFileParams(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    path: str = Field(description="The file path to read")
+    offset: int = Field(0, description="Byte offset to start at (negative counts from the end)")
+    length: Optional[int] = Field(None, description="Maximum number of bytes to read")
+    tail: Optional[int] = Field(None, description="Return only the last N lines")
+    encoding: Literal["text", "base64"] = "text"
+
+class ScreenshotParams(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    page_id: str = Field(DEFAULT_PAGE, description="Browser page (tab) to capture")
+    context_id: str = Field(DEFAULT_CONTEXT, description="Browser context the page belongs to")
+    format: Literal["png", "jpeg", "webp"] = "png"
+    quality: Optional[int] = Field(None, description="JPEG/WebP quality (0-100)")
+    clip: Optional[str] = Field(None, description="Region to capture as x,y,width,height")
+    scale: float = Field(1.0, description="Downscale factor in (0, 1]")
+    full_page: bool = Field(False, description="Capture the full scrollable page")
+
+class DeleteFileParams(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    path: str
+
+class BatchStep(BaseModel):
+    id: str
+    tool: str
+    params: Dict[str, Any] = {}
+    depends_on: List[str] = []
+
+class BatchRequest(BaseModel):
+    steps: List[BatchStep]
+    sequential: bool = False
+    stop_on_error: bool = False
+    max_concurrency: int = 8
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
-
-@app.get("/llms.txt", response_class=PlainTextResponse)
-async def get_llms_txt():
-    content = """# Sheikh-Ai Sandbox API
+    return {"status": "ok", "startup_seconds": startup_seconds}
+
+async def push_metrics():
+    """Send this worker's metrics to the state process; returns all workers' metrics, or None."""
+    # The browser and shell gauges are the state process's to report
+    return await fetch_text(STATE_URL, f"/metrics/workers/{os.getpid()}", method="PUT",
+                            content=REGISTRY.render(exclude=STATE_GAUGES))
+
+async def push_metrics_periodically():
+    while True:
+        await push_metrics()
+        await asyncio.sleep(METRICS_PUSH_INTERVAL)
+
+def aggregated_metrics():
+    # A worker that stopped pushing has exited
+    stale = time.monotonic() - 3 * METRICS_PUSH_INTERVAL
+    for worker, (pushed_at, _) in list(worker_metrics.items()):
+        if pushed_at < stale:
+            del worker_metrics[worker]
+    if not worker_metrics:
+        return REGISTRY.render()
+    return merge([relabel(REGISTRY.render(), worker="state")] + [text for _, text in worker_metrics.values()])
+
+@app.get("/metrics")
+async def metrics():
+    if not STATE_URL:
+        return Response(content=aggregated_metrics(), media_type=CONTENT_TYPE)
+    # A scrape reaches one worker, which answers for all of them through the state process
+    text = await push_metrics()
+    if text is None:
+        text = relabel(REGISTRY.render(exclude=STATE_GAUGES), worker=os.getpid())
+    return Response(content=text, media_type=CONTENT_TYPE)
+
+@app.put("/metrics/workers/{worker}", include_in_schema=False)
+async def report_worker_metrics(worker: str, request: Request):
+    worker_metrics[worker] = (time.monotonic(), relabel((await request.body()).decode(), worker=worker))
+    return Response(content=aggregated_metrics(), media_type=CONTENT_TYPE)
+
+LLMS_TXT = StaticDocument("""# Sheikh-Ai Sandbox API
 
 This API provides a sandboxed Ubuntu environment for AI agents.
 
@@ -57,164 +228,224 @@ This API provides a sandboxed Ubuntu environment for AI agents.
 - /files: CRUD operations on the filesystem.
 - /shell/execute: Bash command execution.
 - /browser: Navigate, screenshot, click, and type.
-"""
-    return content
+""", "text/plain; charset=utf-8")
 
-@app.get("/llms-full.txt", response_class=PlainTextResponse)
-async def get_llms_full_txt():
-    content = """# Sheikh-Ai Sandbox API Documentation
+LLMS_FULL_TXT = StaticDocument("""# Sheikh-Ai Sandbox API Documentation
 
 Detailed documentation of the Sheikh-Ai Sandbox API for LLM consumption.
 
 ## Filesystem Tools
-- GET /files/list?path={path}: Returns a list of files and directories.
-- GET /files/read?path={path}: Returns the text content of a file.
-- POST /files/write: Writes content to a path. Body: {"path": "...", "content": "..."}
+- GET /files/list?path={path}&depth=1&pattern=&limit=1000&cursor=&format=json: Returns files and directories with size, mtime and mode. depth > 1 recurses, pattern is a glob on the name (or relative path if it contains "/"). When more entries remain, the X-Next-Cursor header holds the cursor for the next page. format=ndjson streams one entry per line, ending with {"next_cursor": ...} if the limit was reached.
+- GET /files/read?path={path}&offset=0&length=&tail=&encoding=text: Returns file content as JSON. offset/length select a byte range (negative offset counts from the end), tail=N returns the last N lines, encoding=base64 is binary-safe. Reads are capped at 10 MiB; "truncated" reports when more remains.
+- GET /files/download?path={path}: Streams the raw file; supports HTTP Range requests.
+- POST /files/write: Writes content to a path. Body: {"path": "...", "content": "...", "encoding": "text|base64", "append": false, "base_sha256": null}. With base_sha256 the write only happens (else 412) if the file's current content has that hash. Returns the new content's sha256, except after an append.
+- Whole-file reads return the file's sha256, also as the ETag; a read with a matching If-None-Match returns 304 without a body. Ranged and tail reads carry no hash and ignore If-None-Match.
+- POST /files/patch: Applies line edits instead of rewriting the file. Body: {"path": "...", "base_sha256": "...", "edits": [{"start": 10, "end": 12, "lines": ["new line\\n"]}], "sha256": "..."}. Each edit replaces base lines [start, end), where only \\n ends a line; edits are sorted and refer to the base. Returns 412, writing nothing, if the file is not the base or the result does not hash to sha256.
+- PUT /files/upload?path={path}&offset=: Streams the raw request body (chunked uploads allowed) to a file. Without offset the file is replaced atomically; with offset the body is written at that position, so large files can be sent in resumable pieces.
 - DELETE /files/delete?path={path}: Deletes a file or directory.
 
 ## Shell Tools
 - POST /shell/execute: Executes a bash command. Body: {"command": "...", "timeout": 30}
 - Returns stdout, stderr, and return_code.
+- POST /shell/stream: Same body as /shell/execute; streams Server-Sent Events (start, stdout, stderr, exit) as output arrives. A reader that falls 10000 lines behind (by default) gets a "dropped" event with the number of lines skipped instead; GET /shell/jobs/{X-Job-Id} still has the full output.
+- GET /shell/jobs/{job_id}: Status and output of a running or finished command.
+- Output over 64 KiB (by default) per stream is cut to its head and tail; the result's "spilled" key then gives {"ref", "size"} per field, and GET /blobs/{ref} returns the full text.
+- POST /shell/jobs/{job_id}/cancel?force=false: Terminates a running command (force=true kills it immediately).
+
+## Shell Sessions
+- POST /shell/sessions: Opens a persistent bash on a pseudo-terminal. Body: {"cwd": null, "env": {}}. The working directory, environment and activated virtualenvs carry over between commands.
+- POST /shell/sessions/{session_id}/exec: Runs a command in the session and waits for it. Body: {"command": "...", "timeout": 30, "interactive": false}. Returns output, exit_code and status (completed, timed_out after interrupting the command with Ctrl-C, or exited). Commands read /dev/null unless interactive is true, in which case they read input sent to /input.
+- GET /shell/sessions/{session_id}/output?offset=&wait=0: Output from a byte offset on, plus the offset to pass next time; wait=N waits up to N seconds for new output.
+- POST /shell/sessions/{session_id}/input: Writes raw input, e.g. {"data": "\\u0003"} for Ctrl-C.
+- DELETE /shell/sessions/{session_id}: Closes the session. By default idle sessions are closed after 10 minutes and at most 8 are open at once.
+- GET /shell/sessions: Lists open sessions.
 
 ## Browser Tools
 - POST /browser/goto: Navigates to a URL. Body: {"url": "..."}
-- GET /browser/screenshot: Takes a PNG screenshot and returns the path.
+- GET /browser/screenshot?format=png&quality=&clip=x,y,w,h&scale=1.0&full_page=false&encoding=base64: Takes a screenshot in memory. format is png, jpeg or webp; scale < 1 downscales; encoding=binary returns the raw image instead of base64 JSON. Repeated screenshots of an unchanged page are served from a short-lived cache.
 - POST /browser/click: Clicks an element by selector. Body: {"selector": "..."}
 - POST /browser/type: Fills an input. Body: {"selector": "...", "text": "..."}
+- All browser tools accept an optional page_id (and context_id) to drive separate tabs concurrently; pages sharing a context_id share cookies.
+- GET /browser/pages: Lists open pages.
+- DELETE /browser/pages/{page_id}: Closes a page.
+
+## Batch
+- POST /batch: Runs several tool calls in one request. Body: {"steps": [{"id": "a", "tool": "read_file", "params": {...}, "depends_on": []}], "sequential": false, "stop_on_error": false, "max_concurrency": 8}
+- Tools are those listed in /tools plus delete_file, patch_file, browser_click and browser_type. Steps without dependencies run concurrently; a step runs only after the steps in depends_on succeed (otherwise it is skipped). sequential=true runs steps in the given order.
+- Returns one result per step, in order, with status (success, error or skipped) and duration_ms. Errors carry the status_code and detail the tool's own endpoint would answer; invalid params are a 422 with the validation errors.
 
 ## Environment
 - OS: Ubuntu 22.04
 - Browser: Chromium (Playwright)
 - Display: Xvfb (:99)
 - VNC: Available on port 6080
-"""
-    return content
+""", "text/plain; charset=utf-8")
+
+TOOLS = [
+    ("list_files", "List files and directories in the sandbox", ListFilesParams),
+    ("read_file", "Read the content of a file in the sandbox", ReadFileParams),
+    ("write_file", "Write content to a file in the sandbox", WriteFileRequest),
+    ("execute_command", "Execute a bash command in the sandbox", CommandRequest),
+    ("session_exec", "Run a command in a persistent shell session that keeps cwd, env and activated virtualenvs",
+     SessionExecRequest),
+    ("browser_goto", "Navigate to a URL in the sandbox browser", BrowserRequest),
+    ("browser_screenshot", "Take a screenshot of the current page in the sandbox browser", ScreenshotParams),
+    ("search", "Search the web for information", SearchRequest),
+]
+# Built once from the models above rather than on every request
+TOOLS_JSON = StaticDocument(
+    {"tools": [{"name": name, "description": description, "parameters": tool_schema(model)}
+               for name, description, model in TOOLS]},
+    "application/json",
+)
+
+@app.get("/llms.txt", response_class=PlainTextResponse)
+async def get_llms_txt(request: Request):
+    return LLMS_TXT.response(request)
+
+@app.get("/llms-full.txt", response_class=PlainTextResponse)
+async def get_llms_full_txt(request: Request):
+    return LLMS_FULL_TXT.response(request)
 
 @app.get("/tools")
-async def get_tools():
-    return {
-        "tools": [
-            {
-                "name": "list_files",
-                "description": "List files and directories in the sandbox",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "path": {"type": "string", "description": "The directory path to list"}
-                    }
-                }
-            },
-            {
-                "name": "read_file",
-                "description": "Read the content of a file in the sandbox",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "path": {"type": "string", "description": "The file path to read"}
-                    },
-                    "required": ["path"]
-                }
-            },
-            {
-                "name": "write_file",
-                "description": "Write content to a file in the sandbox",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "path": {"type": "string", "description": "The file path to write to"},
-                        "content": {"type": "string", "description": "The content to write"}
-                    },
-                    "required": ["path", "content"]
-                }
-            },
-            {
-                "name": "execute_command",
-                "description": "Execute a bash command in the sandbox",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "command": {"type": "string", "description": "The bash command to execute"},
-                        "timeout": {"type": "integer", "description": "Timeout in seconds", "default": 30}
-                    },
-                    "required": ["command"]
-                }
-            },
-            {
-                "name": "browser_goto",
-                "description": "Navigate to a URL in the sandbox browser",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "url": {"type": "string", "description": "The URL to navigate to"}
-                    },
-                    "required": ["url"]
-                }
-            },
-            {
-                "name": "browser_screenshot",
-                "description": "Take a screenshot of the current page in the sandbox browser",
-                "parameters": {"type": "object", "properties": {}}
-            },
-            {
-                "name": "search",
-                "description": "Search the web for information",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "query": {"type": "string", "description": "The search query"},
-                        "max_results": {"type": "integer", "description": "Maximum number of results to return", "default": 5}
-                    },
-                    "required": ["query"]
-                }
-            }
-        ]
-    }
+async def get_tools(request: Request):
+    return TOOLS_JSON.response(request)
 
 @app.get("/files/list", response_model=List[FileInfo])
-async def list_files(path: str = "."):
+async def list_files(response: Response, path: str = ".", depth: int = 1, pattern: Optional[str] = None,
+                     cursor: Optional[str] = None, limit: int = 1000, format: str = "json"):
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Path not found")
+    if depth < 1 or limit < 1:
+        raise HTTPException(status_code=400, detail="depth and limit must be positive")
     try:
-        if not os.path.exists(path):
-            raise HTTPException(status_code=404, detail="Path not found")
-        items = os.listdir(path)
-        result = []
-        for item in items:
-            full_path = os.path.join(path, item)
-            is_dir = os.path.isdir(full_path)
-            try:
-                size = os.path.getsize(full_path) if not is_dir else None
-            except OSError:
-                size = None
-            result.append(FileInfo(name=item, is_dir=is_dir, size=size))
-        return result
-    except HTTPException:
-        raise
+        after = files.decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if format == "ndjson":
+        def stream():
+            count = 0
+            last = None
+            for parts, entry in files.walk(path, depth, pattern, after):
+                if count >= limit:
+                    yield json.dumps({"next_cursor": files.encode_cursor(last)}) + "\n"
+                    return
+                yield json.dumps(files.entry_info(parts, entry)) + "\n"
+                count += 1
+                last = parts
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    try:
+        result, next_cursor = await run_in_threadpool(files.list_page, path, depth, pattern, cursor, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return result
 
 @app.get("/files/read")
-async def read_file_api(path: str):
+async def read_file_api(response: Response, path: str, offset: int = 0, length: Optional[int] = None,
+                        tail: Optional[int] = None, encoding: str = "text",
+                        if_none_match: Optional[str] = Header(None)):
     if not os.path.exists(path):
         raise HTTPException(status_code=404, detail="File not found")
     if os.path.isdir(path):
         raise HTTPException(status_code=400, detail="Path is a directory")
+    if encoding not in ("text", "base64"):
+        raise HTTPException(status_code=400, detail="encoding must be text or base64")
+    if (length is not None and length < 0) or (tail is not None and tail < 0):
+        raise HTTPException(status_code=400, detail="length and tail must not be negative")
     try:
-        with open(path, "r") as f:
-            content = f.read()
-        return {"content": content}
+        # Hashing reads the whole file, which ranged and tail reads of big, growing files must not pay for
+        whole = tail is None and offset == 0 and length is None
+        sha256 = await run_in_threadpool(files.content_hash, path) if whole else None
+        # The range and encoding are part of the URL, so the file's hash identifies the response
+        etag = f'"{sha256}"' if sha256 else None
+        if etag and if_none_match and etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers={"ETag": etag})
+        if tail is not None:
+            data, truncated = await run_in_threadpool(files.tail_lines, path, tail)
+            size = os.path.getsize(path)
+            offset = size - len(data)
+        else:
+            data, offset, size, truncated = await run_in_threadpool(files.read_range, path, offset, length)
+        result = {
+            "content": files.encode(data, encoding),
+            "encoding": encoding,
+            "offset": offset,
+            "size": size,
+            "truncated": truncated,
+        }
+        if whole:
+            response.headers["ETag"] = etag
+            result["sha256"] = sha256
+        return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/files/download")
+async def download_file_api(path: str):
+    # FileResponse streams from disk and honours Range requests
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="File not found")
+    if os.path.isdir(path):
+        raise HTTPException(status_code=400, detail="Path is a directory")
+    return FileResponse(path, filename=os.path.basename(path))
+
 @app.post("/files/write")
 async def write_file_api(request: WriteFileRequest):
+    if request.encoding not in ("text", "base64"):
+        raise HTTPException(status_code=400, detail="encoding must be text or base64")
+    if request.base_sha256 is not None:
+        current = await run_in_threadpool(files.content_hash, request.path) if os.path.isfile(request.path) else None
+        if current != request.base_sha256:
+            raise HTTPException(status_code=412, detail="File does not match base_sha256")
     try:
-        dir_name = os.path.dirname(request.path)
-        if dir_name:
-            os.makedirs(dir_name, exist_ok=True)
-        with open(request.path, "w") as f:
-            f.write(request.content)
-        return {"status": "success"}
+        data = files.decode(request.content, request.encoding)
+        written, sha256 = await run_in_threadpool(files.write_bytes, request.path, data, request.append)
+        result = {"status": "success", "bytes_written": written}
+        # Hashing after an append would reread the whole file, so appends return no hash
+        if sha256 is not None:
+            result["sha256"] = sha256
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/files/patch")
+async def patch_file_api(request: PatchFileRequest):
+    if not os.path.isfile(request.path):
+        raise HTTPException(status_code=404, detail="File not found")
+    edits = [edit.model_dump() for edit in request.edits]
+    try:
+        size, sha256 = await run_in_threadpool(
+            files.apply_patch, request.path, request.base_sha256, edits, request.sha256)
+    except files.PatchConflict as e:
+        raise HTTPException(status_code=412, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return {"status": "success", "size": size, "sha256": sha256}
+
+@app.put("/files/upload")
+async def upload_file_api(path: str, request: Request, offset: Optional[int] = None):
+    if os.path.isdir(path):
+        raise HTTPException(status_code=400, detail="Path is a directory")
+    try:
+        writer = await run_in_threadpool(files.UploadWriter, path, offset)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(writer.write, chunk)
+        await run_in_threadpool(writer.commit)
+    except BaseException as e:
+        writer.abort()
+        if isinstance(e, Exception):
+            raise HTTPException(status_code=500, detail=str(e))
+        raise
+    return {"status": "success", "bytes_written": writer.written, "size": os.path.getsize(path)}
 
 @app.delete("/files/delete")
 async def delete_file_api(path: str):
@@ -226,99 +457,341 @@ async def delete_file_api(path: str):
             shutil.rmtree(path)
         else:
             os.remove(path)
+        files.forget_hash(path)
         return {"status": "success"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/shell/execute")
 async def execute_command(request: CommandRequest):
+    job = shell_engine.start(request.command, request.timeout)
     try:
-        process = subprocess.run(
-            request.command,
-            shell=True,
-            capture_output=True,
-            text=True,
-            timeout=request.timeout
-        )
-        return {
-            "stdout": process.stdout,
-            "stderr": process.stderr,
-            "return_code": process.returncode
-        }
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=408, detail="Command timed out")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# Browser state
-state = {
-    "playwright": None,
-    "browser": None,
-    "context": None,
-    "page": None
-}
-
-async def get_page():
-    if state["page"] is None:
-        state["playwright"] = await async_playwright().start()
-        state["browser"] = await state["playwright"].chromium.launch(headless=False)
-        state["context"] = await state["browser"].new_context()
-        state["page"] = await state["context"].new_page()
-    return state["page"]
+        await asyncio.shield(job.task)
+    except asyncio.CancelledError:
+        # The killed job is still winding down; pruning removes it once it has finished
+        await shell_engine.cancel(job, force=True)
+        raise
+    try:
+        if job.status == "timed_out":
+            raise HTTPException(status_code=408, detail="Command timed out")
+        if job.status == "error":
+            raise HTTPException(status_code=500, detail=job.text("stderr"))
+        return {**await run_in_threadpool(job_output, job), "return_code": job.return_code}
+    finally:
+        # Nothing refers to a one-shot job once it has answered, so its output is not retained
+        shell_engine.discard(job)
+
+def job_output(job):
+    """A job's stdout and stderr, compacted by the output policy straight from its output files."""
+    result, spilled = {}, {}
+    for stream in ("stdout", "stderr"):
+        result[stream], info = output_policy.compact_file(
+            lambda offset, n: job.read(stream, offset, n), job.sizes[stream])
+        if info is not None:
+            spilled[stream] = info
+    if spilled:
+        result["spilled"] = spilled
+    return result
+
+@app.post("/shell/stream")
+async def stream_command(request: CommandRequest):
+    job = shell_engine.start(request.command, request.timeout, stream=True)
+
+    async def event_stream():
+        try:
+            yield f"event: start\ndata: {json.dumps(job.info())}\n\n"
+            async for stream, text in job.events():
+                if stream == "exit":
+                    yield f"event: exit\ndata: {json.dumps(job.info())}\n\n"
+                elif stream == "dropped":
+                    yield f"event: dropped\ndata: {json.dumps({'lines': text})}\n\n"
+                else:
+                    yield f"event: {stream}\ndata: {json.dumps({'line': text})}\n\n"
+        finally:
+            # A client that goes away takes its command with it
+            if not job.done:
+                await shell_engine.cancel(job, force=True)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"X-Job-Id": job.id})
+
+@app.get("/shell/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = shell_engine.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {**job.info(), **await run_in_threadpool(job_output, job)}
+
+@app.post("/shell/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, force: bool = False):
+    job = shell_engine.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    await shell_engine.cancel(job, force=force)
+    return job.info()
+
+def get_shell_session(session_id):
+    session = shell_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Shell session not found")
+    return session
+
+@app.post("/shell/sessions")
+async def create_shell_session(request: ShellSessionRequest):
+    if request.cwd is not None and not os.path.isdir(request.cwd):
+        raise HTTPException(status_code=400, detail="cwd is not a directory")
+    try:
+        session = await shell_sessions.create(request.cwd, request.env)
+    except SessionLimit as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return session.info()
+
+@app.get("/shell/sessions")
+async def list_shell_sessions():
+    return {"sessions": [session.info() for session in shell_sessions.sessions.values()]}
+
+@app.post("/shell/sessions/{session_id}/exec")
+async def shell_session_exec(session_id: str, request: SessionExecRequest):
+    session = get_shell_session(session_id)
+    try:
+        result = await session.exec(request.command, request.timeout, request.interactive)
+    except ProcessLookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return await run_in_threadpool(output_policy.apply, {"session_id": session_id, **result})
+
+@app.post("/shell/sessions/{session_id}/input")
+async def shell_session_input(session_id: str, request: SessionInputRequest):
+    session = get_shell_session(session_id)
+    try:
+        session.write(request.data.encode())
+    except ProcessLookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "success", "offset": session.end}
+
+@app.get("/shell/sessions/{session_id}/output")
+async def shell_session_output(session_id: str, offset: Optional[int] = None, wait: float = 0):
+    session = get_shell_session(session_id)
+    if wait > 0 and (offset is None or offset >= session.end):
+        await session.wait_output(session.end if offset is None else offset, min(wait, 30))
+    output, next_offset, dropped = session.read(offset)
+    return {"output": output, "offset": next_offset, "dropped": dropped, "alive": not session.closed}
+
+@app.delete("/shell/sessions/{session_id}")
+async def close_shell_session(session_id: str):
+    session = await shell_sessions.close(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Shell session not found")
+    return {"status": "success"}
+
+async def _session_exec_tool(params):
+    request = SessionExecRequest(**params)
+    if request.session_id is None:
+        request.session_id = (await create_shell_session(ShellSessionRequest()))["session_id"]
+    return await shell_session_exec(request.session_id, request)
+
+@app.get("/blobs/{ref}")
+async def get_blob(ref: str):
+    try:
+        chunks = blob_store.iter(parse_ref(ref))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    return StreamingResponse(chunks, media_type="text/plain; charset=utf-8")
 
 @app.post("/browser/goto")
 async def browser_goto(request: BrowserRequest):
     try:
-        page = await get_page()
-        await page.goto(request.url)
-        return {"status": "success", "url": page.url}
+        async with browser_pool.page(request.page_id, request.context_id) as page:
+            screenshot.changed(request.page_id)
+            with BROWSER_SECONDS.time(action="goto"):
+                await page.goto(request.url)
+            return {"status": "success", "url": page.url, "page_id": request.page_id}
+    except BrowserPoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/browser/screenshot")
-async def browser_screenshot():
+async def browser_screenshot(
+    page_id: str = DEFAULT_PAGE,
+    context_id: str = DEFAULT_CONTEXT,
+    format: str = "png",
+    quality: Optional[int] = None,
+    clip: Optional[str] = None,
+    scale: float = 1.0,
+    full_page: bool = False,
+    encoding: str = "base64",
+):
+    if format not in screenshot.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be png, jpeg or webp")
+    if encoding not in ("base64", "binary"):
+        raise HTTPException(status_code=400, detail="encoding must be base64 or binary")
+    if not 0 < scale <= 1:
+        raise HTTPException(status_code=400, detail="scale must be in (0, 1]")
+    if quality is not None and not 0 <= quality <= 100:
+        raise HTTPException(status_code=400, detail="quality must be between 0 and 100")
+    if clip is not None:
+        try:
+            clip = tuple(float(v) for v in clip.split(","))
+        except ValueError:
+            clip = ()
+        if len(clip) != 4:
+            raise HTTPException(status_code=400, detail="clip must be x,y,width,height")
     try:
-        page = await get_page()
-        screenshot_path = "screenshot.png"
-        await page.screenshot(path=screenshot_path)
-        return {"status": "success", "path": screenshot_path}
+        async with browser_pool.page(page_id, context_id) as page:
+            with BROWSER_SECONDS.time(action="screenshot"):
+                data, cached = await screenshot.capture(page, page_id, format, quality, clip, scale, full_page)
+    except BrowserPoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    media_type = screenshot.MEDIA_TYPES[format]
+    if encoding == "binary":
+        return Response(content=data, media_type=media_type, headers={"X-Screenshot-Cache": "hit" if cached else "miss"})
+    return {
+        "status": "success",
+        "media_type": media_type,
+        "cached": cached,
+        "data": base64.b64encode(data).decode()
+    }
 
 @app.post("/browser/click")
 async def browser_click(request: ClickRequest):
     try:
-        page = await get_page()
-        await page.click(request.selector)
-        return {"status": "success"}
+        async with browser_pool.page(request.page_id, request.context_id) as page:
+            screenshot.changed(request.page_id)
+            with BROWSER_SECONDS.time(action="click"):
+                await page.click(request.selector)
+            return {"status": "success"}
+    except BrowserPoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/browser/type")
 async def browser_type(request: TypeRequest):
     try:
-        page = await get_page()
-        await page.fill(request.selector, request.text)
-        return {"status": "success"}
+        async with browser_pool.page(request.page_id, request.context_id) as page:
+            screenshot.changed(request.page_id)
+            with BROWSER_SECONDS.time(action="type"):
+                await page.fill(request.selector, request.text)
+            return {"status": "success"}
+    except BrowserPoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/browser/pages")
+async def browser_pages():
+    return {"pages": browser_pool.list_pages(), "max_pages": browser_pool.max_pages}
+
+@app.delete("/browser/pages/{page_id}")
+async def browser_close_page(page_id: str):
+    if not await browser_pool.close_page(page_id):
+        raise HTTPException(status_code=404, detail="Page not found")
+    return {"status": "success"}
+
 @app.post("/search")
 async def search_web(request: SearchRequest):
     try:
-        from duckduckgo_search import DDGS
-        with DDGS() as ddgs:
-            results = list(ddgs.text(request.query, max_results=request.max_results))
-        return {"status": "success", "results": results}
+        results, cached = await search_cache.search(request.query, request.max_results)
+        return {"status": "success", "results": results, "cached": cached}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/search/cache")
+async def search_cache_metrics():
+    return search_cache.metrics()
+
+@app.delete("/search/cache")
+async def search_cache_clear():
+    search_cache.clear()
+    return {"status": "success"}
+
+async def _list_files_tool(params):
+    return await list_files(Response(), **ListFilesParams(**params).model_dump(), format="json")
+
+async def _screenshot_tool(params):
+    return await browser_screenshot(**ScreenshotParams(**params).model_dump(), encoding="base64")
+
+# Tools that can run inside /batch, keyed by the names used in /tools
+BATCH_TOOLS = {
+    "list_files": _list_files_tool,
+    "read_file": lambda params: read_file_api(Response(), **ReadFileParams(**params).model_dump(), if_none_match=None),
+    "write_file": lambda params: write_file_api(WriteFileRequest(**params)),
+    "patch_file": lambda params: patch_file_api(PatchFileRequest(**params)),
+    "delete_file": lambda params: delete_file_api(**DeleteFileParams(**params).model_dump()),
+    "execute_command": lambda params: execute_command(CommandRequest(**params)),
+    "session_exec": _session_exec_tool,
+    "browser_goto": lambda params: browser_goto(BrowserRequest(**params)),
+    "browser_screenshot": _screenshot_tool,
+    "browser_click": lambda params: browser_click(ClickRequest(**params)),
+    "browser_type": lambda params: browser_type(TypeRequest(**params)),
+    "search": lambda params: search_web(SearchRequest(**params)),
+}
+
+@app.post("/batch")
+async def batch_execute(request: BatchRequest):
+    if request.max_concurrency < 1:
+        raise HTTPException(status_code=400, detail="max_concurrency must be positive")
+    try:
+        results = await run_batch(
+            request.steps,
+            BATCH_TOOLS,
+            sequential=request.sequential,
+            stop_on_error=request.stop_on_error,
+            max_concurrency=request.max_concurrency,
+        )
+    except BatchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    for result in results:
+        if result["status"] != "skipped":
+            TOOL_SECONDS.observe(result["duration_ms"] / 1000, tool=result["tool"], status=result["status"])
+    return {"status": "success", "results": results}
+
+if STATE_URL:
+    async def _forward_session_exec(params):
+        request = SessionExecRequest(**params)
+        if request.session_id is None:
+            request.session_id = (await forward_json(STATE_URL, "POST", "/shell/sessions", json={}))["session_id"]
+        return await forward_json(STATE_URL, "POST", f"/shell/sessions/{request.session_id}/exec",
+                                  json=request.model_dump())
+
+    # Browser tools and shell sessions run in the state process, which owns the pages and sessions
+    BATCH_TOOLS.update({
+        "session_exec": _forward_session_exec,
+        "browser_goto": lambda params: forward_json(STATE_URL, "POST", "/browser/goto", json=params),
+        "browser_screenshot": lambda params: forward_json(
+            STATE_URL, "GET", "/browser/screenshot", params={**params, "encoding": "base64"}),
+        "browser_click": lambda params: forward_json(STATE_URL, "POST", "/browser/click", json=params),
+        "browser_type": lambda params: forward_json(STATE_URL, "POST", "/browser/type", json=params),
+    })
+
+async def prewarm():
+    # Let the server start accepting requests before spending CPU on imports
+    await asyncio.sleep(0)
+    for module in PREWARM_MODULES:
+        try:
+            await run_in_threadpool(importlib.import_module, module)
+        except ImportError:
+            pass
+
+@app.on_event("startup")
+async def startup_event():
+    global startup_seconds, prewarm_task, metrics_task
+    startup_seconds = time.time() - LAUNCHED_AT
+    print(f"Sandbox API process {os.getpid()} ready {startup_seconds:.2f}s after launch", flush=True)
+    if PREWARM:
+        prewarm_task = asyncio.create_task(prewarm())
+    if STATE_URL:
+        metrics_task = asyncio.create_task(push_metrics_periodically())
+
 @app.on_event("shutdown")
 async def shutdown_event():
-    if state["browser"]:
-        await state["browser"].close()
-    if state["playwright"]:
-        await state["playwright"].stop()
+    for task in (prewarm_task, metrics_task):
+        if task is not None:
+            task.cancel()
+    await shell_engine.shutdown()
+    await shell_sessions.shutdown()
+    await browser_pool.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,54 @@
+import hashlib
+import json
+from fastapi import Request, Response
+
+
+def tool_schema(model):
+    """JSON schema for a tool's parameters, built from its Pydantic model."""
+
+    def clean(node):
+        if isinstance(node, dict):
+            node = {k: clean(v) for k, v in node.items() if k != "title"}
+            if "default" in node and node["default"] is None:
+                del node["default"]
+            # Optional[X] is just X to a tool caller: leaving it out means "not set"
+            options = [option for option in node.get("anyOf", []) if option != {"type": "null"}]
+            if "anyOf" in node and len(options) == 1:
+                del node["anyOf"]
+                node.update(options[0])
+            return node
+        if isinstance(node, list):
+            return [clean(item) for item in node]
+        return node
+
+    schema = clean(model.model_json_schema())
+    parameters = {"type": "object", "properties": schema.get("properties", {})}
+    if schema.get("required"):
+        parameters["required"] = schema["required"]
+    return parameters
+
+
+class StaticDocument:
+    """A response body computed once, served with an ETag.
+
+    Requests whose If-None-Match matches the ETag get an empty 304.
+    """
+
+    def __init__(self, content, media_type):
+        if not isinstance(content, bytes):
+            content = content.encode() if isinstance(content, str) else json.dumps(content).encode()
+        self.content = content
+        self.media_type = media_type
+        self.etag = '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+        self.headers = {"ETag": self.etag, "Cache-Control": "no-cache"}
+
+    def not_modified(self, if_none_match):
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or any(tag.removeprefix("W/") == self.etag for tag in tags)
+
+    def response(self, request: Request):
+        if self.not_modified(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=self.headers)
+        return Response(content=self.content, media_type=self.media_type, headers=self.headers)
@@ -0,0 +1,249 @@
+"""Minimal Prometheus-style metrics, shared by the sandbox API and the main server.
+
+Only the standard library is used so the module can ship in the sandbox
+image as-is. Metrics render in the Prometheus text exposition format.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value != value:
+        return "NaN"
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self, exclude=()):
+        lines = []
+        for metric in self.metrics.values():
+            if metric.name in exclude:
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def relabel(text, **labels):
+    """Rendered metrics `text` with `labels` added to every sample."""
+    extra = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    lines = []
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            brace, space = line.find("{"), line.find(" ")
+            if brace != -1 and brace < space:
+                # Label values may hold spaces and braces, but the sample value after them cannot
+                close = line.rfind("}")
+                line = f"{line[:close]},{extra}{line[close:]}"
+            else:
+                line = f"{line[:space]}{{{extra}}}{line[space:]}"
+        lines.append(line + "\n")
+    return "".join(lines)
+
+
+def merge(texts):
+    """Rendered metrics from several processes as one text, with one HELP and TYPE per metric.
+
+    The samples of each metric are grouped under its first HELP and TYPE
+    lines, so the texts must label their samples apart (see `relabel`).
+    """
+    families = {}
+    for index, text in enumerate(texts):
+        family = None
+        for line in text.splitlines():
+            if line.startswith("# "):
+                name = (line.split(" ", 3) + [""])[2]
+                family = families.setdefault(name, ([], [], index))
+                if family[2] == index:
+                    family[0].append(line + "\n")
+            elif line and family is not None:
+                family[1].append(line + "\n")
+    return "".join("".join(header) + "".join(samples) for header, samples, _ in families.values())
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        registry.register(self)
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Metric):
+    """A value that goes up and down.
+
+    `function`, when given, is called at scrape time instead; it returns a
+    number, or a dict of label-value tuples to numbers for labelled gauges.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, function=None):
+        super().__init__(name, help, labelnames, registry)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                return []
+            items = value.items() if isinstance(value, dict) else [((), value)]
+        else:
+            with self.lock:
+                items = list(self.values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, then sum
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self.lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self.values.items()]
+        lines = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds", "Time until the response starts, by route.", ("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being handled.", ("method",))
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by route template.
+
+    Latency is measured until the response starts, so long-lived streams
+    (SSE) report their time to first byte; they stay in the in-flight gauge
+    until they finish.
+    """
+
+    def __init__(self, app, duration=HTTP_DURATION, in_flight=HTTP_IN_FLIGHT):
+        self.app = app
+        self.duration = duration
+        self.in_flight = in_flight
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        start = time.perf_counter()
+        started = False
+
+        def observe(status):
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.duration.observe(time.perf_counter() - start, method=method, route=route, status=str(status))
+
+        async def send_wrapper(message):
+            nonlocal started
+            if message["type"] == "http.response.start" and not started:
+                started = True
+                observe(message["status"])
+            await send(message)
+
+        self.in_flight.inc(method=method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not started:
+                observe(500)
+            raise
+        finally:
+            self.in_flight.dec(method=method)
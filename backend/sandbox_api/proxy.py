@@ -0,0 +1,118 @@
+import asyncio
+import json
+import httpx
+from fastapi import HTTPException
+
+# Endpoints whose state (browser pages, shell jobs and sessions) lives in one process
+STATEFUL_PREFIXES = ("/browser/", "/shell/stream", "/shell/jobs/", "/shell/sessions")
+HOP_BY_HOP = {b"host", b"connection", b"keep-alive", b"transfer-encoding", b"upgrade", b"content-length"}
+# Set again by the worker's own server
+SERVER_HEADERS = {b"date", b"server"}
+
+_client = None
+
+
+def state_client(state_url):
+    global _client
+    if _client is None:
+        # No read timeout: SSE streams and slow page loads stay open as long as the state process needs
+        _client = httpx.AsyncClient(base_url=state_url, timeout=httpx.Timeout(None, connect=5.0))
+    return _client
+
+
+async def forward_json(state_url, method, path, **kwargs):
+    """Call the state process and return its JSON body, raising HTTPException on errors."""
+    try:
+        response = await state_client(state_url).request(method, path, **kwargs)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=503, detail=f"State process unavailable: {e}")
+    if response.status_code >= 400:
+        raise HTTPException(status_code=response.status_code, detail=response.json().get("detail"))
+    return response.json()
+
+
+async def fetch_text(state_url, path, method="GET", content=None):
+    """Request a text body from the state process; None when it is unavailable."""
+    try:
+        response = await state_client(state_url).request(method, path, content=content)
+    except httpx.HTTPError:
+        return None
+    return response.text if response.status_code == 200 else None
+
+
+class ProxiedRoute:
+    def __init__(self, prefix):
+        self.path = prefix + "*"
+
+
+class StateProxy:
+    """ASGI middleware forwarding stateful endpoints to the state process.
+
+    With several API workers, browser pages and shell jobs must live in a
+    single process so follow-up requests find them. Requests under
+    STATEFUL_PREFIXES are streamed to that process unchanged; everything
+    else is served by the worker itself.
+    """
+
+    def __init__(self, app, state_url, prefixes=STATEFUL_PREFIXES):
+        self.app = app
+        self.state_url = state_url
+        self.prefixes = prefixes
+
+    async def __call__(self, scope, receive, send):
+        prefix = next((p for p in self.prefixes if scope.get("path", "").startswith(p)), None)
+        if scope["type"] != "http" or prefix is None:
+            await self.app(scope, receive, send)
+            return
+        scope["route"] = ProxiedRoute(prefix)
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        client = state_client(self.state_url)
+        request = client.build_request(
+            scope["method"],
+            scope["path"] + ("?" + scope["query_string"].decode() if scope["query_string"] else ""),
+            headers=[(k, v) for k, v in scope["headers"] if k not in HOP_BY_HOP],
+            content=body,
+        )
+        try:
+            response = await client.send(request, stream=True)
+        except httpx.HTTPError as e:
+            await send({"type": "http.response.start", "status": 503,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body",
+                        "body": json.dumps({"detail": f"State process unavailable: {e}"}).encode()})
+            return
+        async def relay():
+            await send({
+                "type": "http.response.start",
+                "status": response.status_code,
+                "headers": [(k, v) for k, v in response.headers.raw
+                            if k.lower() not in HOP_BY_HOP and k.lower() not in SERVER_HEADERS],
+            })
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def disconnected():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        # Once the client is gone the server's send() just returns, so watch for the disconnect
+        # like Starlette's StreamingResponse does rather than draining upstream to its end
+        tasks = [asyncio.ensure_future(relay()), asyncio.ensure_future(disconnected())]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            if tasks[0] in done:
+                tasks[0].result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Closing upstream tells the state process the client went away (e.g. cancels a streamed command)
+            await response.aclose()
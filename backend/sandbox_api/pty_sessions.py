@@ -0,0 +1,274 @@
+import asyncio
+import os
+import pty
+import re
+import shlex
+import signal
+import tempfile
+import termios
+import time
+import uuid
+
+MAX_SESSIONS = int(os.getenv("SHELL_MAX_SESSIONS", "8"))
+IDLE_TIMEOUT = float(os.getenv("SHELL_SESSION_IDLE_TIMEOUT", "600"))
+BUFFER_BYTES = int(os.getenv("SHELL_SESSION_BUFFER_BYTES", str(1 << 20)))
+REAP_INTERVAL = 10
+CLOSE_GRACE = 1.0
+INTERRUPT = b"\x03"
+MARKER = re.compile(rb"\n__sandbox_exit_[0-9a-f]{32}__:-?\d+\n")
+PARTIAL_MARKER = b"\n__sandbox_exit_"
+
+
+class SessionLimit(Exception):
+    pass
+
+
+def _complete(data):
+    """Length of `data` without a trailing, incomplete UTF-8 sequence."""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 != 0x80:  # a lead byte or ASCII
+            needed = 2 if byte >= 0xC0 else 1
+            needed = 3 if byte >= 0xE0 else needed
+            needed = 4 if byte >= 0xF0 else needed
+            return len(data) - back if back < needed else len(data)
+    return len(data)
+
+
+class PtySession:
+    """A long-lived bash on a pseudo-terminal.
+
+    Working directory, environment, shell variables and activated
+    virtualenvs persist between commands, and programs see a terminal.
+    Output is kept in a ring buffer of `BUFFER_BYTES` addressed by absolute
+    byte offsets, so readers can poll for what is new; bytes older than the
+    buffer are dropped. `exec` runs one command at a time and returns its
+    output and exit code.
+
+    Commands are not typed at the terminal, whose line discipline cuts lines
+    at about 4 KiB: `exec` writes each one to a file and sources it, so only
+    a short line goes through the tty.
+    """
+
+    def __init__(self, cwd=None, env=None):
+        self.id = uuid.uuid4().hex
+        self.cwd = cwd
+        self.env = env or {}
+        self.process = None
+        self.master = None
+        self.buffer = bytearray()
+        self.start = 0  # offset of buffer[0]
+        self.changed = asyncio.Condition()
+        self.lock = asyncio.Lock()
+        self.created_at = self.last_used = time.time()
+        self.closed = False
+
+    @property
+    def end(self):
+        return self.start + len(self.buffer)
+
+    async def open(self):
+        self.master, slave = pty.openpty()
+        # No echo of what is typed and plain "\n" line endings: output is just what commands print
+        attrs = termios.tcgetattr(slave)
+        attrs[1] &= ~termios.ONLCR
+        attrs[3] &= ~termios.ECHO
+        termios.tcsetattr(slave, termios.TCSANOW, attrs)
+        env = {**os.environ, "PS1": "", "PS2": "", "TERM": "dumb", "HISTFILE": "/dev/null", **self.env}
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                "bash", "--noediting", "--noprofile", "--norc", "-i",
+                stdin=slave, stdout=slave, stderr=slave, cwd=self.cwd, env=env, start_new_session=True,
+            )
+        except Exception:
+            os.close(self.master)
+            raise
+        finally:
+            os.close(slave)
+        asyncio.get_running_loop().add_reader(self.master, self._on_output)
+
+    def _on_output(self):
+        try:
+            data = os.read(self.master, 65536)
+        except OSError:
+            data = b""
+        if not data:
+            # The shell exited
+            asyncio.get_running_loop().remove_reader(self.master)
+            self.closed = True
+        self.buffer.extend(data)
+        if len(self.buffer) > BUFFER_BYTES:
+            dropped = len(self.buffer) - BUFFER_BYTES
+            del self.buffer[:dropped]
+            self.start += dropped
+        asyncio.ensure_future(self._notify())
+
+    async def _notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    def info(self):
+        return {
+            "session_id": self.id,
+            "pid": self.process.pid if self.process else None,
+            "alive": not self.closed,
+            "offset": self.end,
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+        }
+
+    def write(self, data):
+        if self.closed:
+            raise ProcessLookupError("Shell session has exited")
+        self.last_used = time.time()
+        os.write(self.master, data)
+
+    def read(self, offset=None):
+        """Returns (text, next_offset, dropped) for the output from `offset` on.
+
+        Offsets count raw bytes; the exit markers `exec` uses are left out of
+        the text.
+        """
+        self.last_used = time.time()
+        offset = self.start if offset is None else offset
+        dropped = max(self.start - offset, 0)
+        data = bytes(self.buffer[max(offset - self.start, 0):])
+        # Hold back a marker that has not fully arrived, and a split character
+        partial = data.rfind(PARTIAL_MARKER)
+        if partial != -1 and data.find(b"\n", partial + 1) == -1:
+            data = data[:partial]
+        data = data[:_complete(data)]
+        return MARKER.sub(b"", data).decode(errors="replace"), max(offset, self.start) + len(data), dropped
+
+    async def wait_output(self, offset, timeout):
+        """Wait up to `timeout` seconds for output past `offset`."""
+        async with self.changed:
+            try:
+                await asyncio.wait_for(self.changed.wait_for(lambda: self.end > offset or self.closed), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def exec(self, command, timeout=30, interactive=False):
+        """Run a command in the session.
+
+        The command's stdin is /dev/null, so one that reads input fails
+        instead of waiting for the timeout; with `interactive` it reads the
+        terminal, and input is sent with `write`.
+
+        Returns {"output", "exit_code", "status", "dropped"}; status is
+        "completed", "timed_out" (the command was interrupted with Ctrl-C and
+        the session stays usable) or "exited" (the shell itself ended).
+        """
+        async with self.lock:
+            fd, script = tempfile.mkstemp(prefix="sandbox-session-", suffix=".sh")
+            with os.fdopen(fd, "w") as f:
+                f.write(command + "\n")
+            try:
+                return await self._exec(script, timeout, interactive)
+            finally:
+                # bash reads a sourced file whole before running it
+                os.unlink(script)
+
+    async def _exec(self, script, timeout, interactive):
+        token = f"__sandbox_exit_{uuid.uuid4().hex}__"
+        marker = f"\n{token}:".encode()
+        begin = self.end
+        stdin = "" if interactive else " </dev/null"
+        # One line: sourcing keeps cd/export, and the marker reports $? once the command finishes
+        self.write(f". {shlex.quote(script)}{stdin}; printf '\\n{token}:%d\\n' $?\n".encode())
+        deadline = time.time() + timeout
+        status, exit_code = "completed", None
+        while True:
+            at = self.buffer.find(marker, max(begin - self.start, 0))
+            if at != -1 and self.buffer.find(b"\n", at + len(marker)) != -1:
+                line_end = self.buffer.find(b"\n", at + len(marker))
+                exit_code = int(self.buffer[at + len(marker):line_end])
+                end = self.start + at
+                break
+            if self.closed:
+                status, end = "exited", self.end
+                break
+            if time.time() >= deadline:
+                # Ctrl-C stops the command and bash drops the rest of the line, marker included
+                self.write(INTERRUPT)
+                await asyncio.sleep(0.1)
+                status, end = "timed_out", self.end
+                break
+            await self.wait_output(self.end, deadline - time.time())
+        self.last_used = time.time()
+        output = bytes(self.buffer[max(begin - self.start, 0):end - self.start])
+        return {
+            "output": output.decode(errors="replace"),
+            "exit_code": exit_code,
+            "status": status,
+            "dropped": max(self.start - begin, 0),
+        }
+
+    async def close(self):
+        if self.master is None:
+            return
+        if not self.closed:
+            asyncio.get_running_loop().remove_reader(self.master)
+            self.closed = True
+        if self.process.returncode is None:
+            # Interactive bash ignores SIGTERM; SIGHUP makes it exit and pass the hangup to its jobs
+            for sig in (signal.SIGHUP, signal.SIGKILL):
+                try:
+                    os.killpg(self.process.pid, sig)
+                except ProcessLookupError:
+                    break
+                try:
+                    await asyncio.wait_for(self.process.wait(), CLOSE_GRACE)
+                    break
+                except asyncio.TimeoutError:
+                    pass
+        os.close(self.master)
+        self.master = None
+        await self._notify()
+
+
+class PtySessionManager:
+    def __init__(self, max_sessions=MAX_SESSIONS, idle_timeout=IDLE_TIMEOUT):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.reaper = None
+
+    async def create(self, cwd=None, env=None):
+        await self.reap()
+        if len(self.sessions) >= self.max_sessions:
+            raise SessionLimit(f"At most {self.max_sessions} shell sessions can be open")
+        session = PtySession(cwd, env)
+        await session.open()
+        self.sessions[session.id] = session
+        if self.reaper is None or self.reaper.done():
+            self.reaper = asyncio.create_task(self._reap_loop())
+        return session
+
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+
+    async def close(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            await session.close()
+        return session
+
+    async def reap(self):
+        """Close sessions idle for longer than `idle_timeout` and ones whose shell exited."""
+        now = time.time()
+        for session_id, session in list(self.sessions.items()):
+            idle = now - session.last_used > self.idle_timeout and not session.lock.locked()
+            if idle or session.closed:
+                await self.close(session_id)
+
+    async def _reap_loop(self):
+        while self.sessions:
+            await asyncio.sleep(min(REAP_INTERVAL, self.idle_timeout))
+            await self.reap()
+
+    async def shutdown(self):
+        if self.reaper is not None:
+            self.reaper.cancel()
+        for session_id in list(self.sessions):
+            await self.close(session_id)
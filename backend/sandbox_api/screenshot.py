@@ -0,0 +1,111 @@
+import base64
+import time
+import weakref
+from collections import OrderedDict
+
+CACHE_TTL = 2.0
+CACHE_SIZE = 32
+
+# Counts DOM mutations so an unchanged page can be detected without capturing it
+MUTATION_TRACKER = """
+(() => {
+    window.__sheikhMutations = 0;
+    const observe = () => new MutationObserver(() => { window.__sheikhMutations++; })
+        .observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    if (document.documentElement) observe();
+    else document.addEventListener("DOMContentLoaded", observe);
+})();
+"""
+
+PAGE_STATE = """
+() => [
+    location.href, window.__sheikhMutations, window.scrollX, window.scrollY,
+    window.innerWidth, window.innerHeight, window.devicePixelRatio,
+]
+"""
+
+MEDIA_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+class ScreenshotCache:
+    """Tiny TTL cache for screenshots of pages whose state has not changed."""
+
+    def __init__(self, ttl=CACHE_TTL, size=CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, data):
+        self.entries[key] = (time.monotonic(), data)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+cache = ScreenshotCache()
+_cdp_sessions = weakref.WeakKeyDictionary()
+# Per page, bumped by goto/click/type: the MutationObserver misses property changes such as an input's value
+_actions = {}
+
+
+def changed(page_id):
+    """Mark a page as changed by an action, so its cached screenshots are not served again."""
+    _actions[page_id] = _actions.get(page_id, 0) + 1
+
+
+async def _cdp(page):
+    session = _cdp_sessions.get(page)
+    if session is None:
+        session = _cdp_sessions[page] = await page.context.new_cdp_session(page)
+    return session
+
+
+async def capture(page, page_id, format="png", quality=None, clip=None, scale=1.0, full_page=False):
+    """Capture a screenshot in memory via the DevTools protocol.
+
+    `clip` is an (x, y, width, height) tuple in CSS pixels; `scale` < 1
+    downscales the image. Returns (bytes, cached).
+    """
+    if format not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported screenshot format: {format}")
+    options = (format, quality, clip, scale, full_page)
+    state = await page.evaluate(PAGE_STATE)
+    # Without the mutation counter we cannot tell whether the page changed
+    key = (page_id, _actions.get(page_id, 0), *state, *options) if state[1] is not None else None
+    if key is not None:
+        data = cache.get(key)
+        if data is not None:
+            return data, True
+
+    session = await _cdp(page)
+    params = {"format": format}
+    if quality is not None and format != "png":
+        params["quality"] = quality
+    if clip is None and (full_page or scale != 1.0):
+        if full_page:
+            metrics = await session.send("Page.getLayoutMetrics")
+            size = metrics["cssContentSize"]
+            clip = (0, 0, size["width"], size["height"])
+        else:
+            # Viewport clips are given in page coordinates, so offset by the scroll position
+            clip = (state[2], state[3], state[4], state[5])
+    if clip is not None:
+        x, y, width, height = clip
+        params["clip"] = {"x": x, "y": y, "width": width, "height": height, "scale": scale}
+    if full_page:
+        params["captureBeyondViewport"] = True
+    result = await session.send("Page.captureScreenshot", params)
+    data = base64.b64decode(result["data"])
+    if key is not None:
+        cache.put(key, data)
+    return data, False
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "900"))
+CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "256"))
+CACHE_PATH = os.getenv("SEARCH_CACHE_PATH") or None
+
+
+class DuckDuckGoProvider:
+    def __init__(self):
+        self.ddgs = None
+
+    def search(self, query, max_results):
+        if self.ddgs is None:
+            # Imported on first search (or by the startup prewarm), not at API import
+            from duckduckgo_search import DDGS
+            self.ddgs = DDGS
+        with self.ddgs() as ddgs:
+            return list(ddgs.text(query, max_results=max_results))
+
+
+def normalize(query):
+    return " ".join(query.lower().split())
+
+
+class SearchCache:
+    """TTL + LRU cache in front of a search provider.
+
+    Entries are keyed by normalized query and `max_results`; the provider
+    sees the query as typed. Concurrent identical searches share one
+    provider call, which a cancelled caller leaves running for the rest.
+    Failures are not cached.
+    With `path` set, entries are saved to a JSON file and reloaded on start.
+    The provider is any object with a blocking `search(query, max_results)`.
+    """
+
+    def __init__(self, provider=None, ttl=CACHE_TTL, size=CACHE_SIZE, path=CACHE_PATH):
+        self.provider = provider or DuckDuckGoProvider()
+        self.ttl = ttl
+        self.size = size
+        self.path = path
+        self.entries = OrderedDict()
+        self.inflight = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0, "evictions": 0, "save_errors": 0}
+        # Saves run on executor threads, one at a time; a snapshot older than the saved one is dropped
+        self.save_lock = threading.Lock()
+        self.snapshots = 0
+        self.saved = 0
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+        except ValueError:
+            return
+        now = time.time()
+        for query, max_results, stored_at, results in saved:
+            if now - stored_at <= self.ttl:
+                self.entries[(query, max_results)] = (stored_at, results)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def _save(self, snapshot, number):
+        dir_name = os.path.dirname(self.path) or "."
+        with self.save_lock:
+            if number < self.saved:
+                return
+            self.saved = number
+            os.makedirs(dir_name, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=dir_name, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp, self.path)
+            except BaseException:
+                os.remove(tmp)
+                raise
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def _put(self, key, results):
+        self.entries[key] = (time.time(), results)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    async def search(self, query, max_results=5):
+        """Return (results, cached)."""
+        # The normalized query is only the cache key; the provider gets what was typed
+        key = (normalize(query), max_results)
+        results = self._get(key)
+        if results is not None:
+            self.stats["hits"] += 1
+            return results, True
+        task = self.inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(task), True
+        self.stats["misses"] += 1
+        # Its own task, so a caller that is cancelled does not cancel the search for the others waiting on it
+        task = self.inflight[key] = asyncio.ensure_future(self._fetch(key, query, max_results))
+        # Failures reach whoever is still waiting; don't warn when nobody is
+        task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return await asyncio.shield(task), False
+
+    async def _fetch(self, key, query, max_results):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(None, self.provider.search, query, max_results)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            del self.inflight[key]
+        self._put(key, results)
+        if self.path:
+            snapshot = [[q, n, stored_at, r] for (q, n), (stored_at, r) in self.entries.items()]
+            self.snapshots += 1
+            try:
+                await loop.run_in_executor(None, self._save, snapshot, self.snapshots)
+            except OSError:
+                # The results are good; only persisting them failed
+                self.stats["save_errors"] += 1
+        return results
+
+    def metrics(self):
+        return {**self.stats, "entries": len(self.entries), "size": self.size, "ttl": self.ttl}
+
+    def clear(self):
+        self.entries.clear()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
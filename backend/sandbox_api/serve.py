@@ -0,0 +1,78 @@
+"""Launch the sandbox API.
+
+    python serve.py            # production: no reloader, uvloop/httptools, several workers
+    python serve.py --reload   # development: one process that reloads on code changes
+
+In production with more than one worker, a single state process on
+127.0.0.1:SANDBOX_STATE_PORT owns the browser and shell jobs, and the
+workers on SANDBOX_API_PORT forward those endpoints to it. File, search and
+one-shot shell requests are served by the workers directly. Workers also push
+their metrics to the state process, so /metrics on any worker covers them all.
+"""
+import os
+import subprocess
+import sys
+import time
+import httpx
+import uvicorn
+
+HOST = os.getenv("SANDBOX_API_HOST", "0.0.0.0")
+PORT = int(os.getenv("SANDBOX_API_PORT", "8080"))
+STATE_PORT = int(os.getenv("SANDBOX_STATE_PORT", "8090"))
+WORKERS = int(os.getenv("SANDBOX_API_WORKERS", str(min(os.cpu_count() or 1, 4))))
+STATE_READY_TIMEOUT = 30
+
+
+def server_options():
+    # uvloop and httptools when installed; "auto" falls back to asyncio and h11
+    return {"loop": "auto", "http": "auto", "access_log": False, "timeout_graceful_shutdown": 10}
+
+
+def start_state_process(env):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(STATE_PORT),
+         "--loop", "auto", "--http", "auto", "--no-access-log"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+    deadline = time.time() + STATE_READY_TIMEOUT
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"State process exited with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{STATE_PORT}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("State process did not become healthy")
+
+
+def main():
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    launched_at = time.time()
+    os.environ.setdefault("SANDBOX_LAUNCH_TIME", str(launched_at))
+
+    if "--reload" in sys.argv or os.getenv("SANDBOX_API_RELOAD") == "1":
+        uvicorn.run("main:app", host=HOST, port=PORT, reload=True)
+        return
+    if WORKERS <= 1:
+        uvicorn.run("main:app", host=HOST, port=PORT, **server_options())
+        return
+
+    state = start_state_process(dict(os.environ))
+    print(f"State process ready in {time.time() - launched_at:.2f}s", flush=True)
+    os.environ["SANDBOX_STATE_URL"] = f"http://127.0.0.1:{STATE_PORT}"
+    try:
+        uvicorn.run("main:app", host=HOST, port=PORT, workers=WORKERS, **server_options())
+    finally:
+        state.terminate()
+        try:
+            state.wait(10)
+        except subprocess.TimeoutExpired:
+            state.kill()
+
+
+if __name__ == "__main__":
+    main()
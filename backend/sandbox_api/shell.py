@@ -0,0 +1,226 @@
+import asyncio
+import codecs
+import os
+import signal
+import tempfile
+import time
+import uuid
+from metrics import Histogram
+
+MAX_CONCURRENCY = int(os.getenv("SHELL_MAX_CONCURRENCY", "8"))
+JOB_RETENTION = float(os.getenv("SHELL_JOB_RETENTION", "300"))
+# Lines a /shell/stream reader may fall behind by before further lines are dropped
+STREAM_QUEUE_LINES = int(os.getenv("SHELL_STREAM_QUEUE_LINES", "10000"))
+KILL_GRACE = 2.0
+CHUNK_SIZE = 65536
+
+COMMAND_SECONDS = Histogram("shell_command_duration_seconds", "Wall time of shell commands.", ("status",))
+
+
+class Job:
+    """A shell command and its output.
+
+    stdout and stderr go to temporary files as raw bytes, so a finished job
+    holds no output in memory; `read` fetches a range of either. Jobs started
+    with `stream` also queue decoded lines for `events`, at most
+    STREAM_QUEUE_LINES at a time.
+    """
+
+    def __init__(self, command, timeout, stream=False):
+        self.id = uuid.uuid4().hex
+        self.command = command
+        self.timeout = timeout
+        self.status = "queued"
+        self.return_code = None
+        self.process = None
+        self.files = {}  # stream name -> temporary file, created on first output
+        self.sizes = {"stdout": 0, "stderr": 0}
+        self.queue = asyncio.Queue() if stream else None
+        self.dropped = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.task = None
+
+    @property
+    def done(self):
+        return self.finished_at is not None
+
+    def write(self, stream, data):
+        if not data:
+            return
+        f = self.files.get(stream)
+        if f is None:
+            f = self.files[stream] = tempfile.TemporaryFile()
+        # Unbuffered, so readers in other threads see every byte counted in sizes
+        os.write(f.fileno(), data)
+        self.sizes[stream] += len(data)
+
+    def read(self, stream, offset=0, n=None):
+        """Bytes of a stream's output; safe to call from a thread while the job runs."""
+        f = self.files.get(stream)
+        size = self.sizes[stream]
+        n = size - offset if n is None else min(n, size - offset)
+        if f is None or n <= 0:
+            return b""
+        return os.pread(f.fileno(), n, offset)
+
+    def text(self, stream):
+        return self.read(stream).decode(errors="replace")
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        self.sizes = {"stdout": 0, "stderr": 0}
+
+    def info(self):
+        return {
+            "job_id": self.id,
+            "command": self.command,
+            "status": self.status,
+            "return_code": self.return_code,
+        }
+
+    def _emit(self, stream, text):
+        if self.queue is None:
+            return
+        # Lines a slow reader has not taken are dropped rather than held in memory; the files keep them
+        if stream != "exit" and self.queue.qsize() >= STREAM_QUEUE_LINES:
+            self.dropped += 1
+            return
+        if self.dropped:
+            self.queue.put_nowait(("dropped", self.dropped))
+            self.dropped = 0
+        self.queue.put_nowait((stream, text))
+
+    async def events(self):
+        """Yield (stream, text) as output arrives, then ("exit", None) once finished.
+
+        ("dropped", n) stands in for n lines the reader fell too far behind
+        to receive. Lines are taken off the queue as they are yielded, so a
+        job has one reader.
+        """
+        while True:
+            item = await self.queue.get()
+            yield item
+            if item[0] == "exit":
+                return
+
+    def signal(self, sig):
+        if self.process is None or self.process.returncode is not None:
+            return False
+        try:
+            # Commands run in their own session so the whole process group is signalled
+            os.killpg(self.process.pid, sig)
+        except ProcessLookupError:
+            return False
+        return True
+
+
+class ShellEngine:
+    def __init__(self, max_concurrency=MAX_CONCURRENCY):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.jobs = {}
+
+    def start(self, command, timeout=30, stream=False):
+        self._prune()
+        job = Job(command, timeout, stream)
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def run(self, command, timeout=30):
+        job = self.start(command, timeout)
+        await asyncio.shield(job.task)
+        return job
+
+    async def cancel(self, job, force=False):
+        if job.done:
+            return
+        if job.process is None:
+            job.task.cancel()
+            return
+        job.status = "cancelled"
+        job.signal(signal.SIGKILL if force else signal.SIGTERM)
+        if not force:
+            try:
+                await asyncio.wait_for(asyncio.shield(job.task), KILL_GRACE)
+            except asyncio.TimeoutError:
+                job.signal(signal.SIGKILL)
+
+    async def _run(self, job):
+        try:
+            async with self.semaphore:
+                job.process = await asyncio.create_subprocess_shell(
+                    job.command,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    start_new_session=True,
+                )
+                job.status = "running"
+                job.started_at = time.time()
+                readers = asyncio.gather(
+                    self._pump(job, job.process.stdout, "stdout"),
+                    self._pump(job, job.process.stderr, "stderr"),
+                )
+                try:
+                    await asyncio.wait_for(asyncio.shield(readers), job.timeout)
+                except asyncio.TimeoutError:
+                    job.status = "timed_out"
+                    job.signal(signal.SIGKILL)
+                    await readers
+                job.return_code = await job.process.wait()
+                if job.status == "running":
+                    job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            job.signal(signal.SIGKILL)
+        except Exception as e:
+            job.status = "error"
+            job.write("stderr", str(e).encode())
+            job._emit("stderr", str(e))
+        finally:
+            job.finished_at = time.time()
+            job._emit("exit", None)
+            if job.started_at is not None:
+                COMMAND_SECONDS.observe(job.finished_at - job.started_at, status=job.status)
+
+    async def _pump(self, job, stream, name):
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        while True:
+            chunk = await stream.read(CHUNK_SIZE)
+            job.write(name, chunk)
+            if job.queue is None:
+                if not chunk:
+                    return
+                continue
+            pending += decoder.decode(chunk, final=not chunk)
+            lines = pending.splitlines(keepends=True)
+            pending = ""
+            if lines and not lines[-1].endswith(("\n", "\r")) and chunk and len(lines[-1]) < CHUNK_SIZE:
+                pending = lines.pop()
+            for line in lines:
+                job._emit(name, line)
+            if not chunk:
+                return
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.done and now - job.finished_at > JOB_RETENTION:
+                self.discard(job)
+
+    def discard(self, job):
+        """Forget a finished job and delete its output."""
+        self.jobs.pop(job.id, None)
+        job.close()
+
+    async def shutdown(self):
+        for job in list(self.jobs.values()):
+            if not job.done:
+                await self.cancel(job, force=True)
@@ -3,6 +3,9 @@ import time
 import subprocess
 import os
 import sys
+import threading
+import base64
+import json
 
 def test_api():
     # Start the server in background
@@ -34,18 +37,100 @@ def test_api():
         print(f"File list: {response.json()}")
         assert any(item['name'] == 'test.txt' for item in response.json())
 
+        # Test recursive, filtered and paginated listing
+        print("Testing paginated file list...")
+        for name in ("listing/a.txt", "listing/b.log", "listing/sub/c.txt", "listing/sub/d.txt"):
+            httpx.post(f"{base_url}/files/write", json={"path": name, "content": "x"})
+        response = httpx.get(f"{base_url}/files/list", params={"path": "listing", "depth": 2, "pattern": "*.txt", "limit": 2})
+        assert [item["path"] for item in response.json()] == ["a.txt", "sub/c.txt"]
+        cursor = response.headers["x-next-cursor"]
+        response = httpx.get(f"{base_url}/files/list", params={"path": "listing", "depth": 2, "pattern": "*.txt", "limit": 2, "cursor": cursor})
+        assert [item["path"] for item in response.json()] == ["sub/d.txt"]
+        assert "x-next-cursor" not in response.headers
+        response = httpx.get(f"{base_url}/files/list", params={"path": "listing", "format": "ndjson", "limit": 2})
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [line.get("name") for line in lines[:2]] == ["a.txt", "b.log"] and "next_cursor" in lines[2]
+        httpx.delete(f"{base_url}/files/delete", params={"path": "listing"})
+
         # Test file read
         print("Testing file read...")
         response = httpx.get(f"{base_url}/files/read", params={"path": "test.txt"})
         print(f"File read: {response.json()}")
         assert response.json()["content"] == "hello world"
 
+        # Test ranged, tail and binary reads
+        print("Testing ranged and binary file access...")
+        response = httpx.get(f"{base_url}/files/read", params={"path": "test.txt", "offset": 6, "length": 3})
+        assert response.json()["content"] == "wor"
+        httpx.post(f"{base_url}/files/write", json={"path": "test.txt", "content": "\nline2\nline3\n", "append": True})
+        response = httpx.get(f"{base_url}/files/read", params={"path": "test.txt", "tail": 2})
+        assert response.json()["content"] == "line2\nline3\n"
+        blob = bytes(range(256))
+        response = httpx.post(f"{base_url}/files/write", json={"path": "test.bin", "content": base64.b64encode(blob).decode(), "encoding": "base64"})
+        assert response.json()["bytes_written"] == 256
+        response = httpx.get(f"{base_url}/files/read", params={"path": "test.bin", "encoding": "base64"})
+        assert base64.b64decode(response.json()["content"]) == blob
+
+        # Test streaming download with Range and chunked upload
+        response = httpx.get(f"{base_url}/files/download", params={"path": "test.bin"}, headers={"Range": "bytes=10-19"})
+        assert response.status_code == 206
+        assert response.content == blob[10:20]
+        response = httpx.put(f"{base_url}/files/upload", params={"path": "test.bin"}, content=iter([blob[:100], blob[100:]]))
+        assert response.json()["size"] == 256
+        response = httpx.put(f"{base_url}/files/upload", params={"path": "test.bin", "offset": 0}, content=b"\xff\xff")
+        assert httpx.get(f"{base_url}/files/download", params={"path": "test.bin"}).content == b"\xff\xff" + blob[2:]
+
         # Test shell execute
         print("Testing shell execute...")
         response = httpx.post(f"{base_url}/shell/execute", json={"command": "echo 'hello from shell'"})
         print(f"Shell execute: {response.json()}")
         assert "hello from shell" in response.json()["stdout"]
 
+        # Test that a slow command does not block other requests
+        print("Testing concurrent shell execute...")
+        with httpx.Client(base_url=base_url, timeout=10) as client:
+            slow = threading.Thread(target=client.post, args=("/shell/execute",), kwargs={"json": {"command": "sleep 2"}})
+            slow.start()
+            time.sleep(0.3)
+            start = time.time()
+            assert client.get("/health").status_code == 200
+            assert time.time() - start < 1
+            slow.join()
+
+        # Test batch
+        print("Testing batch...")
+        response = httpx.post(f"{base_url}/batch", json={"steps": [
+            {"id": "write", "tool": "write_file", "params": {"path": "batch.txt", "content": "from batch"}},
+            {"id": "read", "tool": "read_file", "params": {"path": "batch.txt"}, "depends_on": ["write"]},
+            {"id": "echo", "tool": "execute_command", "params": {"command": "echo hi"}},
+            {"id": "missing", "tool": "read_file", "params": {"path": "does-not-exist"}},
+        ]})
+        print(f"Batch: {response.json()}")
+        results = response.json()["results"]
+        assert results[1]["result"]["content"] == "from batch"
+        assert results[2]["result"]["stdout"] == "hi\n"
+        assert results[3]["status"] == "error" and results[3]["status_code"] == 404
+        httpx.delete(f"{base_url}/files/delete", params={"path": "batch.txt"})
+
+        # Test shell stream
+        print("Testing shell stream...")
+        with httpx.stream("POST", f"{base_url}/shell/stream", json={"command": "echo one; echo two >&2"}) as r:
+            body = r.read().decode()
+            job_id = r.headers["x-job-id"]
+        print(f"Shell stream: {body!r}")
+        assert "event: stdout" in body and "one" in body
+        assert "event: stderr" in body and "two" in body
+        assert "event: exit" in body
+        assert httpx.get(f"{base_url}/shell/jobs/{job_id}").json()["return_code"] == 0
+
+        # Test shell job cancel
+        print("Testing shell job cancel...")
+        with httpx.stream("POST", f"{base_url}/shell/stream", json={"command": "sleep 30"}) as r:
+            job_id = r.headers["x-job-id"]
+            response = httpx.post(f"{base_url}/shell/jobs/{job_id}/cancel", params={"force": True})
+            assert response.json()["status"] == "cancelled"
+            assert "event: exit" in r.read().decode()
+
         # Test llms.txt
         print("Testing llms.txt...")
         response = httpx.get(f"{base_url}/llms.txt")
@@ -76,9 +161,10 @@ def test_api():
         print("Shutting down server...")
         server_process.terminate()
         server_process.wait()
-        test_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test.txt")
-        if os.path.exists(test_file):
-            os.remove(test_file)
+        for name in ("test.txt", "test.bin"):
+            test_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+            if os.path.exists(test_file):
+                os.remove(test_file)
 
 if __name__ == "__main__":
     test_api()
@@ -0,0 +1,82 @@
+import asyncio
+import json
+from fastapi import HTTPException
+import main
+from batch import BatchError, run_batch
+from main import BatchStep
+
+def make_handlers(log):
+    async def sleep(params):
+        log.append(("start", params["name"]))
+        await asyncio.sleep(params.get("seconds", 0.05))
+        log.append(("end", params["name"]))
+        return params["name"]
+
+    async def fail(params):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return {"sleep": sleep, "fail": fail}
+
+def test_independent_steps_run_concurrently_and_dependents_wait():
+    log = []
+    steps = [
+        BatchStep(id="a", tool="sleep", params={"name": "a"}),
+        BatchStep(id="b", tool="sleep", params={"name": "b"}),
+        BatchStep(id="c", tool="sleep", params={"name": "c"}, depends_on=["a", "b"]),
+    ]
+    results = asyncio.run(run_batch(steps, make_handlers(log)))
+    assert [r["result"] for r in results] == ["a", "b", "c"]
+    assert log[:2] == [("start", "a"), ("start", "b")]
+    assert log.index(("start", "c")) > log.index(("end", "a"))
+    assert log.index(("start", "c")) > log.index(("end", "b"))
+
+def test_failed_dependency_skips_dependents():
+    steps = [
+        BatchStep(id="a", tool="fail"),
+        BatchStep(id="b", tool="sleep", params={"name": "b"}, depends_on=["a"]),
+        BatchStep(id="c", tool="sleep", params={"name": "c"}),
+    ]
+    results = asyncio.run(run_batch(steps, make_handlers([])))
+    assert results[0]["status"] == "error" and results[0]["status_code"] == 404
+    assert results[1]["status"] == "skipped" and results[1]["blocked_by"] == ["a"]
+    assert results[2]["status"] == "success"
+
+def test_invalid_step_params_are_a_client_error():
+    handlers = {"execute_command": main.BATCH_TOOLS["execute_command"]}
+    steps = [BatchStep(id="a", tool="execute_command", params={"timeout": "soon"})]
+    result = asyncio.run(run_batch(steps, handlers))[0]
+    assert result["status"] == "error" and result["status_code"] == 422
+    assert {error["loc"][0] for error in result["detail"]} == {"command", "timeout"}
+    json.dumps(result)
+
+    # Tools served as query strings are validated by their /tools models too
+    steps = [BatchStep(id="typo", tool="read_file", params={"paht": "x"}),
+             BatchStep(id="type", tool="read_file", params={"path": "x", "offset": "ten"}),
+             BatchStep(id="list", tool="list_files", params={"depht": 2}),
+             BatchStep(id="delete", tool="delete_file", params={"file": "x"}),
+             BatchStep(id="shot", tool="browser_screenshot", params={"scale": "half"})]
+    results = asyncio.run(run_batch(steps, main.BATCH_TOOLS))
+    assert [r["status_code"] for r in results] == [422] * 5
+    assert ("paht",) in [tuple(error["loc"]) for error in results[0]["detail"]]
+    assert [tuple(error["loc"]) for error in results[1]["detail"]] == [("offset",)]
+
+def test_sequential_mode_and_validation():
+    log = []
+    steps = [BatchStep(id=str(i), tool="sleep", params={"name": str(i), "seconds": 0}) for i in range(3)]
+    asyncio.run(run_batch(steps, make_handlers(log), sequential=True))
+    assert log == [(kind, str(i)) for i in range(3) for kind in ("start", "end")]
+
+    for bad in ([BatchStep(id="a", tool="sleep", depends_on=["b"]), BatchStep(id="b", tool="sleep")],
+                [BatchStep(id="a", tool="nope")]):
+        try:
+            asyncio.run(run_batch(bad, make_handlers([])))
+            assert False, "expected BatchError"
+        except BatchError:
+            pass
+
+if __name__ == "__main__":
+    test_independent_steps_run_concurrently_and_dependents_wait()
+    test_failed_dependency_skips_dependents()
+    test_invalid_step_params_are_a_client_error()
+    test_sequential_mode_and_validation()
+    print("Tests passed successfully!")
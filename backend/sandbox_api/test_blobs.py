@@ -0,0 +1,107 @@
+import os
+import tempfile
+import time
+from fastapi.testclient import TestClient
+import blobs
+import main
+from blobs import BlobStore, OutputPolicy, parse_ref
+
+def test_blobs_are_content_addressed_and_compressed():
+    with tempfile.TemporaryDirectory() as tmp:
+        compressions = ["gzip"] + (["zstd"] if blobs.zstandard is not None else [])
+        data = b"line of output\n" * 10000
+        for compression in compressions:
+            store = BlobStore(os.path.join(tmp, compression), compression=compression)
+            digest = store.put(data)
+            assert store.put(data) == digest
+            files = [f for _, _, names in os.walk(store.path) for f in names]
+            assert len(files) == 1 and files[0].endswith(blobs.EXTENSIONS[compression])
+            assert os.path.getsize(os.path.join(store.path, digest[:2], files[0])) < len(data) // 10
+            assert store.get(digest) == data and b"".join(store.iter(digest, 1000)) == data
+        # Blobs stay readable after the configured compression changes
+        assert BlobStore(os.path.join(tmp, "gzip"), compression=compressions[-1]).get(digest) == data
+        for bad in ("0" * 64, "../etc/passwd"):
+            try:
+                store.get(bad)
+                assert False, "expected KeyError"
+            except KeyError:
+                pass
+
+def test_chunked_puts_match_whole_puts():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BlobStore(tmp, compression="gzip")
+        data = os.urandom(200000)
+        digest = store.put_chunks(data[i:i + 65536] for i in range(0, len(data), 65536))
+        assert digest == store.put(data) and store.get(digest) == data
+        assert store.put_chunks([data]) == digest
+        assert len([f for _, _, names in os.walk(tmp) for f in names]) == 1
+
+        policy = OutputPolicy(store, limit=1000, head=100, tail=50)
+        text, info = policy.compact_file(lambda offset, n: data[offset:offset + n], len(data), chunk_size=4096)
+        assert info == {"ref": "sha256:" + digest, "size": len(data)}
+        assert f"[{len(data) - 150} bytes omitted]" in text
+        assert policy.compact_file(lambda offset, n: b"ok\n"[offset:offset + n], 3) == ("ok\n", None)
+
+def test_old_blobs_are_pruned_by_age_and_size():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = BlobStore(tmp, compression="gzip", max_bytes=0, max_age=3600)
+        old, kept = store.put(os.urandom(1000)), store.put(os.urandom(1000))
+        path, _ = store._find(old)
+        os.utime(path, (time.time() - 7200, time.time() - 7200))
+        assert store.prune() == 1
+        assert store.get(kept) and not store._touch(old)
+
+        # Over the size limit, the least recently stored go first
+        store.max_age = 0
+        store.max_bytes = 2500
+        first = store.put(os.urandom(1000))
+        os.utime(store._find(kept)[0], (time.time() - 60, time.time() - 60))
+        store.put(os.urandom(1000))
+        assert not store._touch(kept) and store._touch(first)
+
+def test_oversized_output_is_cut_to_head_and_tail_and_retrievable():
+    with tempfile.TemporaryDirectory() as tmp:
+        policy = OutputPolicy(BlobStore(tmp), limit=1000, head=100, tail=50)
+        small = {"stdout": "ok\n", "return_code": 0}
+        assert policy.apply(small) == small
+
+        text = "é" * 2000
+        result = policy.apply({"results": [{"stdout": text}], "return_code": 0})
+        compacted = result["results"][0]["stdout"]
+        assert compacted.startswith("é" * 50) and compacted.endswith("é" * 25)
+        assert "[3850 bytes omitted]" in compacted
+        info = result["spilled"]["results.0.stdout"]
+        assert info["size"] == 4000 and policy.store.get(parse_ref(info["ref"])).decode() == text
+
+        saved = main.output_policy, main.blob_store
+        main.output_policy = OutputPolicy(BlobStore(tmp), limit=1000, head=100, tail=100)
+        main.blob_store = main.output_policy.store
+        client = TestClient(main.app)
+        try:
+            check_shell_output(client)
+        finally:
+            main.output_policy, main.blob_store = saved
+
+def check_shell_output(client):
+    response = client.post("/shell/execute", json={"command": "seq 1 5000"}).json()
+    assert response["stdout"].startswith("1\n2\n") and response["stdout"].endswith("4999\n5000\n")
+    ref = response["spilled"]["stdout"]["ref"]
+    full = client.get(f"/blobs/{ref}")
+    assert full.text == "".join(f"{i}\n" for i in range(1, 5001))
+    assert client.get(f"/blobs/sha256:{'0' * 64}").status_code == 404
+    # One-shot jobs are not kept around with their output
+    assert not main.shell_engine.jobs
+
+    with client.stream("POST", "/shell/stream", json={"command": "seq 1 5000"}) as r:
+        lines = r.read().decode().count("event: stdout")
+        job = main.shell_engine.get(r.headers["x-job-id"])
+    assert lines == 5000 and job.sizes["stdout"] == len(full.content)
+    response = client.get(f"/shell/jobs/{job.id}").json()
+    assert response["spilled"]["stdout"]["ref"] == ref and response["status"] == "completed"
+
+if __name__ == "__main__":
+    test_blobs_are_content_addressed_and_compressed()
+    test_chunked_puts_match_whole_puts()
+    test_old_blobs_are_pruned_by_age_and_size()
+    test_oversized_output_is_cut_to_head_and_tail_and_retrievable()
+    print("Tests passed successfully!")
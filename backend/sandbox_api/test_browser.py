@@ -0,0 +1,143 @@
+import asyncio
+import base64
+import screenshot
+import main
+from fastapi.testclient import TestClient
+from browser import BrowserPool, BrowserPoolFull
+
+class FakePage:
+    def __init__(self):
+        self.url = "about:blank"
+        self.closed = False
+
+    async def goto(self, url):
+        await asyncio.sleep(0.05)
+        self.url = url
+
+    async def close(self):
+        self.closed = True
+
+class FakeContext:
+    def __init__(self):
+        self.closed = False
+
+    async def new_page(self):
+        return FakePage()
+
+    async def add_init_script(self, script):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+class FakeBrowser:
+    def __init__(self):
+        self.contexts = 0
+
+    async def new_context(self):
+        self.contexts += 1
+        return FakeContext()
+
+def make_pool(max_pages):
+    pool = BrowserPool(max_pages=max_pages)
+    pool.browser = FakeBrowser()
+    return pool
+
+def test_pages_run_concurrently_and_share_contexts():
+    async def run():
+        pool = make_pool(4)
+
+        async def goto(page_id, url, context_id="default"):
+            async with pool.page(page_id, context_id) as page:
+                await page.goto(url)
+
+        start = asyncio.get_running_loop().time()
+        await asyncio.gather(*(goto(f"p{i}", f"https://example.com/{i}") for i in range(4)))
+        assert asyncio.get_running_loop().time() - start < 0.15
+        assert pool.browser.contexts == 1
+
+        await goto("isolated", "https://example.org", context_id="other")
+        assert pool.browser.contexts == 2
+        assert [p["page_id"] for p in pool.list_pages()] == ["p1", "p2", "p3", "isolated"]
+
+    asyncio.run(run())
+
+def test_lru_eviction_skips_busy_pages():
+    async def run():
+        pool = make_pool(2)
+        async with pool.page("a") as page_a:
+            async with pool.page("b"):
+                pass
+            async with pool.page("c"):
+                pass
+            assert not page_a.closed
+            assert {p["page_id"] for p in pool.list_pages()} == {"a", "c"}
+
+            async with pool.page("c"):
+                try:
+                    async with pool.page("d"):
+                        pass
+                    assert False, "expected BrowserPoolFull"
+                except BrowserPoolFull:
+                    pass
+
+        assert await pool.close_page("a")
+        assert page_a.closed
+        assert not await pool.close_page("a")
+
+    asyncio.run(run())
+
+class FakeCDPSession:
+    def __init__(self):
+        self.calls = []
+
+    async def send(self, method, params=None):
+        self.calls.append((method, params))
+        return {"data": base64.b64encode(b"image-bytes").decode()}
+
+class ScreenshotPage(FakePage):
+    def __init__(self):
+        super().__init__()
+        self.mutations = 0
+        self.session = FakeCDPSession()
+        self.context = self
+
+    async def new_cdp_session(self, page):
+        return self.session
+
+    async def evaluate(self, script):
+        return [self.url, self.mutations, 0, 0, 1280, 720, 1]
+
+def test_screenshot_cache_tracks_page_state():
+    async def run():
+        page = ScreenshotPage()
+        data, cached = await screenshot.capture(page, "p", "jpeg", quality=50, scale=0.5)
+        assert data == b"image-bytes" and not cached
+        method, params = page.session.calls[0]
+        assert method == "Page.captureScreenshot"
+        assert params["format"] == "jpeg" and params["quality"] == 50
+        assert params["clip"] == {"x": 0, "y": 0, "width": 1280, "height": 720, "scale": 0.5}
+
+        assert (await screenshot.capture(page, "p", "jpeg", quality=50, scale=0.5))[1]
+        page.mutations += 1
+        assert not (await screenshot.capture(page, "p", "jpeg", quality=50, scale=0.5))[1]
+        assert len(page.session.calls) == 2
+
+        # Typing sets input values, which no DOM mutation reports
+        screenshot.changed("p")
+        assert not (await screenshot.capture(page, "p", "jpeg", quality=50, scale=0.5))[1]
+        assert len(page.session.calls) == 3
+
+    asyncio.run(run())
+
+def test_screenshot_parameters_are_validated():
+    client = TestClient(main.app)
+    for params in ({"clip": "1,2,3"}, {"clip": "a,b,c,d"}, {"quality": 101}, {"quality": -1}):
+        assert client.get("/browser/screenshot", params=params).status_code == 400
+
+if __name__ == "__main__":
+    test_pages_run_concurrently_and_share_contexts()
+    test_lru_eviction_skips_busy_pages()
+    test_screenshot_cache_tracks_page_state()
+    test_screenshot_parameters_are_validated()
+    print("Tests passed successfully!")
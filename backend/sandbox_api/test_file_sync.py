@@ -0,0 +1,94 @@
+import hashlib
+import os
+import tempfile
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+import main
+
+def sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+def test_reads_carry_hashes_and_revalidate_with_etags():
+    client = TestClient(main.app)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "a.txt")
+        written = client.post("/files/write", json={"path": path, "content": "one\ntwo\n"}).json()
+        assert written["sha256"] == sha(b"one\ntwo\n")
+        response = client.get("/files/read", params={"path": path})
+        assert response.json()["sha256"] == written["sha256"]
+        assert response.headers["etag"] == f'"{written["sha256"]}"'
+        again = client.get("/files/read", params={"path": path}, headers={"If-None-Match": response.headers["etag"]})
+        assert again.status_code == 304 and again.content == b""
+
+        with open(path, "a") as f:
+            f.write("three\n")
+        changed = client.get("/files/read", params={"path": path}, headers={"If-None-Match": response.headers["etag"]})
+        assert changed.status_code == 200 and changed.json()["sha256"] == sha(b"one\ntwo\nthree\n")
+
+        stale = client.post("/files/write", json={"path": path, "content": "x", "base_sha256": written["sha256"]})
+        assert stale.status_code == 412
+
+        # Ranged and tail reads don't hash the whole file
+        with patch.object(main.files, "content_hash", side_effect=AssertionError("hashed")):
+            tail = client.get("/files/read", params={"path": path, "tail": 1})
+            assert tail.json()["content"] == "three\n" and "sha256" not in tail.json() and "etag" not in tail.headers
+            # and never answer 304, even to the whole file's ETag
+            ranged = client.get("/files/read", params={"path": path, "offset": 4},
+                                headers={"If-None-Match": changed.headers["etag"]})
+            assert ranged.status_code == 200 and ranged.json()["content"] == "two\nthree\n"
+            appended = client.post("/files/write", json={"path": path, "content": "four\n", "append": True})
+            assert appended.json() == {"status": "success", "bytes_written": 5}
+
+def test_api_writes_drop_cached_hashes_a_stat_cannot_tell_apart():
+    client = TestClient(main.app)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "a.txt")
+        client.post("/files/write", json={"path": path, "content": "aaaa"})
+        st = os.stat(path)
+        # A same-size rewrite within one mtime tick keeps inode, size and mtime
+        client.put("/files/upload", params={"path": path, "offset": 0}, content=b"bbbb")
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        assert client.get("/files/read", params={"path": path}).json()["sha256"] == sha(b"bbbb")
+
+def test_patch_applies_line_edits_atomically_and_checks_hashes():
+    client = TestClient(main.app)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "code.py")
+        base = b"".join(f"line {i}\n".encode() for i in range(100))
+        with open(path, "wb") as f:
+            f.write(base)
+        lines = base.decode().splitlines(keepends=True)
+        new = lines[:10] + ["changed\n"] + lines[12:50] + ["inserted\n"] + lines[50:]
+        expected = "".join(new).encode()
+        edits = [{"start": 10, "end": 12, "lines": ["changed\n"]}, {"start": 50, "end": 50, "lines": ["inserted\n"]}]
+        response = client.post("/files/patch", json={"path": path, "base_sha256": sha(base), "edits": edits,
+                                                      "sha256": sha(expected)})
+        assert response.json() == {"status": "success", "size": len(expected), "sha256": sha(expected)}
+        with open(path, "rb") as f:
+            assert f.read() == expected
+
+        # Not the base any more, a wrong result hash, or overlapping edits: nothing is written
+        assert client.post("/files/patch", json={"path": path, "base_sha256": sha(base), "edits": edits}).status_code == 412
+        assert client.post("/files/patch", json={"path": path, "base_sha256": sha(expected), "edits": edits,
+                                                 "sha256": sha(b"other")}).status_code == 412
+        overlapping = [{"start": 5, "end": 8, "lines": []}, {"start": 6, "end": 9, "lines": []}]
+        assert client.post("/files/patch", json={"path": path, "base_sha256": sha(expected),
+                                                 "edits": overlapping}).status_code == 400
+        with open(path, "rb") as f:
+            assert f.read() == expected
+        assert [name for name in os.listdir(tmp)] == ["code.py"]
+
+        # Only "\n" ends a line: "\r\n" files and form feeds keep the agent's line numbers
+        odd = "page one\x0cpage two\r\nend\u2028same line\n".encode()
+        with open(path, "wb") as f:
+            f.write(odd)
+        edits = [{"start": 1, "end": 2, "lines": ["END\n"]}]
+        response = client.post("/files/patch", json={"path": path, "base_sha256": sha(odd), "edits": edits,
+                                                      "sha256": sha(b"page one\x0cpage two\r\nEND\n")})
+        assert response.status_code == 200
+
+if __name__ == "__main__":
+    test_reads_carry_hashes_and_revalidate_with_etags()
+    test_api_writes_drop_cached_hashes_a_stat_cannot_tell_apart()
+    test_patch_applies_line_edits_atomically_and_checks_hashes()
+    print("Tests passed successfully!")
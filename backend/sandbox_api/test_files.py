@@ -0,0 +1,24 @@
+import os
+import tempfile
+from fastapi.testclient import TestClient
+import files
+import main
+
+def test_reads_are_capped(monkeypatch):
+    monkeypatch.setattr(files, "READ_MAX_BYTES", 10)
+    client = TestClient(main.app)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "big.log")
+        with open(path, "wb") as f:
+            f.write(b"".join(f"{i:04d}\n".encode() for i in range(200)))
+
+        assert client.get("/files/read", params={"path": path, "length": -1}).status_code == 400
+        assert client.get("/files/read", params={"path": path, "tail": -1}).status_code == 400
+        ranged = client.get("/files/read", params={"path": path, "offset": 0, "length": 1000}).json()
+        assert len(ranged["content"]) == 10 and ranged["truncated"]
+
+        # Two lines fit under the cap; three do not
+        tail = client.get("/files/read", params={"path": path, "tail": 2}).json()
+        assert tail["content"] == "0198\n0199\n" and not tail["truncated"]
+        tail = client.get("/files/read", params={"path": path, "tail": 3}).json()
+        assert tail["content"] == "0198\n0199\n" and tail["truncated"]
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+from fastapi.testclient import TestClient
+import main
+
+def test_manifests_are_built_once_and_revalidated_with_etags():
+    client = TestClient(main.app)
+    tools = client.get("/tools")
+    assert tools.status_code == 200 and tools.headers["etag"]
+    by_name = {tool["name"]: tool["parameters"] for tool in tools.json()["tools"]}
+    assert by_name["execute_command"]["required"] == ["command"]
+    assert by_name["execute_command"]["properties"]["timeout"] == {
+        "default": 30, "description": "Timeout in seconds", "type": "integer"}
+    # Optional query parameters are plain types, without "null" alternatives
+    assert by_name["read_file"]["properties"]["tail"]["type"] == "integer"
+    assert by_name["read_file"]["properties"]["encoding"]["enum"] == ["text", "base64"]
+
+    for path in ("/tools", "/llms.txt", "/llms-full.txt"):
+        first = client.get(path)
+        again = client.get(path, headers={"If-None-Match": first.headers["etag"]})
+        assert again.status_code == 304 and again.content == b""
+        assert client.get(path, headers={"If-None-Match": 'W/"stale"'}).status_code == 200
+    assert client.get("/llms.txt").headers["content-type"].startswith("text/plain")
+
+def test_import_does_not_load_heavy_dependencies():
+    code = "import sys, main; print(sorted(m for m in ('playwright', 'duckduckgo_search', 'httpx') if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    assert output.strip() == "[]"
+
+if __name__ == "__main__":
+    test_manifests_are_built_once_and_revalidated_with_etags()
+    test_import_does_not_load_heavy_dependencies()
+    print("Tests passed successfully!")
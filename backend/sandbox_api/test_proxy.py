@@ -0,0 +1,153 @@
+import asyncio
+import os
+import time
+from unittest.mock import AsyncMock, patch
+import httpx
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+import main
+import proxy
+from proxy import StateProxy, forward_json
+
+def make_apps():
+    state = FastAPI()
+    pages = {}
+
+    @state.post("/browser/goto")
+    async def goto(request: dict):
+        pages[request["page_id"]] = request["url"]
+        return {"status": "success", "url": request["url"]}
+
+    @state.get("/browser/pages")
+    async def list_pages():
+        return {"pages": pages}
+
+    @state.post("/browser/click")
+    async def click(request: dict):
+        raise HTTPException(status_code=404, detail="No such element")
+
+    @state.post("/shell/stream")
+    async def stream():
+        async def events():
+            for line in ("a", "b"):
+                yield f"data: {line}\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"X-Job-Id": "j1"})
+
+    worker = FastAPI()
+
+    @worker.get("/files/list")
+    async def list_files():
+        return ["local"]
+
+    @worker.get("/browser/pages")
+    async def not_here():
+        raise AssertionError("stateful endpoints must not be served by the worker")
+
+    return state, StateProxy(worker, state_url="http://state")
+
+def test_stateful_endpoints_are_forwarded_and_others_served_locally():
+    state, worker = make_apps()
+
+    async def run():
+        proxy._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=state), base_url="http://state")
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=worker), base_url="http://worker") as client:
+            assert (await client.get("/files/list")).json() == ["local"]
+            response = await client.post("/browser/goto", json={"page_id": "p", "url": "https://example.com"})
+            assert response.json()["url"] == "https://example.com"
+            assert (await client.get("/browser/pages")).json() == {"pages": {"p": "https://example.com"}}
+            missing = await client.post("/browser/click", json={})
+            assert missing.status_code == 404 and missing.json()["detail"] == "No such element"
+            streamed = await client.post("/shell/stream", json={})
+            assert streamed.headers["x-job-id"] == "j1" and streamed.text == "data: a\n\ndata: b\n\n"
+
+            # Batch steps in a worker reach the state process the same way
+            assert (await forward_json("http://state", "GET", "/browser/pages"))["pages"] == {"p": "https://example.com"}
+            try:
+                await forward_json("http://state", "POST", "/browser/click", json={})
+                assert False, "expected HTTPException"
+            except HTTPException as e:
+                assert e.status_code == 404
+        await proxy._client.aclose()
+        proxy._client = None
+
+    asyncio.run(run())
+
+def test_client_disconnect_closes_the_upstream_stream():
+    state = FastAPI()
+    cancelled = asyncio.Event()
+
+    @state.post("/shell/stream")
+    async def stream():
+        async def events():
+            try:
+                while True:
+                    yield "data: tick\n\n"
+                    await asyncio.sleep(0.05)
+            finally:
+                cancelled.set()
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def run():
+        # A real server: the in-process transport buffers whole responses and never sees a disconnect
+        server = uvicorn.Server(uvicorn.Config(state, host="127.0.0.1", port=0, log_level="warning"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        port = server.servers[0].sockets[0].getsockname()[1]
+        worker = StateProxy(FastAPI(), state_url=f"http://127.0.0.1:{port}")
+
+        client_gone = asyncio.Event()
+        received = []
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await client_gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message.get("body"):
+                client_gone.set()
+
+        scope = {"type": "http", "method": "POST", "path": "/shell/stream", "query_string": b"", "headers": []}
+        await asyncio.wait_for(worker(scope, receive, send), 5)
+        await asyncio.wait_for(cancelled.wait(), 5)
+        await proxy._client.aclose()
+        proxy._client = None
+        server.should_exit = True
+        await serving
+
+    asyncio.run(run())
+
+def test_state_process_serves_the_metrics_workers_push():
+    client = TestClient(main.app)
+    worker = "# HELP http_requests_in_flight Requests being handled.\n# TYPE http_requests_in_flight gauge\n" \
+             'http_requests_in_flight{method="GET"} 2\n'
+    try:
+        text = client.put("/metrics/workers/101", content=worker).text
+        assert 'http_requests_in_flight{method="GET",worker="101"} 2' in text
+        assert 'http_requests_in_flight{method="PUT",worker="state"} 1' in text
+        assert text.count("# TYPE http_requests_in_flight gauge") == 1
+        assert 'worker="101"' in client.get("/metrics").text
+        # A worker that stopped pushing has exited and is dropped
+        main.worker_metrics["101"] = (time.monotonic() - 3 * main.METRICS_PUSH_INTERVAL - 1, worker)
+        assert 'worker="' not in client.get("/metrics").text
+    finally:
+        main.worker_metrics.clear()
+
+    # A worker pushes its own metrics, without the state process's gauges, and answers alone when that fails
+    with patch.object(main, "STATE_URL", "http://state"), \
+         patch.object(main, "fetch_text", AsyncMock(return_value=None), create=True) as fetch:
+        text = client.get("/metrics").text
+    assert fetch.await_args.args[1] == f"/metrics/workers/{os.getpid()}" and fetch.await_args.kwargs["method"] == "PUT"
+    assert "shell_jobs_running" not in fetch.await_args.kwargs["content"]
+    assert f'http_requests_in_flight{{method="GET",worker="{os.getpid()}"}} 1' in text
+
+if __name__ == "__main__":
+    test_stateful_endpoints_are_forwarded_and_others_served_locally()
+    test_client_disconnect_closes_the_upstream_stream()
+    test_state_process_serves_the_metrics_workers_push()
+    print("Tests passed successfully!")
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from search import SearchCache
+
+class FakeProvider:
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def search(self, query, max_results):
+        with self.lock:
+            self.calls.append((query, max_results))
+        time.sleep(self.delay)
+        if query == "boom":
+            raise RuntimeError("provider down")
+        return [{"title": f"{query} {i}"} for i in range(max_results)]
+
+def test_normalized_queries_hit_the_cache_and_expire():
+    provider = FakeProvider()
+    cache = SearchCache(provider, ttl=0.2, size=8)
+    async def run():
+        first, cached = await cache.search("Python  Asyncio", 3)
+        assert not cached and len(first) == 3
+        again, cached = await cache.search(" python asyncio ", 3)
+        assert cached and again == first
+        await cache.search("python asyncio", 5)
+        await asyncio.sleep(0.3)
+        _, cached = await cache.search("python asyncio", 3)
+        assert not cached
+    asyncio.run(run())
+    # Queries are normalized for the cache key only
+    assert provider.calls == [("Python  Asyncio", 3), ("python asyncio", 5), ("python asyncio", 3)]
+    assert cache.metrics()["hits"] == 1 and cache.metrics()["misses"] == 3
+
+def test_concurrent_identical_queries_share_one_call():
+    provider = FakeProvider(delay=0.1)
+    cache = SearchCache(provider)
+    async def run():
+        return await asyncio.gather(*(cache.search("same query") for _ in range(10)))
+    results = asyncio.run(run())
+    assert len(provider.calls) == 1
+    assert all(r[0] == results[0][0] for r in results)
+    assert cache.metrics()["coalesced"] == 9
+
+def test_cancelled_caller_does_not_fail_the_others():
+    provider = FakeProvider(delay=0.1)
+    cache = SearchCache(provider)
+    async def run():
+        leader = asyncio.ensure_future(cache.search("shared"))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(cache.search("shared"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results, cached = await follower
+        assert cached and len(results) == 5 and leader.cancelled()
+    asyncio.run(run())
+    assert len(provider.calls) == 1 and [q for q, _ in cache.entries] == ["shared"]
+
+def test_lru_eviction_errors_and_persistence():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "search.json")
+        provider = FakeProvider()
+        cache = SearchCache(provider, size=2, path=path)
+        async def run():
+            await cache.search("a")
+            await cache.search("b")
+            await cache.search("a")
+            await cache.search("c")
+            try:
+                await cache.search("boom")
+                assert False, "expected provider error"
+            except RuntimeError:
+                pass
+        asyncio.run(run())
+        assert [q for q, _ in cache.entries] == ["a", "c"]
+        assert cache.metrics()["evictions"] == 1 and cache.metrics()["errors"] == 1
+
+        reloaded = SearchCache(FakeProvider(), size=2, path=path)
+        _, cached = asyncio.run(reloaded.search("c"))
+        assert cached and not reloaded.provider.calls
+
+def test_concurrent_saves_and_failed_saves_do_not_fail_searches():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "search.json")
+        cache = SearchCache(FakeProvider(delay=0.01), size=64, path=path)
+        async def run():
+            return await asyncio.gather(*(cache.search(f"q{i}") for i in range(32)))
+        assert all(not cached for _, cached in asyncio.run(run()))
+        assert len(SearchCache(FakeProvider(), size=64, path=path).entries) == 32
+        assert os.listdir(tmp) == ["search.json"]
+
+        # A path that cannot be written costs the cache file, not the results
+        cache.path = os.path.join(path, "not-a-directory", "search.json")
+        results, cached = asyncio.run(cache.search("after"))
+        assert len(results) == 5 and cache.metrics()["save_errors"] == 1
+
+if __name__ == "__main__":
+    test_normalized_queries_hit_the_cache_and_expire()
+    test_concurrent_identical_queries_share_one_call()
+    test_cancelled_caller_does_not_fail_the_others()
+    test_lru_eviction_errors_and_persistence()
+    test_concurrent_saves_and_failed_saves_do_not_fail_searches()
+    print("Tests passed successfully!")
@@ -0,0 +1,31 @@
+import asyncio
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+import main
+import shell
+from shell import ShellEngine
+
+def test_stream_queue_is_bounded_and_drops_lines_a_slow_reader_misses():
+    async def run():
+        engine = ShellEngine()
+        job = engine.start("seq 1 100", stream=True)
+        await job.task
+        return job, [item async for item in job.events()]
+
+    with patch.object(shell, "STREAM_QUEUE_LINES", 5):
+        job, events = asyncio.run(run())
+    assert events == [("stdout", f"{i}\n") for i in range(1, 6)] + [("dropped", 95), ("exit", None)]
+    # Dropped lines are only missing from the stream, not from the output
+    assert job.text("stdout") == "".join(f"{i}\n" for i in range(1, 101))
+
+def test_failed_one_shot_commands_are_discarded():
+    client = TestClient(main.app)
+    before = set(main.shell_engine.jobs)
+    response = client.post("/shell/execute", json={"command": "sleep 5", "timeout": 1})
+    assert response.status_code == 408
+    assert set(main.shell_engine.jobs) == before
+
+if __name__ == "__main__":
+    test_stream_queue_is_bounded_and_drops_lines_a_slow_reader_misses()
+    test_failed_one_shot_commands_are_discarded()
+    print("Tests passed successfully!")
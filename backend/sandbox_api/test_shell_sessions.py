@@ -0,0 +1,82 @@
+import asyncio
+import time
+from fastapi.testclient import TestClient
+import main
+from pty_sessions import PtySessionManager, SessionLimit
+
+def test_sessions_keep_state_between_commands():
+    with TestClient(main.app) as client:
+        session_id = client.post("/shell/sessions", json={"cwd": "/tmp", "env": {"GREETING": "hi"}}).json()["session_id"]
+        exec_url = f"/shell/sessions/{session_id}/exec"
+        assert client.post(exec_url, json={"command": "cd /usr && export FOO=bar"}).json()["exit_code"] == 0
+        result = client.post(exec_url, json={"command": "pwd; echo $FOO $GREETING; test -t 1 && echo tty"}).json()
+        assert result["output"] == "/usr\nbar hi\ntty\n" and result["status"] == "completed"
+        assert client.post(exec_url, json={"command": "false"}).json()["exit_code"] == 1
+
+        # A command past its timeout is interrupted; the session stays usable
+        start = time.time()
+        result = client.post(exec_url, json={"command": "sleep 30", "timeout": 1}).json()
+        assert result["status"] == "timed_out" and time.time() - start < 5
+        assert client.post(exec_url, json={"command": "echo $FOO"}).json()["output"] == "bar\n"
+
+        # Raw input, read back incrementally from an offset
+        offset = client.get(f"/shell/sessions/{session_id}/output").json()["offset"]
+        client.post(f"/shell/sessions/{session_id}/input", json={"data": "for i in 1 2 3; do echo tick $i; done\n"})
+        seen = ""
+        deadline = time.time() + 5
+        while seen.count("tick") < 3 and time.time() < deadline:
+            page = client.get(f"/shell/sessions/{session_id}/output", params={"offset": offset, "wait": 1}).json()
+            seen += page["output"]
+            offset = page["offset"]
+        assert seen == "tick 1\ntick 2\ntick 3\n"
+
+        assert [s["session_id"] for s in client.get("/shell/sessions").json()["sessions"]] == [session_id]
+        assert client.delete(f"/shell/sessions/{session_id}").json() == {"status": "success"}
+        assert client.post(exec_url, json={"command": "true"}).status_code == 404
+
+def test_long_and_stdin_reading_commands():
+    async def run():
+        manager = PtySessionManager()
+        shell = await manager.create()
+        # Longer than the terminal's ~4 KiB line limit
+        result = await shell.exec("echo " + "a" * 5000 + " | wc -c")
+        assert result["output"].strip() == "5001" and result["exit_code"] == 0
+        # stdin is /dev/null, so a read fails at once instead of eating the exit marker
+        start = time.time()
+        result = await shell.exec("read x", timeout=5)
+        assert result["status"] == "completed" and result["exit_code"] == 1 and time.time() - start < 2
+
+        # Interactive commands read what is written to the terminal
+        task = asyncio.create_task(shell.exec("read x; echo got $x", timeout=5, interactive=True))
+        await asyncio.sleep(0.2)
+        shell.write(b"hello\n")
+        result = await task
+        assert result["output"] == "got hello\n" and result["exit_code"] == 0
+        await manager.shutdown()
+
+    asyncio.run(run())
+
+def test_session_cap_and_idle_timeout():
+    async def run():
+        manager = PtySessionManager(max_sessions=2, idle_timeout=0.2)
+        first = await manager.create()
+        await manager.create()
+        try:
+            await manager.create()
+            assert False, "expected SessionLimit"
+        except SessionLimit:
+            pass
+        result = await first.exec("exit 3")
+        assert result["status"] == "exited"
+        await asyncio.sleep(0.3)
+        await manager.reap()
+        assert not manager.sessions and first.master is None
+        await manager.shutdown()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_sessions_keep_state_between_commands()
+    test_long_and_stdin_reading_commands()
+    test_session_cap_and_idle_timeout()
+    print("Tests passed successfully!")
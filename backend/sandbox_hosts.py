@@ -0,0 +1,150 @@
+import threading
+from urllib.parse import urlparse
+import docker
+
+
+class NoHostAvailable(Exception):
+    pass
+
+
+class SandboxHost:
+    """One Docker engine that sandboxes can be placed on.
+
+    `address` is how the main server reaches published sandbox ports on
+    this host; it defaults to the hostname of the Docker endpoint, or
+    localhost for a local socket. Only `local` hosts share this machine's
+    filesystem, so only they get the source tree and Docker socket mounted.
+    """
+
+    def __init__(self, name, client, address="localhost", max_active=0, local=None):
+        self.name = name
+        self.client = client
+        self.address = address
+        self.max_active = max_active
+        self.local = address in ("localhost", "127.0.0.1") if local is None else local
+        self.memory = None
+
+    def probe(self):
+        """Look up the engine's memory; this calls Docker, so keep it off the event loop."""
+        if self.memory is None:
+            self.memory = self.client.info()["MemTotal"]
+
+    def capacity(self, mem_limit_bytes=None):
+        """Maximum sandboxes on this host, or None when unbounded (or not probed yet)."""
+        if self.max_active:
+            return self.max_active
+        if mem_limit_bytes and self.memory is not None:
+            return max(self.memory // mem_limit_bytes, 1)
+        return None
+
+
+def parse_hosts(spec, client_factory=None):
+    """Build hosts from SANDBOX_HOSTS, e.g. "tcp://10.0.0.2:2375#20,ssh://ops@10.0.0.3".
+
+    Entries are Docker endpoints, optionally followed by `#<max sandboxes>`.
+    """
+    client_factory = client_factory or (lambda url: docker.DockerClient(base_url=url))
+    hosts = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        url, _, max_active = entry.partition("#")
+        address = urlparse(url).hostname if "://" in url else None
+        if not address or url.startswith("unix://"):
+            address = "localhost"
+        hosts.append(SandboxHost(url, client_factory(url), address=address,
+                                 max_active=int(max_active or 0)))
+    return hosts
+
+
+class HostScheduler:
+    """Places sandbox containers on the least-loaded Docker host.
+
+    Load is the number of containers (sessions and warm pool entries) a host
+    currently runs, relative to its capacity. Placements are keyed by
+    container name, like port leases, so they follow warm containers when
+    they are renamed to a session.
+    """
+
+    def __init__(self, hosts, mem_limit_bytes=None):
+        if not hosts:
+            raise ValueError("At least one sandbox host is required")
+        self.hosts = {host.name: host for host in hosts}
+        self.mem_limit_bytes = mem_limit_bytes
+        self.lock = threading.Lock()
+        self.placements = {}
+        self.load = {name: 0 for name in self.hosts}
+
+    def _rank(self, host):
+        # (fraction of capacity in use, containers running); None when full
+        load = self.load[host.name]
+        capacity = host.capacity(self.mem_limit_bytes)
+        if capacity is None:
+            return 0, load
+        if load >= capacity:
+            return None
+        return load / capacity, load
+
+    def probe(self):
+        """Fetch what host capacities depend on; blocking, and done before taking the lock."""
+        if self.mem_limit_bytes:
+            for host in self.hosts.values():
+                if not host.max_active:
+                    host.probe()
+
+    def place(self, key, host=None):
+        """Assign `key` to `host` (by name), or to the least-loaded host with room."""
+        if host is None:
+            self.probe()
+        with self.lock:
+            if key in self.placements:
+                return self.placements[key]
+            if host is None:
+                candidates = [(self._rank(h), h) for h in self.hosts.values()]
+                candidates = [(rank, h) for rank, h in candidates if rank is not None]
+                if not candidates:
+                    raise NoHostAvailable("All sandbox hosts are at capacity")
+                host = min(candidates, key=lambda c: c[0])[1]
+            else:
+                host = self.hosts[host]
+            self.placements[key] = host
+            self.load[host.name] += 1
+            return host
+
+    def release(self, key):
+        with self.lock:
+            host = self.placements.pop(key, None)
+            if host is not None:
+                self.load[host.name] -= 1
+            return host
+
+    def rename(self, old_key, new_key):
+        with self.lock:
+            self.placements[new_key] = self.placements.pop(old_key)
+
+    def get(self, key):
+        return self.placements.get(key)
+
+    def total(self):
+        """Containers placed across all hosts."""
+        with self.lock:
+            return len(self.placements)
+
+    def capacity(self):
+        """Total sandboxes across all hosts, or None when any host is unbounded."""
+        total = 0
+        for host in self.hosts.values():
+            capacity = host.capacity(self.mem_limit_bytes)
+            if capacity is None:
+                return None
+            total += capacity
+        return total
+
+    def metrics(self):
+        with self.lock:
+            return [
+                {"host": name, "address": host.address, "load": self.load[name],
+                 "capacity": host.capacity(self.mem_limit_bytes)}
+                for name, host in self.hosts.items()
+            ]
@@ -0,0 +1,232 @@
+import asyncio
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from backend.event_bus import event_bus
+from backend.sandbox_manager import sandbox_manager
+
+WORKERS = int(os.getenv("SANDBOX_WORKERS", "16"))
+QUEUE_MAX = int(os.getenv("SANDBOX_QUEUE_MAX", "0"))
+QUEUE_TIMEOUT = float(os.getenv("SANDBOX_QUEUE_TIMEOUT", "300"))
+FAILED_RETENTION = float(os.getenv("SANDBOX_FAILED_RETENTION", "3600"))
+# Warm pool containers becoming idle free room without notifying queued creates
+SLOT_POLL = 1.0
+
+
+class SandboxNotFound(Exception):
+    pass
+
+
+class SandboxFailed(Exception):
+    pass
+
+
+class AdmissionRejected(Exception):
+    pass
+
+
+class SandboxJobs:
+    """Runs blocking Docker lifecycle calls off the event loop.
+
+    `create` returns as soon as provisioning is scheduled; readiness (or
+    failure) is published to the session's event stream as a
+    `sandbox_status` event, and `wait_ready` lets callers await it.
+
+    When the hosts are full (see `SandboxManager.has_room`), up to
+    `queue_max` creates wait in a "queued" state for a slot; beyond that
+    `create` raises AdmissionRejected.
+
+    A failed create keeps its status, error included, for
+    `failed_retention` seconds.
+    """
+
+    def __init__(self, manager=sandbox_manager, bus=event_bus, workers=WORKERS,
+                 queue_max=QUEUE_MAX, queue_timeout=QUEUE_TIMEOUT, failed_retention=FAILED_RETENTION):
+        self.manager = manager
+        self.bus = bus
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sandbox-job")
+        self.jobs = {}
+        self.cleanup = None
+        self.queue_max = queue_max
+        self.queue_timeout = queue_timeout
+        self.failed_retention = failed_retention
+        self.slots = asyncio.Condition()
+        self.provisioning = 0
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _has_slot(self):
+        # Judged by host load, warm pool containers included, so an admitted create finds a host
+        return self.manager.has_room()
+
+    def queued(self):
+        return sum(1 for job in self.jobs.values() if job["status"] == "queued")
+
+    def create(self, session_id=None):
+        self._prune()
+        session_id = session_id or str(uuid.uuid4())
+        status = "provisioning"
+        if not self._has_slot() or self.queued():
+            if self.queued() >= self.queue_max:
+                raise AdmissionRejected("No sandbox capacity available")
+            status = "queued"
+        else:
+            # Reserve the slot now so concurrent creates cannot overshoot capacity
+            self.provisioning += 1
+            self.manager.reserve(session_id)
+        job = self.jobs[session_id] = {"status": status, "error": None}
+        job["task"] = asyncio.create_task(self._provision(session_id, job))
+        # Failures are reported through the job status; don't warn about unretrieved exceptions
+        job["task"].add_done_callback(lambda task: task.cancelled() or task.exception())
+        self.bus.emit(session_id, {"type": "sandbox_status", "status": status})
+        return session_id
+
+    def _prune(self):
+        now = time.monotonic()
+        for session_id, job in list(self.jobs.items()):
+            if job["status"] == "failed" and now - job["failed_at"] > self.failed_retention:
+                del self.jobs[session_id]
+
+    def _fail(self, session_id, job, error):
+        job["status"], job["error"], job["failed_at"] = "failed", error, time.monotonic()
+        self.bus.emit(session_id, {"type": "sandbox_status", "status": "failed", "error": error})
+        return SandboxFailed(error)
+
+    async def _release_slot(self):
+        async with self.slots:
+            self.slots.notify_all()
+
+    async def _until(self, predicate):
+        # Like Condition.wait_for, but also re-checks every SLOT_POLL seconds
+        while not predicate():
+            try:
+                await asyncio.wait_for(self.slots.wait(), SLOT_POLL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _wait_for_slot(self, session_id, job):
+        try:
+            async with self.slots:
+                # Queued creates are admitted in order as slots free up
+                await asyncio.wait_for(
+                    self._until(lambda: job.get("cancelled") or (
+                        self._has_slot() and self._first_queued() == session_id)),
+                    self.queue_timeout,
+                )
+                if job.get("cancelled"):
+                    raise SandboxNotFound(session_id)
+                self.provisioning += 1
+                self.manager.reserve(session_id)
+                job["status"] = "provisioning"
+                self.slots.notify_all()
+        except asyncio.TimeoutError:
+            raise self._fail(session_id, job, "Timed out waiting for sandbox capacity")
+        self.bus.emit(session_id, {"type": "sandbox_status", "status": "provisioning"})
+
+    async def _provision(self, session_id, job):
+        if job["status"] == "queued":
+            await self._wait_for_slot(session_id, job)
+        try:
+            if job.get("cancelled"):
+                raise SandboxNotFound(session_id)
+            _, info = await self._run(self.manager.create_sandbox, session_id)
+        except SandboxNotFound:
+            raise
+        except Exception as e:
+            raise self._fail(session_id, job, str(e))
+        finally:
+            self.provisioning -= 1
+            self.manager.unreserve(session_id)
+            await self._release_slot()
+        if job.get("cancelled"):
+            # Stopped while provisioning; tear down what we just started
+            await self._run(self.manager.stop_sandbox, session_id)
+            raise SandboxNotFound(session_id)
+        job["status"] = "running"
+        # From here on the manager's registry is the source of truth
+        if self.jobs.get(session_id) is job:
+            del self.jobs[session_id]
+        self.bus.emit(session_id, {"type": "sandbox_status", "status": "running",
+                                   "ports": info["ports"], "host": info.get("host")})
+        return info
+
+    def _first_queued(self):
+        for session_id, job in self.jobs.items():
+            if job["status"] == "queued" and not job.get("cancelled"):
+                return session_id
+        return None
+
+    def status(self, session_id):
+        job = self.jobs.get(session_id)
+        if job is not None:
+            info = self.manager.get_sandbox(session_id) or {}
+            return {"session_id": session_id, "status": job["status"], "error": job["error"],
+                    "ports": info.get("ports"), "host": info.get("host")}
+        info = self.manager.get_sandbox(session_id)
+        if info is None:
+            return None
+        return {"session_id": session_id, "status": "running", "error": None,
+                "ports": info["ports"], "host": info.get("host")}
+
+    async def wait_ready(self, session_id):
+        job = self.jobs.get(session_id)
+        if job is None:
+            info = self.manager.get_sandbox(session_id)
+            if info is None:
+                raise SandboxNotFound(session_id)
+            return info
+        return await asyncio.shield(job["task"])
+
+    async def stop(self, session_id, checkpoint=False):
+        job = self.jobs.pop(session_id, None)
+        if job is not None and not job["task"].done():
+            job["cancelled"] = True
+            job["status"] = "stopping"
+            await self._release_slot()
+            try:
+                await asyncio.shield(job["task"])
+            except Exception:
+                pass
+            return
+        if checkpoint:
+            await self._run(self.manager.checkpoint, session_id)
+        await self._run(self.manager.stop_sandbox, session_id)
+        if not checkpoint:
+            # After the container is gone: a session resumed from its checkpoint still runs on that image
+            await self._run(self.manager.discard_checkpoint, session_id)
+        await self._release_slot()
+
+    async def reap_idle(self, ttl, checkpoint=False):
+        """Stop sandboxes with no activity for `ttl` seconds; returns their session ids."""
+        idle = self.manager.idle_sessions(ttl)
+        await asyncio.gather(*(self.stop(session_id, checkpoint=checkpoint) for session_id in idle),
+                             *(self.bus.prepare(session_id) for session_id in idle))
+        for session_id in idle:
+            self.bus.emit(session_id, {"type": "sandbox_status", "status": "stopped",
+                                       "reason": "idle", "checkpointed": checkpoint})
+        return idle
+
+    async def stop_many(self, session_ids):
+        await asyncio.gather(*(self.stop(session_id) for session_id in session_ids))
+
+    async def recover(self):
+        """Restore sandboxes from the registry, then remove orphaned containers in the background."""
+        result = await self._run(self.manager.recover)
+        # Probe host capacities here so admission checks never call Docker on the event loop
+        await self._run(self.manager.scheduler.probe)
+        orphans = result.pop("orphans")
+        result["orphans"] = len(orphans)
+        if orphans:
+            task = asyncio.gather(*(self._run(self.manager._remove_container, c, c.name) for c in orphans),
+                                  return_exceptions=True)
+            self.cleanup = task
+        return result
+
+    async def shutdown(self):
+        # Waits for running Docker calls, so not on the event loop
+        await asyncio.to_thread(self.executor.shutdown, wait=True)
+
+
+sandbox_jobs = SandboxJobs()
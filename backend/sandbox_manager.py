@@ -1,77 +1,313 @@
 import docker
 import os
+import threading
 import uuid
 import time
+from backend.port_allocator import PortAllocator
+from backend.sandbox_hosts import HostScheduler, SandboxHost, parse_hosts
+from backend.sandbox_pool import SandboxPool
+from backend.sandbox_registry import SandboxRegistry
+
+SANDBOX_LABEL = "sheikh-ai.sandbox"
+CHECKPOINT_REPOSITORY = "sheikh-ai-checkpoint"
+
+def parse_bytes(value):
+    """Parse a Docker-style size such as "512m" or "2g" into bytes."""
+    units = {"b": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30}
+    value = value.strip().lower()
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
 
 class SandboxManager:
-    def __init__(self):
-        self.client = docker.from_env()
+    def __init__(self, state_dir=None):
+        # Port journal and registry live here unless SANDBOX_PORT_STATE / SANDBOX_REGISTRY say otherwise
+        state_dir = state_dir or os.getenv("SANDBOX_STATE_DIR", "sandboxes")
         self.image_name = "sheikh-ai-sandbox"
         self.sandboxes = {}
+        # Sessions admitted by the job layer whose containers are not placed on a host yet
+        self.reserved = set()
+        self.reserved_lock = threading.Lock()
+        self.last_active = {}
+        # Per-container resource limits; unset means no limit
+        self.mem_limit = os.getenv("SANDBOX_MEM_LIMIT") or None
+        self.cpus = float(os.getenv("SANDBOX_CPUS", "0"))
+        self.max_active = int(os.getenv("SANDBOX_MAX_ACTIVE", "0"))
+        # Docker engines to spread sandboxes over; the local engine by default
+        hosts_spec = os.getenv("SANDBOX_HOSTS", "")
+        hosts = parse_hosts(hosts_spec) if hosts_spec else [SandboxHost("local", docker.from_env())]
+        for host in hosts:
+            host.max_active = host.max_active or self.max_active
+        self.scheduler = HostScheduler(hosts, mem_limit_bytes=parse_bytes(self.mem_limit) if self.mem_limit else None)
+        self.ports = PortAllocator(
+            base_port=int(os.getenv("SANDBOX_PORT_BASE", "20000")),
+            max_blocks=int(os.getenv("SANDBOX_PORT_BLOCKS", "1000")),
+            state_path=os.getenv("SANDBOX_PORT_STATE", os.path.join(state_dir, "ports.json")),
+        )
+        self.registry = SandboxRegistry(os.getenv("SANDBOX_REGISTRY", os.path.join(state_dir, "registry.db")))
+        self.pool = SandboxPool(
+            self,
+            min_size=int(os.getenv("SANDBOX_POOL_MIN", "0")),
+            max_size=int(os.getenv("SANDBOX_POOL_MAX", "0")),
+            idle_ttl=float(os.getenv("SANDBOX_POOL_IDLE_TTL", "600")),
+        )
+
+    def _resource_limits(self):
+        limits = {}
+        if self.mem_limit:
+            limits["mem_limit"] = self.mem_limit
+        if self.cpus:
+            limits["nano_cpus"] = int(self.cpus * 1e9)
+        return limits
+
+    def _start_container(self, name, image=None, host=None):
+        host = self.scheduler.place(name, host)
+        # Each sandbox leases one contiguous block of host ports
+        try:
+            ports = self.ports.allocate(name)
+        except Exception:
+            self.scheduler.release(name)
+            raise
+        api_port = ports["api"]
+        vnc_port = ports["vnc"]
+        novnc_port = ports["novnc"]
+        cdp_port = ports["cdp"]
+
+        # A remote engine would create an empty directory for the source path, hiding the image's /app
+        volumes = {
+            '/var/run/docker.sock': {'bind': '/var/run/docker.sock', 'mode': 'rw'},
+            os.getcwd(): {'bind': '/app', 'mode': 'rw'}
+        } if host.local else {}
+
+        try:
+            container = host.client.containers.run(
+                image or self.image_name,
+                detach=True,
+                ports={
+                    '8080/tcp': api_port,
+                    '5900/tcp': vnc_port,
+                    '6080/tcp': novnc_port,
+                    '9222/tcp': cdp_port
+                },
+                volumes=volumes,
+                name=name,
+                labels={SANDBOX_LABEL: "true"},
+                environment={
+                    "API_PORT": api_port,
+                    "VNC_PORT": vnc_port,
+                    "NOVNC_PORT": novnc_port,
+                    "CDP_PORT": cdp_port
+                },
+                **self._resource_limits()
+            )
+        except Exception:
+            self.ports.release(name)
+            self.scheduler.release(name)
+            raise
+        return container, ports
+
+    def _remove_container(self, container, name):
+        try:
+            container.stop()
+            container.remove()
+        except docker.errors.APIError:
+            pass
+        self.ports.release(name)
+        self.scheduler.release(name)
+
+    def api_url(self, name, ports=None):
+        """Where the main server reaches the sandbox API of container `name`."""
+        ports = ports or self.ports.get(name)
+        return f"http://{self.scheduler.get(name).address}:{ports['api']}"
 
     def create_sandbox(self, session_id=None):
         if not session_id:
             session_id = str(uuid.uuid4())
 
-        # In a multi-agent scenario, we map to available host ports
-        # We start searching from the requested default ports
-
-        def find_available_port(start_port):
-            import socket
-            port = start_port
-            while port < start_port + 1000:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    if s.connect_ex(('localhost', port)) != 0:
-                        return port
-                port += 1
-            return None
-
-        api_port = find_available_port(8080)
-        vnc_port = find_available_port(5900)
-        novnc_port = find_available_port(6080)
-        cdp_port = find_available_port(9222)
-
-        container = self.client.containers.run(
-            self.image_name,
-            detach=True,
-            ports={
-                '8080/tcp': api_port,
-                '5900/tcp': vnc_port,
-                '6080/tcp': novnc_port,
-                '9222/tcp': cdp_port
-            },
-            volumes={
-                '/var/run/docker.sock': {'bind': '/var/run/docker.sock', 'mode': 'rw'},
-                os.getcwd(): {'bind': '/app', 'mode': 'rw'}
-            },
-            name=f"sandbox-{session_id}",
-            environment={
-                "API_PORT": api_port,
-                "VNC_PORT": vnc_port,
-                "NOVNC_PORT": novnc_port,
-                "CDP_PORT": cdp_port
-            }
-        )
+        name = f"sandbox-{session_id}"
+        # A session stopped with a checkpoint resumes from its committed image
+        # Checkpoint images live on the engine that committed them
+        checkpoint = self.registry.get_checkpoint(session_id)
+        warm = self.pool.acquire() if checkpoint is None else None
+        if warm is not None:
+            container, ports = warm.container, warm.ports
+            container.rename(name)
+            self.ports.rename(warm.name, name)
+            self.scheduler.rename(warm.name, name)
+        else:
+            host = self._checkpoint_host(session_id) if checkpoint else None
+            capacity = self.capacity()
+            if capacity is not None and self.scheduler.total() >= capacity:
+                # Admission counted idle warm containers as free; one gives its slot up
+                self.pool.evict()
+            container, ports = self._start_container(name, image=checkpoint, host=host)
+        self.unreserve(session_id)
 
+        host = self.scheduler.get(name)
         self.sandboxes[session_id] = {
             "container": container,
-            "ports": {
-                "api": api_port,
-                "vnc": vnc_port,
-                "novnc": novnc_port,
-                "cdp": cdp_port
-            }
+            "name": name,
+            "ports": ports,
+            "host": host.name,
+            "url": self.api_url(name, ports)
         }
+        self.registry.put(session_id, container.id, name, ports, host.name)
+        self.touch(session_id)
         return session_id, self.sandboxes[session_id]
 
     def stop_sandbox(self, session_id):
         if session_id in self.sandboxes:
-            container = self.sandboxes[session_id]
-            container.stop()
-            container.remove()
+            sandbox = self.sandboxes[session_id]
+            self._remove_container(sandbox["container"], sandbox["name"])
             del self.sandboxes[session_id]
+            self.last_active.pop(session_id, None)
+            self.registry.delete(session_id)
+
+    def checkpoint(self, session_id):
+        """Commit the sandbox's filesystem to an image so a later create can resume it."""
+        sandbox = self.sandboxes.get(session_id)
+        if sandbox is None:
+            return None
+        sandbox["container"].commit(repository=CHECKPOINT_REPOSITORY, tag=session_id)
+        image = f"{CHECKPOINT_REPOSITORY}:{session_id}"
+        self.registry.put_checkpoint(session_id, image, sandbox["host"])
+        return image
+
+    def _checkpoint_host(self, session_id):
+        host = self.registry.get_checkpoint_host(session_id)
+        return host if host in self.scheduler.hosts else next(iter(self.scheduler.hosts))
+
+    def discard_checkpoint(self, session_id):
+        image = self.registry.get_checkpoint(session_id)
+        if image is None:
+            return
+        host = self.scheduler.hosts[self._checkpoint_host(session_id)]
+        self.registry.delete_checkpoint(session_id)
+        try:
+            host.client.images.remove(image)
+        except docker.errors.APIError:
+            pass
+
+    def touch(self, session_id):
+        self.last_active[session_id] = time.time()
+
+    def idle_sessions(self, ttl):
+        cutoff = time.time() - ttl
+        return [session_id for session_id in self.sandboxes if self.last_active.get(session_id, 0) < cutoff]
+
+    def capacity(self):
+        """Maximum concurrent sandboxes across all hosts, or None when unbounded.
+
+        Needs no Docker call once `scheduler.probe()` has run.
+        """
+        return self.scheduler.capacity()
+
+    def reserve(self, session_id):
+        with self.reserved_lock:
+            self.reserved.add(session_id)
+
+    def unreserve(self, session_id):
+        with self.reserved_lock:
+            self.reserved.discard(session_id)
+
+    def has_room(self):
+        """Whether one more session can be admitted.
+
+        Every placed container counts, warm pool ones included, and so does
+        every reserved session. Idle warm containers count as free: a create
+        takes one over, or evicts one to make room.
+        """
+        capacity = self.capacity()
+        if capacity is None:
+            return True
+        with self.reserved_lock:
+            reserved = len(self.reserved)
+        return self.scheduler.total() + reserved - self.pool.idle_count() < capacity
+
+    def room_for_warm(self):
+        """Whether the warm pool may start a container without taking a reserved session's slot."""
+        capacity = self.capacity()
+        if capacity is None:
+            return True
+        with self.reserved_lock:
+            reserved = len(self.reserved)
+        return self.scheduler.total() + reserved < capacity
+
+    def recover(self):
+        """Re-attach to sandboxes that survived a server restart.
+
+        One labelled `docker ps` per host is matched against the registry:
+        running containers are restored, vanished ones are dropped with their
+        port leases, and labelled containers nobody owns (e.g. old warm pool
+        entries) are returned so the caller can remove them.
+        """
+        live = {}
+        for host in self.scheduler.hosts.values():
+            for c in host.client.containers.list(all=True, filters={"label": SANDBOX_LABEL}):
+                live[(host.name, c.id)] = c
+        default_host = next(iter(self.scheduler.hosts))
+        restored = set()
+        stale = []
+        for entry in self.registry.all():
+            host = entry["host"] or default_host
+            container = live.get((host, entry["container_id"]))
+            if container is not None and container.status == "running":
+                self.scheduler.place(entry["name"], host)
+                self.sandboxes[entry["session_id"]] = {
+                    "container": container,
+                    "name": entry["name"],
+                    "ports": entry["ports"],
+                    "host": host,
+                    "url": self.api_url(entry["name"], entry["ports"])
+                }
+                self.touch(entry["session_id"])
+                restored.add((host, container.id))
+            else:
+                stale.append(entry["session_id"])
+                self.ports.release(entry["name"])
+        self.registry.delete_many(stale)
+        orphans = []
+        for (host, container_id), c in live.items():
+            if (host, container_id) not in restored:
+                # Placed so that removing the orphan releases it on the right host
+                self.scheduler.place(c.name, host)
+                orphans.append(c)
+        # Orphans keep their leases until they are removed; anything else is leaked
+        names = {info["name"] for info in self.sandboxes.values()} | {c.name for c in orphans}
+        for name in list(self.ports.leases):
+            if name not in names:
+                self.ports.release(name)
+        return {"restored": len(restored), "dropped": len(stale), "orphans": orphans}
 
     def get_sandbox(self, session_id):
         return self.sandboxes.get(session_id)
 
-sandbox_manager = SandboxManager()
+    def close(self):
+        self.registry.close()
+        self.ports.close()
+
+class LazySandboxManager:
+    """The process-wide SandboxManager, built on first use.
+
+    Building one connects to Docker and opens the port journal and registry,
+    which importing this module should not do.
+    """
+
+    def __init__(self, factory=SandboxManager):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            # Introspection (mock, asyncio, copy) should not build the manager
+            raise AttributeError(name)
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+                instance = self._instance
+        return getattr(instance, name)
+
+sandbox_manager = LazySandboxManager()
@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+import httpx
+
+
+class WarmSandbox:
+    def __init__(self, name, container, ports):
+        self.name = name
+        self.container = container
+        self.ports = ports
+        self.ready_at = time.time()
+
+
+class SandboxPool:
+    """Keeps started, health-checked sandbox containers ready to hand out.
+
+    The pool refills to `min_size` in a background thread. Every miss raises
+    the refill target by one (up to `max_size`); warm containers above
+    `min_size` that sit unused for `idle_ttl` seconds are reaped again.
+    """
+
+    def __init__(self, manager, min_size=0, max_size=4, idle_ttl=600,
+                 ready_timeout=60, interval=2.0):
+        self.manager = manager
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.idle_ttl = idle_ttl
+        self.ready_timeout = ready_timeout
+        self.interval = interval
+        self.target = min_size
+        self.idle = []
+        self.starting = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.stats = {"hits": 0, "misses": 0, "started": 0, "reaped": 0, "failed": 0}
+
+    def start(self):
+        if self.max_size <= 0 or self.thread is not None:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name="sandbox-pool", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for sandbox in idle:
+            self.manager._remove_container(sandbox.container, sandbox.name)
+
+    def acquire(self):
+        """Return a warm sandbox, or None when the caller must cold-start one."""
+        while True:
+            with self.lock:
+                if not self.idle:
+                    self.stats["misses"] += 1
+                    if self.thread is not None:
+                        self.target = min(self.target + 1, self.max_size)
+                    self.wakeup.set()
+                    return None
+                sandbox = self.idle.pop()
+            if self._healthy(self.manager.api_url(sandbox.name, sandbox.ports), timeout=1):
+                with self.lock:
+                    self.stats["hits"] += 1
+                self.wakeup.set()
+                return sandbox
+            with self.lock:
+                self.stats["failed"] += 1
+            self.manager._remove_container(sandbox.container, sandbox.name)
+
+    def idle_count(self):
+        with self.lock:
+            return len(self.idle)
+
+    def evict(self):
+        """Remove the longest-idle warm container to free its slot; False when none is idle."""
+        with self.lock:
+            if not self.idle:
+                return False
+            sandbox = self.idle.pop(0)
+            self.stats["reaped"] += 1
+        self.manager._remove_container(sandbox.container, sandbox.name)
+        return True
+
+    def metrics(self):
+        with self.lock:
+            return {
+                **self.stats,
+                "idle": len(self.idle),
+                "starting": self.starting,
+                "target": self.target,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            }
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self._reap()
+            self._refill()
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+    def _reap(self):
+        now = time.time()
+        reaped = []
+        with self.lock:
+            keep = []
+            # Oldest first, so the longest-idle containers go before fresh ones
+            for sandbox in self.idle:
+                if len(self.idle) - len(reaped) > self.min_size and now - sandbox.ready_at > self.idle_ttl:
+                    reaped.append(sandbox)
+                else:
+                    keep.append(sandbox)
+            self.idle = keep
+            self.stats["reaped"] += len(reaped)
+            if reaped:
+                self.target = max(self.min_size, len(self.idle) + self.starting)
+        for sandbox in reaped:
+            self.manager._remove_container(sandbox.container, sandbox.name)
+
+    def _refill(self):
+        while not self.stopped.is_set():
+            with self.lock:
+                if len(self.idle) + self.starting >= self.target:
+                    return
+                # Slots admitted sessions are about to take are not the pool's
+                if not self.manager.room_for_warm():
+                    return
+                self.starting += 1
+            sandbox = None
+            try:
+                name = f"sandbox-warm-{os.urandom(4).hex()}"
+                container, ports = self.manager._start_container(name)
+                if self._wait_ready(self.manager.api_url(name, ports)):
+                    sandbox = WarmSandbox(name, container, ports)
+                else:
+                    self.manager._remove_container(container, name)
+            except Exception:
+                pass
+            with self.lock:
+                self.starting -= 1
+                if sandbox is None:
+                    self.stats["failed"] += 1
+                else:
+                    self.stats["started"] += 1
+                    self.idle.append(sandbox)
+            if sandbox is None:
+                # Back off instead of hammering a broken Docker daemon or image
+                return
+
+    def _wait_ready(self, url):
+        deadline = time.time() + self.ready_timeout
+        while time.time() < deadline and not self.stopped.is_set():
+            if self._healthy(url, timeout=2):
+                return True
+            time.sleep(0.5)
+        return False
+
+    def _healthy(self, url, timeout):
+        try:
+            return httpx.get(f"{url}/health", timeout=timeout).status_code == 200
+        except httpx.HTTPError:
+            return False
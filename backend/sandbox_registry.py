@@ -0,0 +1,95 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SandboxRegistry:
+    """Durable session -> container/ports mapping, backed by SQLite."""
+
+    def __init__(self, path):
+        self.path = path
+        dir_name = os.path.dirname(path)
+        if dir_name:
+            os.makedirs(dir_name, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS sandboxes ("
+            " session_id TEXT PRIMARY KEY,"
+            " container_id TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " ports TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " host TEXT)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            " session_id TEXT PRIMARY KEY,"
+            " image TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " host TEXT)"
+        )
+        # Registries written before multi-host scheduling lack the host column
+        for table in ("sandboxes", "checkpoints"):
+            columns = [row[1] for row in self.db.execute(f"PRAGMA table_info({table})")]
+            if "host" not in columns:
+                self.db.execute(f"ALTER TABLE {table} ADD COLUMN host TEXT")
+        self.db.commit()
+
+    def put(self, session_id, container_id, name, ports, host=None):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO sandboxes VALUES (?, ?, ?, ?, ?, ?)",
+                (session_id, container_id, name, json.dumps(ports), time.time(), host),
+            )
+            self.db.commit()
+
+    def delete(self, session_id):
+        with self.lock:
+            self.db.execute("DELETE FROM sandboxes WHERE session_id = ?", (session_id,))
+            self.db.commit()
+
+    def delete_many(self, session_ids):
+        with self.lock:
+            self.db.executemany("DELETE FROM sandboxes WHERE session_id = ?", [(s,) for s in session_ids])
+            self.db.commit()
+
+    def all(self):
+        with self.lock:
+            rows = self.db.execute("SELECT session_id, container_id, name, ports, host FROM sandboxes").fetchall()
+        return [
+            {"session_id": session_id, "container_id": container_id, "name": name,
+             "ports": json.loads(ports), "host": host}
+            for session_id, container_id, name, ports, host in rows
+        ]
+
+    def put_checkpoint(self, session_id, image, host=None):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)",
+                (session_id, image, time.time(), host),
+            )
+            self.db.commit()
+
+    def get_checkpoint(self, session_id):
+        with self.lock:
+            row = self.db.execute("SELECT image FROM checkpoints WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_checkpoint_host(self, session_id):
+        with self.lock:
+            row = self.db.execute("SELECT host FROM checkpoints WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def delete_checkpoint(self, session_id):
+        with self.lock:
+            self.db.execute("DELETE FROM checkpoints WHERE session_id = ?", (session_id,))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -1,15 +1,43 @@
 from fastapi import FastAPI, HTTPException, Request, Depends, status
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
+from typing import List
 from backend.sandbox_manager import sandbox_manager
-from backend.agent import get_or_create_agent
+from backend.agent import get_or_create_agent, agents, output_store
+from backend.session_manager import session_manager
+from backend.http_client import sandbox_http
+from backend.sandbox_jobs import sandbox_jobs, AdmissionRejected
+from backend.event_bus import event_bus
+from backend.sandbox_api.blobs import parse_ref
+from backend.sandbox_api.metrics import CONTENT_TYPE, REGISTRY, Gauge, MetricsMiddleware
 import asyncio
 import json
+import logging
+import os
+import uuid
+
+IDLE_TTL = float(os.getenv("SANDBOX_IDLE_TTL", "0"))
+REAP_INTERVAL = float(os.getenv("SANDBOX_REAP_INTERVAL", "30"))
+CHECKPOINT_ON_IDLE = os.getenv("SANDBOX_CHECKPOINT_ON_IDLE", "0") == "1"
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Sheikh-Ai Main Server")
+app.add_middleware(MetricsMiddleware)
 security = HTTPBearer()
 
+Gauge("sandboxes_active", "Running sandboxes.", function=lambda: len(sandbox_manager.sandboxes))
+Gauge("sandbox_jobs", "Sandbox creates waiting for capacity or being provisioned.", ("status",),
+      function=lambda: {("queued",): sandbox_jobs.queued(), ("provisioning",): sandbox_jobs.provisioning})
+Gauge("sandbox_pool_containers", "Warm pool containers by state.", ("state",),
+      function=lambda: {(state,): sandbox_manager.pool.metrics()[state] for state in ("idle", "starting")})
+Gauge("sandbox_host_load", "Containers placed on each Docker host.", ("host",),
+      function=lambda: {(host["host"],): host["load"] for host in sandbox_manager.scheduler.metrics()})
+Gauge("event_subscribers", "Connected event stream clients.", function=lambda: event_bus.subscriber_count())
+Gauge("event_queue_depth", "Events buffered for event stream clients.", function=lambda: event_bus.queue_depth())
+
 class CreateAgentRequest(BaseModel):
     user_id: str
 
@@ -20,6 +48,9 @@ class MessageRequest(BaseModel):
 class StopRequest(BaseModel):
     session_id: str
 
+class BulkStopRequest(BaseModel):
+    session_ids: List[str]
+
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     # Basic token verification for demonstration
     if credentials.credentials != "secret-token":
@@ -33,51 +64,163 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def metrics():
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/sandbox/pool")
+async def sandbox_pool_metrics(token: str = Depends(verify_token)):
+    return sandbox_manager.pool.metrics()
+
+@app.get("/sandbox/hosts")
+async def sandbox_hosts(token: str = Depends(verify_token)):
+    return sandbox_manager.scheduler.metrics()
+
 @app.post("/agent/create")
 async def create_agent(request: CreateAgentRequest, token: str = Depends(verify_token)):
+    # The container starts in the background; readiness arrives as a sandbox_status event
+    session_id = str(uuid.uuid4())
+    await event_bus.prepare(session_id)
     try:
-        session_id, sandbox_info = sandbox_manager.create_sandbox()
-        return {
-            "session_id": session_id,
-            "status": "created",
-            "ports": sandbox_info["ports"]
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        session_id = sandbox_jobs.create(session_id)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return {
+        "session_id": session_id,
+        "status": sandbox_jobs.status(session_id)["status"]
+    }
+
+@app.get("/agent/status/{session_id}")
+async def agent_status(session_id: str, token: str = Depends(verify_token)):
+    sandbox_status = sandbox_jobs.status(session_id)
+    if sandbox_status is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return sandbox_status
+
+async def sandbox_url(session_id):
+    sandbox_info = await sandbox_jobs.wait_ready(session_id)
+    return sandbox_info["url"]
 
 @app.post("/agent/message")
 async def send_message(request: MessageRequest, token: str = Depends(verify_token)):
-    # Retrieve sandbox port for this session
-    sandbox_info = sandbox_manager.sandboxes.get(request.session_id)
-    if not sandbox_info:
+    sandbox_status = sandbox_jobs.status(request.session_id)
+    if not sandbox_status and sandbox_manager.registry.get_checkpoint(request.session_id):
+        # Reaped while idle: bring the sandbox back from its checkpoint
+        await event_bus.prepare(request.session_id)
+        try:
+            sandbox_jobs.create(request.session_id)
+        except AdmissionRejected as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+        sandbox_status = sandbox_jobs.status(request.session_id)
+    if not sandbox_status:
         raise HTTPException(status_code=404, detail="Session not found")
+    if sandbox_status["status"] == "failed":
+        raise HTTPException(status_code=409, detail=f"Sandbox failed to start: {sandbox_status['error']}")
 
-    agent = get_or_create_agent(request.session_id, sandbox_port=sandbox_info["ports"]["api"])
-    # Process message in background
-    asyncio.create_task(agent.process_message(request.message))
+    sandbox_manager.touch(request.session_id)
+    # Processed in the background, in order with the session's other messages, once the sandbox is ready
+    agent = get_or_create_agent(request.session_id, sandbox_url=None,
+                                connect=lambda: sandbox_url(request.session_id))
+    agent.enqueue(request.message)
     return {"status": "message_received"}
 
 @app.get("/events/{session_id}")
-async def get_events(session_id: str):
-    sandbox_info = sandbox_manager.sandboxes.get(session_id)
-    if not sandbox_info:
+async def get_events(session_id: str, request: Request):
+    if not sandbox_jobs.status(session_id):
         raise HTTPException(status_code=404, detail="Session not found")
 
-    agent = get_or_create_agent(session_id, sandbox_port=sandbox_info["ports"]["api"])
-    return StreamingResponse(agent.event_generator(), media_type="text/event-stream")
+    last_event_id = request.headers.get("last-event-id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+
+    return StreamingResponse(
+        event_bus.sse(session_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/agent/output/{session_id}/{ref}")
+async def get_output(session_id: str, ref: str, token: str = Depends(verify_token)):
+    """Full text of a tool output that was truncated, by the ref under its result's "spilled" key."""
+    try:
+        chunks = output_store.iter(parse_ref(ref))
+        return StreamingResponse(chunks, media_type="text/plain; charset=utf-8")
+    except KeyError:
+        pass
+    # Command output cut down by the sandbox itself stays in the sandbox
+    sandbox = sandbox_manager.sandboxes.get(session_id)
+    if sandbox is not None:
+        response = await sandbox_http.request(sandbox["url"], "GET", f"/blobs/{ref}", "get_output", stream=True)
+        if response.status_code == 200:
+            return StreamingResponse(response.aiter_bytes(), media_type="text/plain; charset=utf-8",
+                                     background=BackgroundTask(response.aclose))
+        await response.aclose()
+    raise HTTPException(status_code=404, detail="Output not found")
+
+async def stop_session(session_id):
+    # Cancel the plan in flight before its sandbox goes away
+    await forget_agent(session_id)
+    await sandbox_jobs.stop(session_id)
+    session_manager.release(session_id)
+
+async def forget_agent(session_id):
+    agent = agents.pop(session_id, None)
+    if agent is not None:
+        await agent.cancel()
+        if agent.sandbox_url is not None:
+            await sandbox_http.close(agent.sandbox_url)
+
+async def reap_idle_sandboxes():
+    while True:
+        await asyncio.sleep(REAP_INTERVAL)
+        try:
+            for session_id in await sandbox_jobs.reap_idle(IDLE_TTL, checkpoint=CHECKPOINT_ON_IDLE):
+                await forget_agent(session_id)
+                session_manager.release(session_id)
+        except Exception:
+            # Keep reaping on the next round, but leave a trace
+            logger.exception("Reaping idle sandboxes failed")
 
 @app.post("/agent/stop")
 async def stop_agent(request: StopRequest, token: str = Depends(verify_token)):
-    sandbox_manager.stop_sandbox(request.session_id)
-    if request.session_id in agents:
-        del agents[request.session_id]
+    await stop_session(request.session_id)
     return {"status": "stopped"}
 
+@app.post("/agent/stop/bulk")
+async def stop_agents(request: BulkStopRequest, token: str = Depends(verify_token)):
+    await asyncio.gather(*(forget_agent(session_id) for session_id in request.session_ids))
+    # Containers are stopped and removed in parallel on the job thread pool
+    await sandbox_jobs.stop_many(request.session_ids)
+    for session_id in request.session_ids:
+        session_manager.release(session_id)
+    return {"status": "stopped", "session_ids": request.session_ids}
+
 @app.post("/mcp/execute")
 async def execute_mcp(request: dict, token: str = Depends(verify_token)):
     # Stub for Model Context Protocol integration
     return {"status": "success", "message": "MCP tool execution stub called", "input": request}
 
+@app.on_event("startup")
+async def startup_event():
+    # Re-attach to sandboxes that outlived the previous server process
+    await sandbox_jobs.recover()
+    sandbox_manager.pool.start()
+    if IDLE_TTL > 0:
+        app.state.reaper = asyncio.create_task(reap_idle_sandboxes())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    reaper = getattr(app.state, "reaper", None)
+    if reaper is not None:
+        reaper.cancel()
+    await sandbox_http.aclose()
+    await asyncio.to_thread(sandbox_manager.pool.stop)
+    await sandbox_jobs.shutdown()
+    sandbox_manager.close()
+    session_manager.close()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,46 +1,149 @@
+import asyncio
 import json
 import os
+import threading
+from collections import OrderedDict
+from backend.event_log import EventLog
+from backend.session_stores import (BUFFER_MAX, FLUSH_INTERVAL, MongoSessionStore, RedisSessionStore,
+                                    WriteBehindBuffer)
+
+MAX_OPEN_LOGS = int(os.getenv("SESSION_MAX_OPEN_LOGS", "256"))
 
 class SessionManager:
-    def __init__(self, storage_dir="sessions", db_type="file"):
+    def __init__(self, storage_dir="sessions", db_type="file", store=None,
+                 flush_interval=FLUSH_INTERVAL, max_pending=BUFFER_MAX, max_open_logs=MAX_OPEN_LOGS):
         self.db_type = db_type
         self.storage_dir = storage_dir
+        # Open logs, least recently used first; each holds a file handle once written to
+        self.logs = OrderedDict()
+        self.max_open_logs = max_open_logs
+        self.lock = threading.Lock()
         if self.db_type == "file" and not os.path.exists(storage_dir):
             os.makedirs(storage_dir)
 
-        # In a real scenario, initialize MongoDB/Redis here
-        # self.db = self._init_db()
+        # Redis and MongoDB sessions are written behind, in batches
+        self.store = None
+        self.buffer = None
+        self.counts = {}
+        if self.db_type != "file":
+            self.store = store or self._init_db()
+            self.buffer = WriteBehindBuffer(self.store, flush_interval, max_pending)
 
     def _init_db(self):
         if self.db_type == "mongodb":
-            # import pymongo
-            # return pymongo.MongoClient(os.getenv("MONGODB_URI"))
-            pass
+            import pymongo
+            client = pymongo.MongoClient(os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+            return MongoSessionStore(client[os.getenv("MONGODB_DB", "sheikh_ai")]["session_events"])
         elif self.db_type == "redis":
-            # import redis
-            # return redis.Redis.from_url(os.getenv("REDIS_URL"))
-            pass
-        return None
+            import redis
+            return RedisSessionStore(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+        raise ValueError(f"Unknown session db type: {self.db_type}")
 
     def _get_session_path(self, session_id):
         return os.path.join(self.storage_dir, f"{session_id}.json")
 
+    def _get_log(self, session_id):
+        with self.lock:
+            log = self.logs.get(session_id)
+            if log is not None:
+                self.logs.move_to_end(session_id)
+                return log
+            log = EventLog(os.path.join(self.storage_dir, session_id))
+            self._migrate_legacy(session_id, log)
+            self.logs[session_id] = log
+            while len(self.logs) > self.max_open_logs:
+                # Reopened from its segments on next use
+                self.logs.popitem(last=False)[1].close()
+        return log
+
+    def _migrate_legacy(self, session_id, log):
+        # Sessions written before the append-only log existed are a single JSON array
+        # The array is removed only once all of it is in the log; a migration cut short resumes where it stopped
+        path = self._get_session_path(session_id)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                events = json.load(f)
+            for event in events[len(log):]:
+                log.append(event)
+            log.sync()
+            os.remove(path)
+
+    def _count(self, session_id):
+        # Offsets are assigned here, before the write-behind flush, so they are known immediately
+        count = self.counts.get(session_id)
+        if count is None:
+            count = self.counts[session_id] = self.store.count(session_id)
+        return count
+
+    def loaded(self, session_id):
+        return session_id in (self.logs if self.db_type == "file" else self.counts)
+
+    def load(self, session_id):
+        """Look up what save_event needs for a session: its open log, or its event count in the store.
+
+        This blocks, so event loop code runs it in a thread first (EventBus.prepare);
+        save_event must not yield and then does no lookup of its own.
+        """
+        if self.db_type == "file":
+            self._get_log(session_id)
+            return
+        if session_id in self.counts:
+            return
+        count = self.store.count(session_id)
+        with self.lock:
+            # Events saved meanwhile already set the count
+            self.counts.setdefault(session_id, count)
+
+    async def drain(self, poll=0.01):
+        """Wait while the write-behind buffer is full; async producers call this before emitting."""
+        while self.buffer is not None and self.buffer.full():
+            await asyncio.sleep(poll)
+
     def save_event(self, session_id, event):
         if self.db_type == "file":
-            path = self._get_session_path(session_id)
-            events = self.get_events(session_id)
-            events.append(event)
-            with open(path, "w") as f:
-                json.dump(events, f)
-        # elif self.db_type == "mongodb":
-        #     self.db.sessions.events.insert_one({"session_id": session_id, **event})
-
-    def get_events(self, session_id):
+            return self._get_log(session_id).append(event)
+        with self.lock:
+            offset = self._count(session_id)
+            self.buffer.add(session_id, offset, event)
+            self.counts[session_id] = offset + 1
+        return offset
+
+    def get_events(self, session_id, start=0, end=None):
         if self.db_type == "file":
-            path = self._get_session_path(session_id)
-            if os.path.exists(path):
-                with open(path, "r") as f:
-                    return json.load(f)
-        return []
+            return self._get_log(session_id).read(start, end)
+        # Pending events first: a flush in between moves them to the store, never out of sight
+        pending = self.buffer.snapshot(session_id)
+        events = dict(self.store.read(session_id, start, end))
+        for offset, event in pending:
+            if offset >= start and (end is None or offset < end):
+                events[offset] = event
+        return [events[offset] for offset in sorted(events)]
+
+    def tail_events(self, session_id, n):
+        if self.db_type == "file":
+            return self._get_log(session_id).tail(n)
+        with self.lock:
+            count = self._count(session_id)
+        return self.get_events(session_id, max(count - n, 0))
+
+    def release(self, session_id):
+        """Close a stopped session's log and forget its count; both are looked up again if it resumes."""
+        with self.lock:
+            log = self.logs.pop(session_id, None)
+            if log is not None:
+                log.close()
+            # A count with events still waiting to be written is the only record of them
+            if self.buffer is not None and not self.buffer.snapshot(session_id):
+                self.counts.pop(session_id, None)
+
+    def close(self):
+        with self.lock:
+            for log in self.logs.values():
+                log.close()
+            self.logs.clear()
+            if self.buffer is not None:
+                self.buffer.close()
+                self.store.close()
+                self.buffer = None
 
 session_manager = SessionManager(db_type=os.getenv("SESSION_DB_TYPE", "file"))
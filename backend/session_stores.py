@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+import time
+
+FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "0.05"))
+BUFFER_MAX = int(os.getenv("SESSION_BUFFER_MAX", "10000"))
+
+
+class RedisSessionStore:
+    """Session events in one Redis stream per session.
+
+    Entry ids are `0-<offset + 1>`, so offset ranges map directly onto
+    XRANGE bounds.
+    """
+
+    def __init__(self, client, prefix="session"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, session_id):
+        return f"{self.prefix}:{session_id}:events"
+
+    def count(self, session_id):
+        return self.client.xlen(self._key(session_id))
+
+    def write(self, batch):
+        pipe = self.client.pipeline(transaction=False)
+        for session_id, offset, event in batch:
+            pipe.xadd(self._key(session_id), {"event": json.dumps(event)}, id=f"0-{offset + 1}")
+        for result in pipe.execute(raise_on_error=False):
+            # A retried batch may hit entries an earlier, partly failed attempt already wrote
+            if isinstance(result, Exception) and "equal or smaller" not in str(result):
+                raise result
+
+    def read(self, session_id, start, end=None):
+        entries = self.client.xrange(self._key(session_id), f"0-{start + 1}", "+" if end is None else f"0-{end}")
+        return [(int(entry_id.split(b"-")[1]) - 1, json.loads(fields[b"event"])) for entry_id, fields in entries]
+
+    def close(self):
+        self.client.close()
+
+
+class MongoSessionStore:
+    """Session events as documents {session_id, offset, event}, written with bulk inserts."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection.create_index([("session_id", 1), ("offset", 1)], unique=True)
+
+    def count(self, session_id):
+        last = self.collection.find_one({"session_id": session_id}, sort=[("offset", -1)])
+        return 0 if last is None else last["offset"] + 1
+
+    def write(self, batch):
+        from pymongo.errors import BulkWriteError
+        try:
+            self.collection.insert_many(
+                [{"session_id": session_id, "offset": offset, "event": event} for session_id, offset, event in batch],
+                ordered=False,
+            )
+        except BulkWriteError as e:
+            # Duplicates are events an earlier, partly failed attempt already wrote
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+
+    def read(self, session_id, start, end=None):
+        query = {"session_id": session_id, "offset": {"$gte": start}}
+        if end is not None:
+            query["offset"]["$lt"] = end
+        return [(doc["offset"], doc["event"]) for doc in self.collection.find(query).sort("offset", 1)]
+
+    def close(self):
+        self.collection.database.client.close()
+
+
+class WriteBehindBuffer:
+    """Batches events for a store and writes them from a background thread.
+
+    Every `flush_interval` seconds the pending events are written in one
+    batch. `add` never touches the store, since it runs on the event loop:
+    once `max_pending` events are held it wakes the thread to flush at once,
+    and `full()` tells async producers to wait (see SessionManager.drain)
+    until a flush makes room. Failed batches are retried on the next flush.
+    `close` stops the thread and writes whatever is left.
+    """
+
+    def __init__(self, store, flush_interval=FLUSH_INTERVAL, max_pending=BUFFER_MAX):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.wakeup = threading.Event()
+        self.stats = {"flushes": 0, "events": 0, "errors": 0}
+        self.thread = threading.Thread(target=self._run, name="session-write-behind", daemon=True)
+        self.thread.start()
+
+    def add(self, session_id, offset, event):
+        with self.lock:
+            self.pending.append((session_id, offset, event))
+            full = len(self.pending) >= self.max_pending
+        if full:
+            self.wakeup.set()
+
+    def full(self):
+        return len(self.pending) >= self.max_pending
+
+    def snapshot(self, session_id):
+        with self.lock:
+            return [(offset, event) for sid, offset, event in self.pending if sid == session_id]
+
+    def flush(self):
+        # One flush at a time keeps batches in offset order
+        with self.flush_lock:
+            with self.lock:
+                batch = self.pending[:]
+            if not batch:
+                return
+            try:
+                self.store.write(batch)
+            except Exception:
+                with self.lock:
+                    self.stats["errors"] += 1
+                raise
+            with self.lock:
+                # Events added during the write stay pending
+                del self.pending[:len(batch)]
+                self.stats["flushes"] += 1
+                self.stats["events"] += len(batch)
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            if self.stopped.is_set():
+                return
+            try:
+                self.flush()
+            except Exception:
+                time.sleep(self.flush_interval)
+
+    def close(self):
+        self.stopped.set()
+        self.wakeup.set()
+        self.thread.join()
+        self.flush()
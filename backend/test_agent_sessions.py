@@ -0,0 +1,35 @@
+import asyncio
+from unittest.mock import patch
+import httpx
+from backend.benchmarks.standin import load_sandbox_api
+from backend.http_client import SandboxHTTPClient
+
+with patch("docker.from_env"):
+    import backend.agent as agent_module
+
+def test_session_exec_steps_share_a_shell_and_reopen_it_when_gone():
+    sandbox = load_sandbox_api()
+
+    async def run():
+        http = SandboxHTTPClient(retries=0)
+        http.get_client("http://sandbox")._transport = httpx.ASGITransport(app=sandbox.app)
+        agent = agent_module.PlanActAgent("s", sandbox_url="http://sandbox")
+        agent.emit = lambda event: None
+        with patch.object(agent_module, "sandbox_http", http), patch.object(agent_module, "sandbox_manager"):
+            await agent.call_tool("session_exec", {"command": "cd /tmp && export STEP=one"})
+            result = await agent.call_tool("session_exec", {"command": "echo $PWD $STEP"})
+            assert result["output"] == "/tmp one\n"
+            first = agent.shell_session
+
+            # Reaped in the sandbox (e.g. idle): a fresh session is opened and the command still runs
+            await sandbox.shell_sessions.close(first)
+            result = await agent.call_tool("session_exec", {"command": "echo ${STEP:-fresh}"})
+            assert result["output"] == "fresh\n" and agent.shell_session != first
+        await sandbox.shell_sessions.shutdown()
+        await http.aclose()
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    test_session_exec_steps_share_a_shell_and_reopen_it_when_gone()
+    print("Tests passed successfully!")
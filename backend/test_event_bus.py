@@ -0,0 +1,72 @@
+import asyncio
+import tempfile
+from backend.event_bus import EventBus
+from backend.session_manager import SessionManager
+
+async def collect(stream, n):
+    items = []
+    async for item in stream:
+        items.append(item)
+        if len(items) == n:
+            break
+    await stream.aclose()
+    return items
+
+def test_every_subscriber_gets_every_event_and_history_is_replayed():
+    async def run(log):
+        bus = EventBus(log=log)
+
+        def publish(n):
+            bus.publish("s", {"n": n}, log.save_event("s", {"n": n}))
+
+        publish(0)
+        first = asyncio.create_task(collect(bus.subscribe("s"), 3))
+        second = asyncio.create_task(collect(bus.subscribe("s", last_event_id=0), 2))
+        await asyncio.sleep(0.01)
+        assert bus.subscriber_count("s") == 2
+        publish(1)
+        publish(2)
+        assert [n for n, _ in await first] == [0, 1, 2]
+        assert [e["n"] for _, e in await second] == [1, 2]
+        assert bus.subscriber_count() == 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(SessionManager(storage_dir=tmp)))
+
+def test_slow_subscriber_catches_up_from_the_log():
+    async def run(log):
+        bus = EventBus(buffer_size=4, log=log)
+        stream = bus.subscribe("s")
+        received = []
+
+        async def consume():
+            async for event_id, event in stream:
+                received.append(event_id)
+                if event_id == 49:
+                    return
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        for n in range(50):
+            bus.publish("s", {"n": n}, log.save_event("s", {"n": n}))
+        await asyncio.wait_for(task, 1)
+        assert received == list(range(50))
+        assert all(s.queue.qsize() <= 5 for s in bus.topics.get("s", ()))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(SessionManager(storage_dir=tmp)))
+
+def test_keep_alive_ping():
+    async def run(log):
+        bus = EventBus(ping_interval=0.01, log=log)
+        chunks = await collect(bus.sse("s"), 1)
+        assert chunks == [": ping\n\n"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(SessionManager(storage_dir=tmp)))
+
+if __name__ == "__main__":
+    test_every_subscriber_gets_every_event_and_history_is_replayed()
+    test_slow_subscriber_catches_up_from_the_log()
+    test_keep_alive_ping()
+    print("Tests passed successfully!")
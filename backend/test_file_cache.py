@@ -0,0 +1,77 @@
+import asyncio
+import os
+import tempfile
+from unittest.mock import patch
+import httpx
+from backend.benchmarks.standin import load_sandbox_api
+from backend.file_cache import FileCache, line_edits, split_lines
+from backend.http_client import SandboxHTTPClient
+
+with patch("docker.from_env"):
+    import backend.agent as agent_module
+
+class RecordingTransport(httpx.ASGITransport):
+    def __init__(self, app):
+        super().__init__(app=app)
+        self.sent = []
+
+    async def handle_async_request(self, request):
+        response = await super().handle_async_request(request)
+        self.sent.append((request.url.path, len(request.content), response.status_code))
+        return response
+
+def test_cache_is_bounded_and_edits_rebuild_the_new_text():
+    cache = FileCache(max_bytes=10)
+    cache.put("a", "h1", "12345")
+    cache.put("b", "h2", "123456")
+    assert cache.get("a") is None and cache.get("b") == ("h2", "123456") and cache.size == 6
+    # Form feeds, "\r" and Unicode separators are not line breaks for the sandbox either
+    for old, new in [("a\nb\nc\nd\n", "a\nB\nc\nd\ne\n"), ("a\x0cb\r\nc\u2028d\ne", "a\x0cb\r\nC\u2028d\ne\n")]:
+        lines = split_lines(old)
+        assert "".join(lines) == old and len(lines) == old.count("\n") + (not old.endswith("\n"))
+        for edit in reversed(line_edits(old, new)):
+            lines[edit["start"]:edit["end"]] = edit["lines"]
+        assert "".join(lines) == new
+
+def test_agent_revalidates_reads_and_sends_deltas_for_edits():
+    sandbox = load_sandbox_api()
+
+    async def run(path):
+        http = SandboxHTTPClient(retries=0)
+        transport = http.get_client("http://sandbox")._transport = RecordingTransport(sandbox.app)
+        agent = agent_module.PlanActAgent("s", sandbox_url="http://sandbox")
+        agent.emit = lambda event: None
+        with patch.object(agent_module, "sandbox_http", http), patch.object(agent_module, "sandbox_manager"):
+            text = "".join(f"def f{i}():\n    return {i}\n" for i in range(500))
+            with open(path, "w") as f:
+                f.write(text)
+            first = await agent.call_tool("read_file", {"path": path})
+            second = await agent.call_tool("read_file", {"path": path})
+            assert first["content"] == second["content"] == text and second["cached"]
+
+            edited = text.replace("return 250\n", "return 'two hundred fifty'\n")
+            result = await agent.call_tool("write_file", {"path": path, "content": edited})
+            with open(path) as f:
+                assert f.read() == edited and result["sha256"] == agent.files.get(path)[0]
+
+            # Changed behind the agent's back: the delta is refused and the full text is written
+            with open(path, "a") as f:
+                f.write("# appended by a command\n")
+            final = edited.replace("return 7\n", "return 'seven'\n")
+            await agent.call_tool("write_file", {"path": path, "content": final})
+            with open(path) as f:
+                assert f.read() == final
+        await http.aclose()
+        return transport.sent, len(text)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sent, size = asyncio.run(run(os.path.join(tmp, "big.py")))
+    assert [(p, status) for p, _, status in sent] == [
+        ("/files/read", 200), ("/files/read", 304),
+        ("/files/patch", 200), ("/files/patch", 412), ("/files/write", 200)]
+    assert sent[2][1] < size // 20
+
+if __name__ == "__main__":
+    test_cache_is_bounded_and_edits_rebuild_the_new_text()
+    test_agent_revalidates_reads_and_sends_deltas_for_edits()
+    print("Tests passed successfully!")
@@ -0,0 +1,49 @@
+import asyncio
+import httpx
+from backend.http_client import SandboxHTTPClient
+
+def test_clients_are_shared_per_sandbox_and_retry_connect_errors():
+    attempts = []
+
+    def handler(request):
+        attempts.append(request.url.path)
+        if len(attempts) < 3:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, json={"status": "ok"})
+
+    async def run():
+        http = SandboxHTTPClient(retries=3, backoff=0)
+        client = http.get_client("http://sandbox-a")
+        client._transport = httpx.MockTransport(handler)
+        assert http.get_client("http://sandbox-a") is client
+        assert http.get_client("http://sandbox-b") is not client
+
+        response = await http.request("http://sandbox-a", "GET", "/health")
+        assert response.json() == {"status": "ok"}
+        assert attempts == ["/health"] * 3
+
+        # Streamed responses are handed over unread
+        chunks = [b"a" * 1000] * 5
+
+        async def body():
+            for chunk in chunks:
+                yield chunk
+        client._transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+        response = await http.request("http://sandbox-a", "GET", "/blobs/x", stream=True)
+        assert not response.is_stream_consumed
+        assert b"".join([chunk async for chunk in response.aiter_bytes()]) == b"".join(chunks)
+        await response.aclose()
+
+        await http.aclose()
+        assert client.is_closed and not http.clients
+
+    asyncio.run(run())
+
+def test_execute_command_timeout_covers_command_timeout():
+    http = SandboxHTTPClient()
+    assert http.timeout_for("execute_command", {"timeout": 100}).read > 100
+
+if __name__ == "__main__":
+    test_clients_are_shared_per_sandbox_and_retry_connect_errors()
+    test_execute_command_timeout_covers_command_timeout()
+    print("Tests passed successfully!")
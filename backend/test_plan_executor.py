@@ -0,0 +1,81 @@
+import asyncio
+from unittest.mock import patch
+from backend.plan_executor import PlanError, PlanExecutor, validate
+
+with patch("docker.from_env"):
+    import backend.agent as agent_module
+
+def make_tool(log, delays=None, fail=()):
+    async def call_tool(tool, params):
+        log.append(("start", params["name"]))
+        await asyncio.sleep((delays or {}).get(params["name"], 0.05))
+        log.append(("end", params["name"]))
+        if params["name"] in fail:
+            return {"status": "error", "detail": "boom"}
+        return {"name": params["name"]}
+    return call_tool
+
+def step(step_id, depends_on=()):
+    return {"id": step_id, "tool": "t", "params": {"name": step_id}, "depends_on": list(depends_on)}
+
+def test_independent_steps_run_in_parallel_within_the_limit():
+    async def run():
+        log, events = [], []
+        executor = PlanExecutor(make_tool(log), events.append, max_concurrency=2)
+        results = await executor.run([step("a"), step("b"), step("c"), step("d", ["a", "b"])])
+        return log, events, results
+
+    log, events, results = asyncio.run(run())
+    assert [r["status"] for r in results] == ["success"] * 4
+    assert log[:2] == [("start", "a"), ("start", "b")]
+    assert log.index(("start", "c")) > log.index(("end", "a"))
+    assert log.index(("start", "d")) > max(log.index(("end", "a")), log.index(("end", "b")))
+    types = [e["type"] for e in events]
+    assert types[0] == "plan_started" and types[-1] == "plan_finished"
+    assert types.count("step_started") == 4 and events[-1]["status"] == "completed"
+    assert all("duration_ms" in e for e in events if e["type"] == "step_finished")
+
+def test_failed_steps_skip_dependents_and_cycles_are_rejected():
+    async def run():
+        events = []
+        executor = PlanExecutor(make_tool([], fail={"a"}), events.append)
+        return events, await executor.run([step("b", ["a"]), step("a"), step("c")])
+
+    events, results = asyncio.run(run())
+    assert [r["status"] for r in results] == ["skipped", "error", "success"]
+    assert results[0]["blocked_by"] == ["a"] and events[-1]["status"] == "failed"
+    for bad in ([step("a", ["b"]), step("b", ["a"])], [step("a"), step("a")], [step("a", ["x"])]):
+        try:
+            validate(bad)
+            assert False, "expected PlanError"
+        except PlanError:
+            pass
+
+def test_messages_are_processed_in_order_and_stop_cancels_the_plan():
+    async def run():
+        log, events = [], []
+        agent = agent_module.PlanActAgent("s", sandbox_url="http://sandbox")
+        agent.emit = events.append
+        agent.executor = PlanExecutor(make_tool(log, delays={"slow": 10}), agent.emit)
+        agent.plan = lambda message: [step(message)]
+        agent.enqueue("first")
+        agent.enqueue("second")
+        await asyncio.sleep(0.2)
+        assert log == [("start", "first"), ("end", "first"), ("start", "second"), ("end", "second")]
+
+        agent.enqueue("slow")
+        agent.enqueue("never")
+        await asyncio.sleep(0.05)
+        await agent.cancel()
+        return log, events
+
+    log, events = asyncio.run(run())
+    assert ("start", "never") not in log and ("end", "slow") not in log
+    assert (events[-1]["type"], events[-1]["status"]) == ("plan_finished", "cancelled")
+    assert (events[-2]["type"], events[-2]["step"], events[-2]["status"]) == ("step_finished", "slow", "cancelled")
+
+if __name__ == "__main__":
+    test_independent_steps_run_in_parallel_within_the_limit()
+    test_failed_steps_skip_dependents_and_cycles_are_rejected()
+    test_messages_are_processed_in_order_and_stop_cancels_the_plan()
+    print("Tests passed successfully!")
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import threading
+from backend.port_allocator import PortAllocator, PortsExhausted
+
+def test_blocks_are_contiguous_unique_and_reused():
+    allocator = PortAllocator(base_port=30000, max_blocks=3)
+    a = allocator.allocate("a")
+    assert a == {"api": 30000, "vnc": 30001, "novnc": 30002, "cdp": 30003}
+    assert allocator.allocate("a") == a
+    b = allocator.allocate("b")
+    c = allocator.allocate("c")
+    assert len({a["api"], b["api"], c["api"]}) == 3
+    try:
+        allocator.allocate("d")
+        assert False, "expected PortsExhausted"
+    except PortsExhausted:
+        pass
+    assert allocator.release("b")
+    assert not allocator.release("b")
+    assert allocator.allocate("d") == b
+
+def test_concurrent_allocation_never_hands_out_a_port_twice():
+    allocator = PortAllocator(max_blocks=1000)
+    results = {}
+
+    def worker(i):
+        for j in range(50):
+            results[(i, j)] = allocator.allocate(f"{i}-{j}")["api"]
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(set(results.values())) == 1000
+
+def test_leases_survive_a_restart():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ports.json")
+        allocator = PortAllocator(max_blocks=4, state_path=path)
+        first = allocator.allocate("sandbox-a")
+        allocator.allocate("warm")
+        allocator.rename("warm", "sandbox-b")
+
+        restored = PortAllocator(max_blocks=4, state_path=path)
+        assert restored.get("sandbox-a") == first
+        assert restored.get("sandbox-b") is not None
+        assert restored.allocate("sandbox-c")["api"] not in (first["api"], restored.get("sandbox-b")["api"])
+
+if __name__ == "__main__":
+    test_blocks_are_contiguous_unique_and_reused()
+    test_concurrent_allocation_never_hands_out_a_port_twice()
+    test_leases_survive_a_restart()
+    print("Tests passed successfully!")
@@ -0,0 +1,113 @@
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+from backend.sandbox_hosts import HostScheduler, NoHostAvailable, SandboxHost, parse_hosts
+from backend.sandbox_pool import WarmSandbox
+
+with patch("docker.from_env"):
+    from backend.sandbox_manager import SandboxManager
+
+def fake_client():
+    client = MagicMock()
+    def run(image, name, **kwargs):
+        container = MagicMock(id=f"id-{name}", status="running")
+        container.name = name
+        return container
+    client.containers.run.side_effect = run
+    return client
+
+def make_manager(tmp, clients):
+    spec = ",".join(f"tcp://{address}:2375#2" for address in clients)
+    with patch.dict(os.environ, {"SANDBOX_HOSTS": spec}), \
+            patch("docker.DockerClient", side_effect=lambda base_url: clients[base_url[6:-5]]):
+        return SandboxManager(state_dir=tmp)
+
+def test_parse_hosts():
+    hosts = parse_hosts("tcp://10.0.0.2:2375#20, unix:///var/run/docker.sock,ssh://ops@box", client_factory=MagicMock())
+    assert [(h.address, h.max_active) for h in hosts] == [("10.0.0.2", 20), ("localhost", 0), ("box", 0)]
+
+def test_least_loaded_placement_respects_capacity():
+    scheduler = HostScheduler([SandboxHost("a", None, max_active=1), SandboxHost("b", None, max_active=3)])
+    assert scheduler.place("s1").name == "a"
+    assert [scheduler.place(f"s{i}").name for i in (2, 3, 4)] == ["b", "b", "b"]
+    assert scheduler.capacity() == 4
+    try:
+        scheduler.place("s5")
+        assert False, "expected NoHostAvailable"
+    except NoHostAvailable:
+        pass
+    scheduler.release("s1")
+    scheduler.rename("s2", "renamed")
+    assert scheduler.place("s5").name == "a"
+    assert scheduler.get("renamed").name == "b"
+
+def test_memory_capacity_is_probed_outside_placement():
+    client = MagicMock()
+    client.info.return_value = {"MemTotal": 4 << 30}
+    host = SandboxHost("local", client)
+    scheduler = HostScheduler([host], mem_limit_bytes=1 << 30)
+    assert host.local and scheduler.capacity() is None and not client.info.called
+    scheduler.probe()
+    assert scheduler.capacity() == 4 and scheduler.metrics()[0]["capacity"] == 4
+    scheduler.place("s1")
+    assert client.info.call_count == 1
+
+def test_sandboxes_spread_across_hosts_and_route_to_them():
+    with tempfile.TemporaryDirectory() as tmp:
+        clients = {"10.0.0.1": fake_client(), "10.0.0.2": fake_client()}
+        manager = make_manager(tmp, clients)
+        infos = [manager.create_sandbox(f"s{i}")[1] for i in range(4)]
+
+        assert manager.capacity() == 4
+        assert sorted(info["host"] for info in infos) == ["tcp://10.0.0.1:2375"] * 2 + ["tcp://10.0.0.2:2375"] * 2
+        assert all(client.containers.run.call_count == 2 for client in clients.values())
+        # Remote engines don't share this machine's filesystem, so nothing is bind-mounted
+        assert all(client.containers.run.call_args.kwargs["volumes"] == {} for client in clients.values())
+        for info in infos:
+            assert info["url"] == f"http://{info['host'][6:-5]}:{info['ports']['api']}"
+
+        # Checkpoints resume on the engine that holds the image
+        manager.checkpoint("s3")
+        manager.stop_sandbox("s3")
+        assert manager.create_sandbox("s3")[1]["host"] == infos[3]["host"]
+
+        # After a restart every host is listed and sessions keep their host
+        manager.close()
+        for address, client in clients.items():
+            client.containers.list.return_value = [
+                MagicMock(id=f"id-sandbox-{sid}", status="running")
+                for sid, info in zip(("s0", "s1", "s2", "s3"), infos) if info["host"][6:-5] == address
+            ]
+        restarted = make_manager(tmp, clients)
+        result = restarted.recover()
+        assert result["restored"] == 4 and not result["orphans"]
+        assert {sid: info["host"] for sid, info in restarted.sandboxes.items()} == \
+            {f"s{i}": info["host"] for i, info in enumerate(infos)}
+        assert sorted(h["load"] for h in restarted.scheduler.metrics()) == [2, 2]
+        restarted.close()
+
+def test_admission_counts_warm_pool_containers():
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = make_manager(tmp, {"10.0.0.1": fake_client()})
+        # Two slots, both held by the warm pool
+        for name in ("sandbox-warm-a", "sandbox-warm-b"):
+            container, ports = manager._start_container(name)
+            manager.pool.idle.append(WarmSandbox(name, container, ports))
+        assert manager.has_room() and not manager.room_for_warm()
+
+        # A checkpoint resume cannot use a warm container; an idle one makes room
+        manager.registry.put_checkpoint("resumed", "sheikh-ai-checkpoint:resumed")
+        manager.reserve("resumed")
+        manager.create_sandbox("resumed")
+        assert manager.pool.idle_count() == 1 and manager.scheduler.total() == 2 and not manager.reserved
+        manager.reserve("next")
+        assert not manager.has_room()
+        manager.close()
+
+if __name__ == "__main__":
+    test_parse_hosts()
+    test_least_loaded_placement_respects_capacity()
+    test_memory_capacity_is_probed_outside_placement()
+    test_sandboxes_spread_across_hosts_and_route_to_them()
+    test_admission_counts_warm_pool_containers()
+    print("Tests passed successfully!")
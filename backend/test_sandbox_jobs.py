@@ -0,0 +1,148 @@
+import asyncio
+import tempfile
+import time
+from unittest.mock import patch
+from backend.event_bus import EventBus
+from backend.session_manager import SessionManager
+
+# Importing the job layer builds the global SandboxManager, which needs a Docker client
+with patch("docker.from_env"):
+    from backend.sandbox_jobs import AdmissionRejected, SandboxJobs, SandboxFailed
+
+class SlowManager:
+    def __init__(self, delay=0.2, fail=False, max_active=None):
+        self.delay = delay
+        self.fail = fail
+        self.max_active = max_active
+        self.sandboxes = {}
+        self.reserved = set()
+        self.checkpoints = []
+        self.idle = []
+        self.calls = []
+
+    def create_sandbox(self, session_id):
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("image not found")
+        self.sandboxes[session_id] = {"ports": {"api": 20000}}
+        return session_id, self.sandboxes[session_id]
+
+    def stop_sandbox(self, session_id):
+        time.sleep(self.delay)
+        self.calls.append(("stop", session_id))
+        self.sandboxes.pop(session_id, None)
+
+    def get_sandbox(self, session_id):
+        return self.sandboxes.get(session_id)
+
+    def has_room(self):
+        return self.max_active is None or len(self.sandboxes) + len(self.reserved) < self.max_active
+
+    def reserve(self, session_id):
+        self.reserved.add(session_id)
+
+    def unreserve(self, session_id):
+        self.reserved.discard(session_id)
+
+    def checkpoint(self, session_id):
+        self.checkpoints.append(session_id)
+
+    def discard_checkpoint(self, session_id):
+        self.calls.append(("discard", session_id))
+
+    def idle_sessions(self, ttl):
+        return self.idle
+
+def test_create_does_not_block_and_reports_readiness():
+    async def run(log):
+        manager = SlowManager()
+        jobs = SandboxJobs(manager, EventBus(log=log))
+        start = time.perf_counter()
+        session_id = jobs.create("s1")
+        assert jobs.status(session_id)["status"] == "provisioning"
+        await asyncio.sleep(0.01)
+        assert time.perf_counter() - start < 0.1
+
+        info = await jobs.wait_ready(session_id)
+        assert info["ports"]["api"] == 20000
+        assert jobs.status(session_id)["status"] == "running"
+        assert [e["status"] for e in log.get_events(session_id)] == ["provisioning", "running"]
+
+        for i in range(8):
+            manager.sandboxes[f"bulk-{i}"] = {"ports": {}}
+        start = time.perf_counter()
+        await jobs.stop_many([f"bulk-{i}" for i in range(8)])
+        assert time.perf_counter() - start < 0.2 * 4
+        assert not any(key.startswith("bulk") for key in manager.sandboxes)
+        await jobs.shutdown()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(SessionManager(storage_dir=tmp)))
+
+def test_failed_provisioning_is_reported():
+    async def run(log):
+        jobs = SandboxJobs(SlowManager(delay=0, fail=True), EventBus(log=log))
+        session_id = jobs.create()
+        try:
+            await jobs.wait_ready(session_id)
+            assert False, "expected SandboxFailed"
+        except SandboxFailed:
+            pass
+        assert jobs.status(session_id)["error"] == "image not found"
+        assert log.get_events(session_id)[-1] == {"type": "sandbox_status", "status": "failed", "error": "image not found"}
+
+        # Failed jobs are kept for failed_retention, then dropped
+        jobs.failed_retention = 0
+        jobs.create()
+        assert jobs.status(session_id) is None and len(jobs.jobs) == 1
+        await jobs.shutdown()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(SessionManager(storage_dir=tmp)))
+
+def test_admission_queues_then_rejects_when_at_capacity():
+    async def run(log):
+        manager = SlowManager(delay=0.05, max_active=1)
+        jobs = SandboxJobs(manager, EventBus(log=log), queue_max=1)
+        first = jobs.create("first")
+        second = jobs.create("second")
+        assert jobs.status(second)["status"] == "queued"
+        try:
+            jobs.create("third")
+            assert False, "expected AdmissionRejected"
+        except AdmissionRejected:
+            pass
+
+        await jobs.wait_ready(first)
+        assert jobs.status(second)["status"] == "queued"
+        await jobs.stop(first)
+        # The checkpoint image can only be removed once no container uses it
+        assert manager.calls == [("stop", "first"), ("discard", "first")]
+        await jobs.wait_ready(second)
+        assert list(manager.sandboxes) == ["second"]
+        assert [e["status"] for e in log.get_events(second)] == ["queued", "provisioning", "running"]
+        await jobs.shutdown()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(SessionManager(storage_dir=tmp)))
+
+def test_idle_sandboxes_are_checkpointed_and_stopped():
+    async def run(log):
+        manager = SlowManager(delay=0)
+        jobs = SandboxJobs(manager, EventBus(log=log))
+        await jobs.wait_ready(jobs.create("idle"))
+        manager.idle = ["idle"]
+        assert await jobs.reap_idle(60, checkpoint=True) == ["idle"]
+        assert manager.checkpoints == ["idle"] and not manager.sandboxes
+        assert log.get_events("idle")[-1]["reason"] == "idle"
+        await jobs.shutdown()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(run(SessionManager(storage_dir=tmp)))
+
+if __name__ == "__main__":
+    test_create_does_not_block_and_reports_readiness()
+    test_failed_provisioning_is_reported()
+    test_admission_queues_then_rejects_when_at_capacity()
+    test_idle_sandboxes_are_checkpointed_and_stopped()
+    print("Tests passed successfully!")
@@ -0,0 +1,76 @@
+import time
+from unittest.mock import MagicMock, patch
+from backend.sandbox_pool import SandboxPool
+
+class FakeManager:
+    def __init__(self):
+        self.started = 0
+        self.removed = []
+
+    def _start_container(self, name):
+        self.started += 1
+        return MagicMock(name=name), {"api": 18000 + self.started}
+
+    def _remove_container(self, container, name):
+        self.removed.append(container)
+
+    def room_for_warm(self):
+        return True
+
+    def api_url(self, name, ports):
+        return f"http://localhost:{ports['api']}"
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+@patch.object(SandboxPool, "_healthy", return_value=True)
+def test_pool_hands_out_warm_sandboxes_and_refills(_healthy):
+    manager = FakeManager()
+    pool = SandboxPool(manager, min_size=2, max_size=3, interval=0.05)
+    pool.start()
+    try:
+        assert wait_for(lambda: pool.metrics()["idle"] == 2)
+        assert pool.acquire() is not None
+        assert wait_for(lambda: pool.metrics()["idle"] == 2)
+        assert pool.metrics()["hits"] == 1
+        assert pool.metrics()["started"] == 3
+    finally:
+        pool.stop()
+    assert len(manager.removed) == 2
+
+@patch.object(SandboxPool, "_healthy", return_value=True)
+def test_pool_grows_on_miss_and_reaps_idle(_healthy):
+    manager = FakeManager()
+    pool = SandboxPool(manager, min_size=0, max_size=2, idle_ttl=0.2, interval=0.05)
+    pool.start()
+    try:
+        assert pool.acquire() is None
+        assert pool.metrics()["misses"] == 1
+        assert wait_for(lambda: pool.metrics()["idle"] == 1)
+        assert wait_for(lambda: pool.metrics()["reaped"] == 1)
+        assert pool.metrics()["idle"] == 0
+    finally:
+        pool.stop()
+
+def test_unhealthy_warm_sandbox_is_discarded():
+    manager = FakeManager()
+    pool = SandboxPool(manager, min_size=1, max_size=1, interval=0.05)
+    with patch.object(SandboxPool, "_healthy", return_value=True):
+        pool.start()
+        assert wait_for(lambda: pool.metrics()["idle"] == 1)
+    with patch.object(SandboxPool, "_healthy", return_value=False):
+        pool.stop()
+        pool.idle.append(MagicMock(ports={"api": 1}))
+        assert pool.acquire() is None
+    assert pool.metrics()["failed"] == 1
+
+if __name__ == "__main__":
+    test_pool_hands_out_warm_sandboxes_and_refills()
+    test_pool_grows_on_miss_and_reaps_idle()
+    test_unhealthy_warm_sandbox_is_discarded()
+    print("Tests passed successfully!")
@@ -0,0 +1,60 @@
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+
+with patch("docker.from_env"):
+    from backend.sandbox_manager import LazySandboxManager, SandboxManager
+
+def make_manager(tmp, client):
+    with patch("docker.from_env", return_value=client):
+        return SandboxManager(state_dir=tmp)
+
+def fake_container(container_id, name, status="running"):
+    container = MagicMock(id=container_id, status=status)
+    container.name = name
+    return container
+
+def test_restart_restores_running_sandboxes_from_one_docker_ps():
+    with tempfile.TemporaryDirectory() as tmp:
+        client = MagicMock()
+        client.containers.run.side_effect = lambda image, name, **kwargs: fake_container(f"id-{name}", name)
+        manager = make_manager(tmp, client)
+        for session_id in ("alive", "exited", "gone"):
+            manager.create_sandbox(session_id)
+        manager.ports.allocate("sandbox-warm-leaked")
+        ports = manager.sandboxes["alive"]["ports"]
+        manager.close()
+
+        # Server restarts: one container still runs, one exited, one vanished, one was never registered
+        client.containers.list.return_value = [
+            fake_container("id-sandbox-alive", "sandbox-alive"),
+            fake_container("id-sandbox-exited", "sandbox-exited", status="exited"),
+            fake_container("id-orphan", "sandbox-warm-1234"),
+        ]
+        restarted = make_manager(tmp, client)
+        result = restarted.recover()
+
+        client.containers.list.assert_called_once_with(all=True, filters={"label": "sheikh-ai.sandbox"})
+        assert list(restarted.sandboxes) == ["alive"]
+        assert restarted.sandboxes["alive"]["ports"] == ports
+        assert result["restored"] == 1 and result["dropped"] == 2
+        assert sorted(c.name for c in result["orphans"]) == ["sandbox-exited", "sandbox-warm-1234"]
+        assert [e["session_id"] for e in restarted.registry.all()] == ["alive"]
+        assert set(restarted.ports.leases) == {"sandbox-alive"}
+
+        restarted.stop_sandbox("alive")
+        assert restarted.registry.all() == []
+        restarted.close()
+        assert restarted.ports._journal is None
+
+def test_process_wide_manager_is_built_on_first_use():
+    built = []
+    manager = LazySandboxManager(lambda: built.append(1) or MagicMock(sandboxes={}))
+    assert not built
+    assert manager.sandboxes == {} and manager.sandboxes == {}
+    assert built == [1]
+
+if __name__ == "__main__":
+    test_restart_restores_running_sandboxes_from_one_docker_ps()
+    test_process_wide_manager_is_built_on_first_use()
+    print("Tests passed successfully!")
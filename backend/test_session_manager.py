@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+from backend.event_log import EventLog
+from backend.session_manager import SessionManager
+
+def test_append_and_read_ranges():
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = SessionManager(storage_dir=tmp)
+        for i in range(500):
+            assert manager.save_event("s1", {"type": "agent_log", "n": i}) == i
+
+        assert [e["n"] for e in manager.get_events("s1")] == list(range(500))
+        assert [e["n"] for e in manager.get_events("s1", 130, 140)] == list(range(130, 140))
+        assert [e["n"] for e in manager.tail_events("s1", 3)] == [497, 498, 499]
+        manager.close()
+
+        # Reopening rebuilds the index from the segments on disk
+        manager = SessionManager(storage_dir=tmp)
+        assert manager.save_event("s1", {"n": 500}) == 500
+        assert manager.get_events("s1", 499)[0]["n"] == 499
+        manager.close()
+
+def test_segments_roll_and_compact():
+    with tempfile.TemporaryDirectory() as tmp:
+        log = EventLog(tmp, segment_max_bytes=256, compact_max_bytes=2048, compact_threshold=4, index_interval=4)
+        for i in range(300):
+            log.append({"n": i})
+        assert len(os.listdir(tmp)) <= 8
+        assert [e["n"] for e in log.read()] == list(range(300))
+        assert [e["n"] for e in log.read(217, 223)] == list(range(217, 223))
+        log.close()
+
+        log = EventLog(tmp, segment_max_bytes=256, index_interval=4)
+        assert len(log) == 300
+        assert [e["n"] for e in log.read(0, 5)] == list(range(5))
+        log.close()
+
+def test_reads_at_or_past_the_end_are_empty():
+    with tempfile.TemporaryDirectory() as tmp:
+        log = EventLog(tmp)
+        for i in range(64):
+            log.append({"n": i})
+        # 64 events end exactly on an index boundary
+        assert log.read(64) == [] and log.read(100) == [] and log.tail(0) == []
+        assert log.read(63) == [{"n": 63}]
+        log.close()
+
+def test_open_logs_are_bounded_and_released():
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = SessionManager(storage_dir=tmp, max_open_logs=2)
+        for session_id in ("a", "b", "c"):
+            manager.save_event(session_id, {"s": session_id})
+        assert list(manager.logs) == ["b", "c"]
+        # An evicted log reopens from disk
+        assert manager.save_event("a", {"s": "a"}) == 1
+        assert list(manager.logs) == ["c", "a"]
+        manager.release("a")
+        assert list(manager.logs) == ["c"] and len(manager.get_events("a")) == 2
+        manager.close()
+
+def test_torn_write_is_discarded():
+    with tempfile.TemporaryDirectory() as tmp:
+        log = EventLog(tmp)
+        log.append({"n": 0})
+        log.append({"n": 1})
+        log.close()
+        path = os.path.join(tmp, sorted(os.listdir(tmp))[-1])
+        with open(path, "ab") as f:
+            f.write(b'{"n": 2, "trunc')
+
+        log = EventLog(tmp)
+        assert [e["n"] for e in log.read()] == [0, 1]
+        log.append({"n": 2})
+        assert [e["n"] for e in log.read()] == [0, 1, 2]
+        log.close()
+
+def test_legacy_json_sessions_are_migrated():
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "old.json"), "w") as f:
+            json.dump([{"n": 0}, {"n": 1}], f)
+        manager = SessionManager(storage_dir=tmp)
+        assert manager.get_events("old") == [{"n": 0}, {"n": 1}]
+        assert not os.path.exists(os.path.join(tmp, "old.json"))
+        manager.close()
+
+def test_interrupted_legacy_migration_resumes():
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "old.json"), "w") as f:
+            json.dump([{"n": 0}, {"n": 1}, {"n": 2}], f)
+        # A crash after the first event was copied
+        log = EventLog(os.path.join(tmp, "old"))
+        log.append({"n": 0})
+        log.close()
+        manager = SessionManager(storage_dir=tmp)
+        assert manager.get_events("old") == [{"n": 0}, {"n": 1}, {"n": 2}]
+        assert not os.path.exists(os.path.join(tmp, "old.json"))
+        manager.close()
+
+if __name__ == "__main__":
+    test_append_and_read_ranges()
+    test_segments_roll_and_compact()
+    test_reads_at_or_past_the_end_are_empty()
+    test_open_logs_are_bounded_and_released()
+    test_torn_write_is_discarded()
+    test_legacy_json_sessions_are_migrated()
+    test_interrupted_legacy_migration_resumes()
+    print("Tests passed successfully!")
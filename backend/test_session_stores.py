@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+import pytest
+from backend.event_bus import EventBus
+from backend.session_manager import SessionManager
+from backend.session_stores import MongoSessionStore, RedisSessionStore
+
+fakeredis = pytest.importorskip("fakeredis")
+mongomock = pytest.importorskip("mongomock")
+
+def redis_store():
+    return RedisSessionStore(fakeredis.FakeRedis())
+
+def mongo_store():
+    return MongoSessionStore(mongomock.MongoClient()["sheikh_ai"]["session_events"])
+
+class FlakyStore:
+    """Wraps a store; fails writes while `down` is set and counts batches."""
+
+    def __init__(self, store):
+        self.store = store
+        self.down = threading.Event()
+        self.batches = []
+
+    def count(self, session_id):
+        return self.store.count(session_id)
+
+    def write(self, batch):
+        if self.down.is_set():
+            raise ConnectionError("store unavailable")
+        self.batches.append(len(batch))
+        self.store.write(batch)
+
+    def read(self, session_id, start, end=None):
+        return self.store.read(session_id, start, end)
+
+    def close(self):
+        pass
+
+@pytest.mark.parametrize("make_store", [redis_store, mongo_store])
+def test_events_are_batched_readable_before_flush_and_survive_restart(make_store):
+    store = FlakyStore(make_store())
+    # Set before the flush thread starts waiting, so everything stays pending
+    manager = SessionManager(db_type="store", store=store, flush_interval=60)
+    for i in range(50):
+        assert manager.save_event("s1", {"n": i}) == i
+    manager.save_event("s2", {"n": 0})
+    # Reads see pending events before they reach the store
+    assert [e["n"] for e in manager.get_events("s1", 10, 13)] == [10, 11, 12]
+    manager.buffer.flush()
+    assert store.batches == [51]
+    assert [e["n"] for e in manager.tail_events("s1", 3)] == [47, 48, 49]
+
+    # A released session keeps its count while events are pending, and recounts from the store after
+    manager.save_event("s1", {"n": 50})
+    manager.release("s1")
+    assert manager.counts["s1"] == 51
+    manager.buffer.flush()
+    manager.release("s1")
+    assert "s1" not in manager.counts and not manager.loaded("s1")
+    manager.close()  # flushes what is left
+
+    restarted = SessionManager(db_type="store", store=store)
+    assert restarted.save_event("s1", {"n": 51}) == 51
+    assert [e["n"] for e in restarted.get_events("s1")] == list(range(52))
+    restarted.close()
+
+def test_full_buffer_applies_backpressure_and_retries_after_store_errors():
+    store = FlakyStore(redis_store())
+    manager = SessionManager(db_type="store", store=store, flush_interval=0.01, max_pending=5)
+    store.down.set()
+    # Saving never writes to the store itself, so an outage does not reach the caller
+    for i in range(6):
+        manager.save_event("s", {"n": i})
+    time.sleep(0.05)
+    assert manager.buffer.full() and manager.buffer.stats["errors"] > 0
+
+    async def produce():
+        draining = asyncio.create_task(manager.drain())
+        await asyncio.sleep(0.05)
+        assert not draining.done()
+        store.down.clear()
+        await asyncio.wait_for(draining, 5)
+    asyncio.run(produce())
+    assert [event["n"] for _, event in store.store.read("s", 0)] == list(range(6))
+    manager.close()
+
+def test_count_and_reads_happen_off_the_event_loop():
+    store = FlakyStore(redis_store())
+    store.store.write([("s", i, {"n": i}) for i in range(3)])
+    loop_thread = threading.get_ident()
+    calls = []
+    for name in ("count", "read"):
+        def spy(*args, _real=getattr(store, name), _name=name):
+            calls.append((_name, threading.get_ident() != loop_thread))
+            return _real(*args)
+        setattr(store, name, spy)
+    manager = SessionManager(db_type="store", store=store)
+    bus = EventBus(log=manager)
+
+    async def run():
+        await bus.prepare("s")
+        assert bus.emit("s", {"n": 3}) == 3
+        stream = bus.subscribe("s")
+        assert [(await stream.__anext__())[0] for _ in range(4)] == [0, 1, 2, 3]
+        await stream.aclose()
+    asyncio.run(run())
+    assert calls and all(off_loop for _, off_loop in calls)
+    manager.close()
+
+if __name__ == "__main__":
+    for make_store in (redis_store, mongo_store):
+        test_events_are_batched_readable_before_flush_and_survive_restart(make_store)
+    test_full_buffer_applies_backpressure_and_retries_after_store_errors()
+    test_count_and_reads_happen_off_the_event_loop()
+    print("Tests passed successfully!")
@@ -0,0 +1,43 @@
+import asyncio
+import tempfile
+from unittest.mock import patch
+import httpx
+from backend.sandbox_api.blobs import BlobStore, OutputPolicy, parse_ref
+
+with patch("docker.from_env"):
+    import backend.agent as agent_module
+
+class FakeHTTP:
+    def __init__(self, body):
+        self.body = body
+
+    async def request(self, base_url, method, path, tool_name=None, **kwargs):
+        return httpx.Response(200, json=self.body)
+
+def test_large_tool_results_are_logged_compacted_with_a_ref_to_the_full_output():
+    big = "x" * 5000
+
+    async def run(tmp):
+        events = []
+        agent = agent_module.PlanActAgent("s", sandbox_url="http://sandbox")
+        agent.emit = events.append
+        policy = OutputPolicy(BlobStore(tmp), limit=1000, head=100, tail=100)
+        with patch.object(agent_module, "output_policy", policy), patch.object(agent_module, "sandbox_manager"), \
+                patch.object(agent_module, "sandbox_http", FakeHTTP({"content": big, "size": 5000})):
+            result = await agent.call_tool("read_file", {"path": "big.txt"})
+        with patch.object(agent_module, "output_policy", policy), patch.object(agent_module, "sandbox_manager"), \
+                patch.object(agent_module, "sandbox_http", FakeHTTP({"content": "small"})):
+            small = await agent.call_tool("read_file", {"path": "small.txt"})
+        return policy, events, result, small
+
+    with tempfile.TemporaryDirectory() as tmp:
+        policy, events, result, small = asyncio.run(run(tmp))
+        logged, logged_small = [e["result"] for e in events if e["type"] == "tool_result"]
+        assert logged == result and len(logged["content"]) < 300 and logged["size"] == 5000
+        info = logged["spilled"]["content"]
+        assert info["size"] == 5000 and policy.store.get(parse_ref(info["ref"])).decode() == big
+        assert small == {"content": "small"} and logged_small == small
+
+if __name__ == "__main__":
+    test_large_tool_results_are_logged_compacted_with_a_ref_to_the_full_output()
+    print("Tests passed successfully!")